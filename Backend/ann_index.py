@@ -0,0 +1,138 @@
+"""
+ann_index.py – pluggable FAISS index types shared by the indexer and the backend
+
+Index types (all inner-product over L2-normalised vectors):
+    flat      exact brute force (IndexFlatIP)
+    ivf_flat  inverted lists, exact vectors        – build: nlist      search: nprobe
+    hnsw      graph                                – build: m, ef_construction   search: ef_search
+    ivf_pq    inverted lists, product-quantised    – build: nlist, pq_m, pq_bits   search: nprobe
+
+flat, ivf_flat and hnsw also take `storage`: fp32 (exact vectors), fp16 (half
+the memory, scores within ~1e-3) or sq8 (8-bit scalar quantiser, a quarter).
+
+The index file is written next to a `<index>.meta.json` sidecar describing the
+type and build parameters, so the backend knows which search knobs apply.
+
+An indexer run writes either one index over fused text+image product vectors
+(`products.index`) or one per modality, aligned on product ids
+(`products.text.index`, `products.image.index`, see modal_path()), which the
+backend searches separately and fuses at query time.
+"""
+
+import json, math, os
+from typing import Any, Dict
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+STORAGE_TYPES = ("fp32", "fp16", "sq8")
+MODALITIES = ("text", "image")
+
+DEFAULT_PARAMS: Dict[str, Dict[str, Any]] = {
+    "flat":     {"storage": "fp32"},
+    "ivf_flat": {"nlist": None, "storage": "fp32"},
+    "hnsw":     {"m": 32, "ef_construction": 200, "storage": "fp32"},
+    "ivf_pq":   {"nlist": None, "pq_m": 64, "pq_bits": 8},
+}
+
+_SQ_TYPES = {"fp16": "QT_fp16", "sq8": "QT_8bit"}
+
+# search-time defaults, overridable per request
+ANN_NPROBE    = int(os.environ.get("ANN_NPROBE", 16))
+ANN_EF_SEARCH = int(os.environ.get("ANN_EF_SEARCH", 64))
+
+
+def default_nlist(n: int) -> int:
+    """~4·sqrt(n) lists, at most n/39 so every list gets enough training points."""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39 or 1))
+
+
+def build_index(vecs: np.ndarray, kind: str = "flat", **params) -> faiss.Index:
+    """Build (and train, if needed) an index of `kind` over float32 unit vectors."""
+    n, d = vecs.shape
+    p = resolved_params(kind, n, **params)
+    ip = faiss.METRIC_INNER_PRODUCT
+    storage = p.get("storage", "fp32")
+    qtype = getattr(faiss.ScalarQuantizer, _SQ_TYPES[storage]) if storage != "fp32" else None
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(d) if qtype is None else faiss.IndexScalarQuantizer(d, qtype, ip)
+    elif kind == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(d, p["m"], ip)
+        else:
+            index = faiss.IndexHNSWSQ(d, qtype, p["m"], ip)
+        index.hnsw.efConstruction = p["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatIP(d)
+        if kind == "ivf_flat" and qtype is None:
+            index = faiss.IndexIVFFlat(quantizer, d, p["nlist"], ip)
+        elif kind == "ivf_flat":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, p["nlist"], qtype, ip)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, d, p["nlist"], p["pq_m"], p["pq_bits"], ip)
+    if not index.is_trained:
+        index.train(vecs)   # IVF centroids / scalar-quantiser ranges
+    return index
+
+
+def resolved_params(kind: str, n: int, **params) -> Dict[str, Any]:
+    """Build parameters as they will be used (defaults filled in), also stored in the sidecar."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_TYPES}")
+    p = {**DEFAULT_PARAMS[kind], **{k: v for k, v in params.items() if v is not None}}
+    if "nlist" in p and not p["nlist"]:
+        p["nlist"] = default_nlist(n)
+    storage = p.get("storage")
+    if storage is not None and ("storage" not in DEFAULT_PARAMS[kind] or storage not in STORAGE_TYPES):
+        raise ValueError(f"storage {storage!r} is not available for {kind!r}; "
+                         f"expected one of {STORAGE_TYPES} with flat, ivf_flat or hnsw")
+    return p
+
+
+def meta_path(index_path: str) -> str:
+    return f"{index_path}.meta.json"
+
+
+def modal_path(index_path: str, modality: str) -> str:
+    """products.index → products.text.index / products.image.index."""
+    root, ext = os.path.splitext(index_path)
+    return f"{root}.{modality}{ext}"
+
+
+def write_index(index: faiss.Index, path: str, meta: Dict[str, Any]) -> None:
+    faiss.write_index(index, path)
+    with open(meta_path(path), "w") as f:
+        json.dump({**meta, "ntotal": int(index.ntotal), "dim": int(index.d)}, f, indent=2)
+
+
+def read_index_meta(path: str) -> Dict[str, Any]:
+    """Sidecar metadata; indexes written before the sidecar existed are flat."""
+    try:
+        with open(meta_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"type": "flat", "params": {}}
+
+
+def search_params(meta: Dict[str, Any], nprobe: int | None = None,
+                  ef_search: int | None = None, sel=None):
+    """
+    Per-call faiss.SearchParameters for the index described by `meta`,
+    or None when the defaults apply (flat index, no selector).
+    """
+    kind = meta.get("type", "flat")
+    if kind in ("ivf_flat", "ivf_pq"):
+        p = faiss.SearchParametersIVF()
+        p.nprobe = nprobe or ANN_NPROBE
+    elif kind == "hnsw":
+        p = faiss.SearchParametersHNSW()
+        p.efSearch = ef_search or ANN_EF_SEARCH
+    elif sel is not None:
+        p = faiss.SearchParameters()
+    else:
+        return None
+    if sel is not None:
+        p.sel = sel
+    return p
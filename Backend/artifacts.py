@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+artifacts.py – compiled, memory-mappable serving artifacts
+
+The indexer (or `python artifacts.py`) compiles products_with_reviews.jsonl and
+ids.npy into a directory the backend can open with a handful of mmap calls
+instead of json-parsing the whole catalog on every worker start, and share
+through the page cache when several worker processes serve the same catalog:
+
+    meta.bin          product JSON records, packed back to back (catalog order)
+    meta_ids.npy      int64 product id per record
+    meta_offsets.npy  uint64 offset table, record i = meta.bin[off[i]:off[i+1]]
+    meta_order.npy    argsort of meta_ids, for id → record lookups
+    table_*.npy       ProductTable columns (see ProductTable.save)
+    cards.bin, cards_*.npy
+                      result cards and their facets in the same packed layout
+                      (see cards.write_cards), served by cards.MappedCardStore
+    manifest.json     format version and content hashes of the source files
+                      (written last; the backend ignores stale or partial output)
+
+The FAISS index itself is opened with faiss.IO_FLAG_MMAP_IFC (flat / id-mapped
+codes served straight from the page cache) or IO_FLAG_MMAP for IVF lists.
+"""
+
+import argparse, hashlib, json, mmap, os
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+
+try:
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:  # optional speed-up
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+FORMAT_VERSION = 3
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "compiled"))
+
+
+_FINGERPRINTS: Dict[tuple, Dict[str, object]] = {}
+
+
+def fingerprint(path: str, full: bool = True, sample: int = 1 << 16) -> Dict[str, object]:
+    """
+    Size plus a hash of the whole file, streamed: any edit changes it, even one
+    that keeps the length, and copies keep it. With `full=False` only the first
+    and last `sample` bytes are hashed and st_mtime_ns is added, for large files
+    that are only ever rewritten whole (FAISS indexes). Memoised per stat result,
+    so checking the same unchanged file twice reads it once.
+    """
+    st = os.stat(path)
+    key = (path, full, st.st_ino, st.st_size, st.st_mtime_ns)
+    if key in _FINGERPRINTS:
+        return _FINGERPRINTS[key]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if full:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        else:
+            h.update(f.read(sample))
+            if st.st_size > sample:
+                f.seek(max(sample, st.st_size - sample))
+                h.update(f.read(sample))
+    result = {"size": st.st_size, "hash": h.hexdigest()}
+    if not full:
+        result = {**result, "mtime_ns": st.st_mtime_ns}
+    _FINGERPRINTS[key] = result
+    return result
+
+
+class MetaStore(Mapping):
+    """
+    Read-only {product_id: doc} mapping over meta.bin (or another `prefix`
+    written by write_records). Records are decoded on access, so opening the
+    store costs a few mmaps regardless of catalog size.
+    """
+
+    def __init__(self, directory: str, prefix: str = "meta"):
+        self._ids = np.load(os.path.join(directory, f"{prefix}_ids.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(directory, f"{prefix}_offsets.npy"), mmap_mode="r")
+        self._order = np.load(os.path.join(directory, f"{prefix}_order.npy"), mmap_mode="r")
+        self._sorted = self._ids[self._order] if len(self._ids) else self._ids
+        with open(os.path.join(directory, f"{prefix}.bin"), "rb") as f:
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def _pos(self, product_id) -> int:
+        try:
+            pid = int(product_id)
+        except (TypeError, ValueError):
+            return -1
+        i = int(np.searchsorted(self._sorted, pid))
+        if i < len(self._sorted) and self._sorted[i] == pid:
+            return int(self._order[i])
+        return -1
+
+    def positions(self, product_ids) -> np.ndarray:
+        """Record position of each of `product_ids` (-1 where absent), in one vectorised lookup."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self._sorted):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted, product_ids), len(self._sorted) - 1)
+        return np.where(self._sorted[i] == product_ids, self._order[i], -1).astype(np.int64)
+
+    def record(self, pos: int) -> dict:
+        return _loads(self._blob[int(self._offsets[pos]):int(self._offsets[pos + 1])])
+
+    def records(self, positions: np.ndarray) -> List[dict]:
+        """Decoded records at `positions` (all valid), offsets gathered once."""
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self._offsets[positions].tolist()
+        ends = self._offsets[positions + 1].tolist()
+        blob = self._blob
+        return [_loads(blob[s:e]) for s, e in zip(starts, ends)]
+
+    def __getitem__(self, product_id) -> dict:
+        pos = self._pos(product_id)
+        if pos < 0:
+            raise KeyError(product_id)
+        return self.record(pos)
+
+    def __contains__(self, product_id) -> bool:
+        return self._pos(product_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def values(self):
+        return (self.record(i) for i in range(len(self._ids)))
+
+    def items(self):
+        return ((int(self._ids[i]), self.record(i)) for i in range(len(self._ids)))
+
+
+def write_records(records: Iterable[tuple], directory: str, prefix: str = "meta") -> None:
+    """Pack (product_id, record) pairs into <prefix>.bin plus the id / offset / order tables MetaStore reads."""
+    ids: List[int] = []
+    offsets = [0]
+    with open(os.path.join(directory, f"{prefix}.bin"), "wb") as f:
+        for pid, record in records:
+            blob = _dumps(record)
+            f.write(blob)
+            ids.append(int(pid))
+            offsets.append(offsets[-1] + len(blob))
+    ids_arr = np.asarray(ids, dtype=np.int64)
+    np.save(os.path.join(directory, f"{prefix}_ids.npy"), ids_arr)
+    np.save(os.path.join(directory, f"{prefix}_offsets.npy"), np.asarray(offsets, dtype=np.uint64))
+    np.save(os.path.join(directory, f"{prefix}_order.npy"), np.argsort(ids_arr, kind="stable"))
+
+
+def write_meta(docs: Iterable[dict], directory: str) -> None:
+    write_records(((d["id"], d) for d in docs), directory)
+
+
+def compile_artifacts(jsonl_path: str, ids_path: str, directory: str = ARTIFACT_DIR,
+                      name_terms: Iterable[str] = ()) -> None:
+    """Compile the catalog and row order into `directory` (written atomically via manifest last)."""
+    from cards import write_cards
+    from product_table import ProductTable
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest):
+        os.remove(manifest)   # mark incomplete while rewriting
+
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        docs_list = [json.loads(line) for line in f if line.strip()]
+    write_meta(docs_list, directory)
+
+    docs = {int(d["id"]): d for d in docs_list}
+    ids = np.load(ids_path)
+    ProductTable(ids, docs, name_terms=name_terms).save(directory)
+    write_cards(docs_list, directory)
+
+    with open(manifest, "w") as f:
+        json.dump({
+            "format": FORMAT_VERSION,
+            "products": len(docs_list),
+            "rows": int(len(ids)),
+            "sources": {"jsonl": fingerprint(jsonl_path), "ids": fingerprint(ids_path)},
+        }, f, indent=2)
+
+
+def is_current(directory: str, jsonl_path: str, ids_path: str) -> bool:
+    """Compiled artifacts exist, are complete and were built from the current source files."""
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+        return (manifest.get("format") == FORMAT_VERSION and
+                manifest["sources"]["jsonl"] == fingerprint(jsonl_path) and
+                manifest["sources"]["ids"] == fingerprint(ids_path))
+    except (OSError, KeyError, ValueError):
+        return False
+
+
+def read_index_mmap(path: str):
+    """Open a FAISS index memory-mapped when the index type allows it, else read it normally."""
+    import faiss
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag) | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                continue
+    return faiss.read_index(path)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Compile serving artifacts from the catalog and ids.npy")
+    ap.add_argument("--data", default="products_with_reviews.jsonl")
+    ap.add_argument("--ids", default="ids.npy")
+    ap.add_argument("--out", default=ARTIFACT_DIR)
+    args = ap.parse_args()
+    from vocabulary import VOCAB_WORDS
+    compile_artifacts(args.data, args.ids, args.out, name_terms=VOCAB_WORDS)
+    print(f"Compiled artifacts written to {args.out}")
@@ -0,0 +1,82 @@
+"""
+batching.py – cross-request dynamic micro-batching for the CLIP encoders
+
+Callers on any thread submit single items; a worker thread collects pending
+items for up to `max_wait_ms` or `max_batch` items, runs them through one
+batched call and hands each caller its own result. Batch sizes and queue
+waits go to the encoder_batch_* histograms on /metrics, labelled with the
+batcher's name.
+"""
+
+import queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+from telemetry import BATCH_SIZE, BATCH_WAIT_SECONDS
+
+
+class MicroBatcher:
+    """
+    Queue in front of a batch function `fn(items) -> results` (same length, same order).
+
+    max_batch   – upper bound on items per call
+    max_wait_ms – how long the first item of a batch may wait for company;
+                  0 only takes what is already queued
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch: int = 32, max_wait_ms: float = 2.0, name: str = "batch"):
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[tuple[float, Any, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        fut: Future = Future()
+        self._queue.put((time.perf_counter(), item, fut))
+        return fut
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _collect(self) -> list:
+        pending = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    pending.append(self._queue.get(timeout=timeout))
+                else:
+                    pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            pending = self._collect()
+            started = time.perf_counter()
+            BATCH_SIZE.observe(len(pending), self.name)
+            for enqueued, _, _ in pending:
+                BATCH_WAIT_SECONDS.observe(started - enqueued, self.name)
+            try:
+                results = self.fn([item for _, item, _ in pending])
+                for (_, _, fut), res in zip(pending, results):
+                    fut.set_result(res)
+            except Exception as e:
+                for _, _, fut in pending:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": self._queue.qsize(),
+            "batch_size": BATCH_SIZE.snapshot(self.name),
+            "queue_wait_seconds": BATCH_WAIT_SECONDS.snapshot(self.name),
+        }
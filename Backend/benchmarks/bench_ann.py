@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+bench_ann.py – recall / latency / memory of the ANN index types
+
+Builds every configuration over a synthetic clustered catalog (or vectors
+sampled from an existing flat index) and reports recall@k against exact
+IndexFlatIP search, single-query p50/p99 latency, build time and serialized
+index size.
+
+    python Backend/benchmarks/bench_ann.py --n 200000 --k 10
+    python Backend/benchmarks/bench_ann.py --from-index Backend/products.index --json out.json
+"""
+
+import argparse, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+import ann_index
+
+# (label, index type, build params, search params)
+CONFIGS = [
+    ("flat",              "flat",     {},                              {}),
+    ("ivf_flat np=8",     "ivf_flat", {},                              {"nprobe": 8}),
+    ("ivf_flat np=32",    "ivf_flat", {},                              {"nprobe": 32}),
+    ("hnsw32 ef=64",      "hnsw",     {"m": 32, "ef_construction": 200}, {"ef_search": 64}),
+    ("hnsw32 ef=128",     "hnsw",     {"m": 32, "ef_construction": 200}, {"ef_search": 128}),
+    ("ivf_pq64 np=16",    "ivf_pq",   {"pq_m": 64, "pq_bits": 8},      {"nprobe": 16}),
+    ("ivf_pq64 np=64",    "ivf_pq",   {"pq_m": 64, "pq_bits": 8},      {"nprobe": 64}),
+]
+
+
+def synthetic_catalog(n, d, n_clusters=256, seed=0):
+    """Unit vectors scattered around random centroids, roughly like CLIP product embeddings."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((n_clusters, d)).astype("float32")
+    assign = rng.integers(0, n_clusters, n)
+    x = centroids[assign] + 0.6 * rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def load_vectors(path, n):
+    index = faiss.read_index(path)
+    n = min(n, index.ntotal)
+    x = index.reconstruct_n(0, n).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def make_queries(x, nq, seed=1):
+    """Perturbed catalog vectors, so every query has a meaningful neighbourhood."""
+    rng = np.random.default_rng(seed)
+    q = x[rng.integers(0, len(x), nq)] + 0.3 * rng.standard_normal((nq, x.shape[1])).astype("float32")
+    faiss.normalize_L2(q)
+    return q
+
+
+def run(x, q, k, configs):
+    exact = faiss.IndexFlatIP(x.shape[1])
+    exact.add(x)
+    _, truth = exact.search(q, k)
+
+    rows = []
+    for label, kind, build, search in configs:
+        t0 = time.perf_counter()
+        index = ann_index.build_index(x, kind, **build)
+        index.add(x)
+        build_s = time.perf_counter() - t0
+
+        meta = {"type": kind}
+        params = ann_index.search_params(meta, search.get("nprobe"), search.get("ef_search"))
+        lat, found = [], np.empty_like(truth)
+        for i in range(len(q)):
+            t0 = time.perf_counter()
+            _, I = index.search(q[i:i+1], k, params=params)
+            lat.append((time.perf_counter() - t0) * 1000)
+            found[i] = I[0]
+
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(q))])
+        rows.append({
+            "config": label, "type": kind, "build": build, "search": search,
+            f"recall@{k}": round(float(recall), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p99_ms": round(float(np.percentile(lat, 99)), 3),
+            "build_s": round(build_s, 2),
+            "index_mb": round(faiss.serialize_index(index).nbytes / 2**20, 1),
+        })
+        print(f"{label:>16}  recall@{k}={recall:.3f}  p50={rows[-1]['p50_ms']:7.3f} ms  "
+              f"p99={rows[-1]['p99_ms']:7.3f} ms  build={build_s:6.1f}s  size={rows[-1]['index_mb']:7.1f} MB")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100_000, help="catalog size")
+    ap.add_argument("--d", type=int, default=512)
+    ap.add_argument("--nq", type=int, default=500, help="number of queries")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--from-index", help="sample vectors from an existing flat index instead")
+    ap.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 = per-core latency)")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    x = load_vectors(args.from_index, args.n) if args.from_index else synthetic_catalog(args.n, args.d)
+    q = make_queries(x, args.nq)
+    print(f"catalog={len(x)} x {x.shape[1]}  queries={len(q)}  k={args.k}  threads={args.threads}")
+
+    configs = [c for c in CONFIGS if c[1] != "ivf_pq" or x.shape[1] % c[2]["pq_m"] == 0]
+    rows = run(x, q, args.k, configs)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"n": len(x), "d": int(x.shape[1]), "k": args.k, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+bench_encoders.py – accuracy and speed of the CLIP inference backends
+
+For every backend in encoders.ENCODER_BACKENDS (or --backends):
+
+  accuracy   cosine similarity of its text / image embeddings to eager fp32 on
+             a sample set, and top-k overlap of the neighbours those query
+             embeddings retrieve from the products index (or, without one,
+             from an fp32 gallery of the sample images)
+  speed      single-query p50 / p95 latency and batched throughput per tower
+
+Exits non-zero when a backend falls below --min-cosine / --min-overlap, so it
+doubles as the accuracy gate before switching ENCODER_BACKEND.
+
+    python Backend/benchmarks/bench_encoders.py
+    python Backend/benchmarks/bench_encoders.py --images photos/ --backends eager int8 onnx --json out.json
+"""
+
+import argparse, glob, json, os, statistics, sys, time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import faiss
+import numpy as np
+import open_clip
+import torch
+from PIL import Image
+
+import encoders
+import search_backend as sb
+from vocabulary import VOCAB_WORDS
+
+
+def sample_texts(n):
+    texts = []
+    path = os.path.join(BACKEND, "products_with_reviews.jsonl")
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                texts.append(json.loads(line).get("productDisplayName") or "")
+                if len(texts) >= n:
+                    break
+    phrases = ["red floral dress", "denim jacket not blue", "black leather shoes with good reviews",
+               "striped cotton shirt", "gold watch", "white sneakers"]
+    texts += phrases + VOCAB_WORDS
+    return [t for t in texts if t][:n]
+
+
+def sample_images(directory, n, size):
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, "*")))[:n]
+        return [Image.open(p).convert("RGB") for p in paths]
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def embed(fn, x, batch=32):
+    out = [fn(x[i:i + batch]) for i in range(0, len(x), batch)]
+    v = torch.cat(out).float()
+    return (v / v.norm(dim=-1, keepdim=True)).numpy()
+
+
+def topk_overlap(index, a, b, k):
+    _, ia = index.search(np.ascontiguousarray(a, dtype="float32"), k)
+    _, ib = index.search(np.ascontiguousarray(b, dtype="float32"), k)
+    return float(np.mean([len(set(x) & set(y)) / k for x, y in zip(ia, ib)]))
+
+
+def latency(fn, x, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(x[i % len(x):i % len(x) + 1])
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return statistics.median(times) * 1000, times[int(0.95 * (len(times) - 1))] * 1000
+
+
+def throughput(fn, x, batch, seconds=3.0):
+    xb = x[:batch] if len(x) >= batch else x.repeat((batch + len(x) - 1) // len(x), *[1] * (x.dim() - 1))[:batch]
+    done, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        fn(xb)
+        done += len(xb)
+    return done / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backends", nargs="+", default=list(encoders.ENCODER_BACKENDS),
+                    choices=encoders.ENCODER_BACKENDS)
+    ap.add_argument("--texts", type=int, default=256, help="sample text queries")
+    ap.add_argument("--images", help="directory of sample photos (random images if omitted)")
+    ap.add_argument("--n-images", type=int, default=64)
+    ap.add_argument("--index", default=os.path.join(BACKEND, "products.index"))
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=50, help="single-query latency samples")
+    ap.add_argument("--batch", type=int, default=32, help="throughput batch size")
+    ap.add_argument("--threads", type=int, help="torch intra-op threads")
+    ap.add_argument("--min-cosine", type=float, default=0.99)
+    ap.add_argument("--min-overlap", type=float, default=0.9)
+    ap.add_argument("--json", help="write results here")
+    args = ap.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, _, preprocess = open_clip.create_model_and_transforms(sb.MODEL_NAME, pretrained=sb.PRETRAIN_TAG,
+                                                                 device="cpu")
+    model.eval()
+    tokens = open_clip.tokenize(sample_texts(args.texts))
+    imgs = sample_images(args.images, args.n_images, 320)
+    pixels = torch.stack([preprocess(im) for im in imgs])
+
+    reference = encoders.build_encoder(model, "eager", "cpu", sb.MODEL_NAME)
+    ref_text = embed(reference.encode_text, tokens)
+    ref_image = embed(reference.encode_image, pixels)
+
+    if os.path.exists(args.index):
+        index, gallery = faiss.read_index(args.index), args.index
+    else:
+        index, gallery = faiss.IndexFlatIP(ref_image.shape[1]), "fp32 sample images"
+        index.add(ref_image)
+    k = min(args.k, index.ntotal)
+    print(f"{len(tokens)} texts, {len(pixels)} images, top-{k} overlap against {gallery}, "
+          f"{torch.get_num_threads()} threads")
+
+    results, failed = {}, []
+    for kind in args.backends:
+        t0 = time.perf_counter()
+        enc = encoders.build_encoder(model, kind, "cpu", sb.MODEL_NAME)
+        build_s = time.perf_counter() - t0
+        if enc.kind != kind:
+            print(f"{kind:>12}: unavailable here (fell back to {enc.kind}) - skipped")
+            continue
+        text, image = embed(enc.encode_text, tokens), embed(enc.encode_image, pixels)
+        cos_t, cos_i = (text * ref_text).sum(1), (image * ref_image).sum(1)
+        r = {
+            "build_s": build_s,
+            "text_cosine_mean": float(cos_t.mean()), "text_cosine_min": float(cos_t.min()),
+            "image_cosine_mean": float(cos_i.mean()), "image_cosine_min": float(cos_i.min()),
+            "text_topk_overlap": topk_overlap(index, ref_text, text, k),
+            "image_topk_overlap": topk_overlap(index, ref_image, image, k),
+        }
+        r["text_p50_ms"], r["text_p95_ms"] = latency(enc.encode_text, tokens, args.repeat)
+        r["image_p50_ms"], r["image_p95_ms"] = latency(enc.encode_image, pixels, args.repeat)
+        r["text_per_s"] = throughput(enc.encode_text, tokens, args.batch)
+        r["image_per_s"] = throughput(enc.encode_image, pixels, args.batch)
+        results[kind] = r
+
+        ok = (min(r["text_cosine_min"], r["image_cosine_min"]) >= args.min_cosine and
+              min(r["text_topk_overlap"], r["image_topk_overlap"]) >= args.min_overlap)
+        if not ok:
+            failed.append(kind)
+        print(f"{kind:>12}: cos text {r['text_cosine_mean']:.4f} (min {r['text_cosine_min']:.4f}) "
+              f"image {r['image_cosine_mean']:.4f} (min {r['image_cosine_min']:.4f})  "
+              f"top-{k} overlap {r['text_topk_overlap']:.3f}/{r['image_topk_overlap']:.3f}  "
+              f"{'OK' if ok else 'BELOW THRESHOLD'}")
+        print(f"{'':>12}  text p50 {r['text_p50_ms']:6.1f} ms p95 {r['text_p95_ms']:6.1f} ms "
+              f"{r['text_per_s']:7.1f}/s   image p50 {r['image_p50_ms']:6.1f} ms "
+              f"p95 {r['image_p95_ms']:6.1f} ms {r['image_per_s']:6.1f}/s   (build {build_s:.1f}s)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"k": k, "gallery": gallery, "results": results}, f, indent=2)
+    if failed:
+        print(f"Accuracy check failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
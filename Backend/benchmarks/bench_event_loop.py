@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+bench_event_loop.py – cheap endpoints must stay fast while image searches run
+
+Against a running server, measures latency of `/` and `/api/categories` first
+on an idle server, then while `--concurrency` clients keep posting image
+searches. Exits non-zero if the loaded p99 of the cheap endpoints exceeds
+`--max-p99-ms`, so it can gate a deploy. Backend/tests/test_event_loop.py
+checks the same property in-process, against the stub catalog.
+
+    uvicorn server:app --port 8000 &
+    python Backend/benchmarks/bench_event_loop.py --url http://localhost:8000 --image photo.jpg
+"""
+
+import argparse, io, statistics, sys, threading, time
+
+import requests
+
+
+def _percentile(samples, q):
+    if not samples:
+        return float("nan")
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(q / 100 * (len(s) - 1))))]
+
+
+def _probe(url, paths, duration):
+    """Round-robin GETs on cheap endpoints for `duration` seconds → latencies in ms."""
+    lat = {p: [] for p in paths}
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for p in paths:
+            t0 = time.perf_counter()
+            requests.get(url + p, timeout=30).raise_for_status()
+            lat[p].append((time.perf_counter() - t0) * 1000)
+        time.sleep(0.02)
+    return lat
+
+
+def _image_bytes(path):
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.effect_noise((1600, 1600), 64).convert("RGB").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _report(label, lat):
+    for p, xs in lat.items():
+        print(f"{label:>7} {p:<18} n={len(xs):4d}  p50={statistics.median(xs):7.1f} ms  "
+              f"p99={_percentile(xs, 99):7.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--image", help="upload to use for heavy searches (noise JPEG if omitted)")
+    ap.add_argument("--text", default="denim jacket")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--max-p99-ms", type=float, default=250.0)
+    args = ap.parse_args()
+
+    paths = ["/", "/api/categories"]
+    img = _image_bytes(args.image)
+
+    _report("idle", _probe(args.url, paths, min(3.0, args.duration)))
+
+    stop, heavy = threading.Event(), []
+
+    def _heavy():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            r = requests.post(args.url + "/api/search", data={"text": args.text, "limit": 100},
+                              files={"file": ("q.jpg", img, "image/jpeg")}, timeout=120)
+            if r.status_code == 200:
+                heavy.append((time.perf_counter() - t0) * 1000)
+
+    clients = [threading.Thread(target=_heavy, daemon=True) for _ in range(args.concurrency)]
+    for t in clients:
+        t.start()
+    time.sleep(0.5)   # let the searches get in flight
+    loaded = _probe(args.url, paths, args.duration)
+    stop.set()
+    for t in clients:
+        t.join()
+
+    _report("loaded", loaded)
+    if heavy:
+        print(f"  image searches: n={len(heavy)}  p50={statistics.median(heavy):.0f} ms")
+
+    worst = max(_percentile(xs, 99) for xs in loaded.values())
+    if worst > args.max_p99_ms:
+        print(f"FAIL: cheap endpoint p99 {worst:.1f} ms > {args.max_p99_ms} ms")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
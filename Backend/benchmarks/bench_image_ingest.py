@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+bench_image_ingest.py – query-image decode / resize / preview cost
+
+Compares the old path (full decode, crop, LANCZOS back to full size, full-size
+JPEG preview) with image_ingest.prepare_query_image on a phone-sized JPEG.
+
+    python Backend/benchmarks/bench_image_ingest.py [--image photo.jpg] [--size 4000x3000]
+"""
+
+import argparse, base64, io, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+import image_ingest
+
+
+def _legacy(data, zoom=1.2):
+    full_img = Image.open(io.BytesIO(data)).convert("RGB")
+    w, h = full_img.size
+    cw, ch = int(w / zoom), int(h / zoom)
+    left, top = (w - cw) // 2, (h - ch) // 2
+    patch_img = full_img.crop((left, top, left + cw, top + ch)).resize((w, h), Image.LANCZOS)
+    buf = io.BytesIO()
+    patch_img.save(buf, format="JPEG")
+    return patch_img, "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--image", help="query photo (synthetic JPEG if omitted)")
+    ap.add_argument("--size", default="4000x3000", help="synthetic image size WxH")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            data = f.read()
+    else:
+        w, h = map(int, args.size.split("x"))
+        # smooth gradients + noise compress like a photo rather than pure noise
+        yy, xx = np.mgrid[0:h, 0:w]
+        rng = np.random.default_rng(0)
+        arr = np.stack([(xx * 255 // w), (yy * 255 // h), ((xx + yy) * 127 // (w + h))], -1)
+        arr = np.clip(arr + rng.normal(0, 12, arr.shape), 0, 255).astype(np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=90)
+        data = buf.getvalue()
+
+    t_old, (old_img, old_uri) = _time(lambda: _legacy(data), args.repeat)
+    t_new, q = _time(lambda: image_ingest.prepare_query_image(data), args.repeat)
+    print(f"upload {len(data) / 1e6:.1f} MB  {q.source_size[0]}x{q.source_size[1]}")
+    print(f"  legacy: {t_old*1000:8.1f} ms  model input {old_img.size}  preview {len(old_uri) / 1e3:9.1f} kB")
+    print(f"  ingest: {t_new*1000:8.1f} ms  model input {q.model_image.size}  preview {len(q.preview_uri) / 1e3:9.1f} kB")
+    print(f" speedup: {t_old / max(t_new, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
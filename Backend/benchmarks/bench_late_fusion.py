@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+bench_late_fusion.py – fused single index vs separate text / image indexes
+
+Builds one synthetic catalog (stub_backend.write_catalog) per configuration:
+
+    fused fp32      products.index over normalised text+image vectors (previous layout)
+    late fp32       products.text.index + products.image.index, exact vectors
+    late fp16       the same, half-precision codes
+    late sq8        the same, 8-bit scalar-quantised codes
+
+and measures each in a fresh process, so memory numbers are not polluted by
+the others:
+
+    index_mb        size of the index file(s), i.e. their memory once paged in
+    rss_load_mb     resident memory added by search_backend.load_data()
+    rss_search_mb   resident memory added after the query pass (mmapped codes touched)
+    p50 / p95       retrieval latency per query (fused: _retrieve, late: _late_retrieve
+                    with the default weights), unfiltered and with a category mask,
+                    for every --k
+    rounds          late fusion: average search rounds per query (widening)
+    overlap@k       share of the top-k shared with "late fp32" (exact late fusion):
+                    how far quantisation moves the ranking, and how different the
+                    fused index ranks
+
+"late fp32" also runs with LATE_FUSION_THREADS=0, to show what the parallel
+index searches save on this machine (they need more than one core).
+
+    python Backend/benchmarks/bench_late_fusion.py --n 100000 --k 10,100 --json late.json
+"""
+
+import argparse, json, os, shutil, subprocess, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# (label, layout, storage, extra environment)
+CONFIGS = [
+    ("fused fp32",         "fused",    None,   {}),
+    ("late fp32",          "separate", None,   {}),
+    ("late fp32 1-thread", "separate", None,   {"LATE_FUSION_THREADS": "0"}),
+    ("late fp16",          "separate", "fp16", {}),
+    ("late sq8",           "separate", "sq8",  {}),
+]
+REFERENCE = "late fp32"
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux /proc; peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def queries(n: int, seed: int = 0):
+    """Deterministic query vectors: stub text embeddings of "<colour> <article>" phrases plus noise."""
+    import numpy as np
+    import stub_backend
+    rng = np.random.default_rng(seed)
+    phrases = [f"{stub_backend.COLOURS[rng.integers(len(stub_backend.COLOURS))]} "
+               f"{stub_backend.ARTICLES[rng.integers(len(stub_backend.ARTICLES))][2]}" for _ in range(n)]
+    return stub_backend._unit_vectors(phrases, rng, 0.3)
+
+
+def child(args) -> dict:
+    """Runs in its own process: load one catalog, time retrieval, report memory and rankings."""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    import numpy as np
+    qvecs = queries(args.queries)
+    import search_backend as sb
+
+    base = rss_mb()
+    sb.load_data(args.child)
+    loaded = rss_mb()
+    paths = [os.path.join(args.child, f) for f in os.listdir(args.child) if f.endswith(".index")]
+
+    n = len(sb.PRODUCTS)
+    dresses = sb.PRODUCTS.lower_eq_any("articleType", ["dresses"], np.arange(n))
+    masks = {"unfiltered": None, "filtered": dresses if dresses.any() else None}
+    if sb.MODAL_INDEXES is None:
+        retrieve = lambda q, k, mask: sb._retrieve(q, k, mask)
+    else:
+        weights = sb._index_weights(None, has_text=True)
+        retrieve = lambda q, k, mask: sb._late_retrieve(q, k, mask, None, None, weights)
+
+    out = {"index_mb": round(sum(os.path.getsize(p) for p in paths) / 2**20, 1),
+           "rss_load_mb": round(loaded - base, 1), "latency": {}, "rankings": {}}
+    for k in (int(x) for x in args.k.split(",")):
+        for name, mask in masks.items():
+            for q in qvecs[:10]:
+                retrieve(q, k, mask)   # warm-up: page in the index
+            sb._RETRIEVAL_STATS.clear()
+            times, ranking = [], []
+            for q in qvecs:
+                t0 = time.perf_counter()
+                rows, _ = retrieve(q, k, mask)
+                times.append(time.perf_counter() - t0)
+                ranking.append(sb.IDS[rows].astype(int).tolist())
+            ms = np.array(times) * 1000
+            stats = sb.retrieval_stats()
+            out["latency"][f"k={k} {name}"] = {
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "rounds": round(stats["late_fusion_rounds"] / stats["late_fusion"], 2) if stats.get("late_fusion") else None,
+            }
+            out["rankings"][f"k={k} {name}"] = ranking
+    out["rss_search_mb"] = round(rss_mb() - base, 1)
+    return out
+
+
+def overlap(a, b) -> float:
+    return sum(len(set(x) & set(y)) / max(1, len(y)) for x, y in zip(a, b)) / max(1, len(b))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100_000, help="catalog size")
+    ap.add_argument("--k", default="10,100", help="comma-separated result counts")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--index-type", default="flat", help="ann_index type (flat, ivf_flat, hnsw; ivf_pq has no fp16/sq8)")
+    ap.add_argument("--workdir", default=None, help="where catalogs are written (reused between runs)")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    ap.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args)))
+        return
+
+    import stub_backend
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mss-late-")
+    results = {"meta": {"n": args.n, "index_type": args.index_type, "queries": args.queries,
+                        "cpus": os.cpu_count()}, "configs": {}}
+    try:
+        for label, layout, storage, env in CONFIGS:
+            directory = os.path.join(workdir, f"{args.index_type}_{layout}_{storage or 'fp32'}_{args.n}")
+            t0 = time.perf_counter()
+            stub_backend.write_catalog(directory, args.n, args.index_type, layout=layout, storage=storage)
+            print(f"{label}: catalog ready in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", directory,
+                   "--k", args.k, "--queries", str(args.queries)]
+            proc = subprocess.run(cmd, env={**os.environ, **env}, capture_output=True, text=True)
+            if proc.returncode:
+                sys.exit(f"{label} failed:\n{proc.stderr}")
+            results["configs"][label] = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    reference = results["configs"][REFERENCE]["rankings"]
+    print(f"\nn={args.n:,} {args.index_type}, {args.queries} queries, {os.cpu_count()} CPU(s)\n")
+    print(f"{'config':<20} {'index MB':>9} {'RSS load':>9} {'RSS srch':>9}  "
+          f"{'stage':<18} {'p50 ms':>8} {'p95 ms':>8} {'rounds':>7} {'overlap':>8}")
+    for label, r in results["configs"].items():
+        first = True
+        for stage, lat in r["latency"].items():
+            mem = (f"{r['index_mb']:>9.1f} {r['rss_load_mb']:>9.1f} {r['rss_search_mb']:>9.1f}" if first
+                   else " " * 29)
+            r.setdefault("overlap", {})[stage] = round(overlap(r["rankings"][stage], reference[stage]), 3)
+            rounds = f"{lat['rounds']:.2f}" if lat["rounds"] is not None else "-"
+            print(f"{label if first else '':<20} {mem}  {stage:<18} {lat['p50_ms']:>8.3f} {lat['p95_ms']:>8.3f} "
+                  f"{rounds:>7} {r['overlap'][stage]:>8.3f}")
+            first = False
+        del r["rankings"]
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
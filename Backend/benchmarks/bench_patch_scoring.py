@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+bench_patch_scoring.py – per-crop vs batched patch scoring
+
+Compares the old path (one `encode_image` call per crop plus per-crop
+cosine_similarity) with the batched engine in search_backend for both the
+5x5 standard grid and the 11x11 half-step grid used by _best_patch.
+
+    python Backend/benchmarks/bench_patch_scoring.py [--image photo.jpg] [--repeat 3]
+"""
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np, torch
+from PIL import Image
+
+import search_backend as sb
+
+
+def _per_crop(img, boxes, query_vec):
+    """Old behaviour: one forward pass per crop."""
+    best_sim, best_box = -1.0, None
+    for box in boxes:
+        emb = sb._img_embed(img.crop(box))
+        sim = torch.cosine_similarity(emb, query_vec)[0].item()
+        if sim > best_sim:
+            best_sim, best_box = sim, box
+    return best_box, best_sim
+
+
+def _batched(img, boxes, query_vec):
+    _, sims = sb._score_patches(img, boxes, query_vec)
+    best = int(sims[:, 0].argmax())
+    return boxes[best], float(sims[best, 0])
+
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--image", help="query photo (random noise image if omitted)")
+    ap.add_argument("--size", type=int, default=1024, help="side of the synthetic image")
+    ap.add_argument("--text", default="denim jacket")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    sb.load_model()   # only the encoder is needed, not the index or catalog
+
+    if args.image:
+        img = Image.open(args.image).convert("RGB")
+    else:
+        rng = np.random.default_rng(0)
+        img = Image.fromarray(rng.integers(0, 255, (args.size, args.size, 3), dtype=np.uint8))
+
+    q = sb._text_embed(args.text)
+
+    w, h = img.size
+    grids = {
+        "standard 5x5": sb._standard_patch_boxes(w, h, 5),
+        "fine 11x11":   sb._fine_patch_boxes(w, h, 6),
+    }
+
+    print(f"device={sb.DEVICE}  image={w}x{h}  batch={sb.PATCH_BATCH_SIZE}")
+    for name, boxes in grids.items():
+        t_old, (box_old, sim_old) = _time(lambda: _per_crop(img, boxes, q), args.repeat)
+        t_new, (box_new, sim_new) = _time(lambda: _batched(img, boxes, q), args.repeat)
+        print(f"{name:>13}: {len(boxes):4d} crops  "
+              f"per-crop {t_old*1000:8.1f} ms  batched {t_new*1000:8.1f} ms  "
+              f"speedup {t_old / max(t_new, 1e-9):5.1f}x  "
+              f"same best box: {box_old == box_new} (|Δsim|={abs(sim_old - sim_new):.2e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+bench_query_parser.py – query parsing correctness and cost
+
+1. Checks query_parser.parse against query_corpus.json (expected items,
+   descriptors and exclusions per query); exits 1 on any mismatch.
+2. Times the old nested substring scan against the compiled parser, with the
+   vocabulary padded by --extra synthetic descriptor terms, to show how each
+   scales with vocabulary size.
+3. Times a fresh Rake() per query against query_parser.extract_keywords
+   (when rake_nltk and its NLTK data are installed).
+
+The correctness check also runs as Backend/tests/test_query_parser.py.
+
+    python Backend/benchmarks/bench_query_parser.py [--extra 0,1000,10000] [--repeat 2000]
+"""
+
+import argparse, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_parser
+from vocabulary import ITEM_TYPES, DESCRIPTOR_TYPES
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_corpus.json")
+
+
+def _legacy(text, item_types, descriptor_types):
+    """parse_semantic_query before query_parser.py (substring scans, two passes)."""
+    text_lower = text.lower()
+    target_items = {}
+    for category, words in item_types.items():
+        for word in words:
+            if word in text_lower:
+                target_items[category] = word
+                break
+    target_descriptors, excluded_descriptors = {}, {}
+    for category, words in descriptor_types.items():
+        for word in words:
+            negs = [f"not {word}", f"no {word}", f"except {word}", f"but not {word}"]
+            if any(neg in text_lower for neg in negs):
+                continue
+            if word in text_lower:
+                target_descriptors[category] = target_descriptors.get(category, []) + [word]
+    for category, words in descriptor_types.items():
+        for word in words:
+            negs = [f"not {word}", f"no {word}", f"except {word}", f"but not {word}"]
+            if any(neg in text_lower for neg in negs):
+                excluded_descriptors[category] = excluded_descriptors.get(category, []) + [word]
+    return target_items, target_descriptors, excluded_descriptors
+
+
+def check_corpus(cases):
+    failures = 0
+    for case in cases:
+        got = query_parser.parse(case["query"])
+        want = (case["items"], case["descriptors"], case["excluded"])
+        if got != want:
+            failures += 1
+            print(f"  MISMATCH {case['query']!r}\n    want {want}\n    got  {got}")
+        legacy = _legacy(case["query"], ITEM_TYPES, DESCRIPTOR_TYPES)
+        if legacy != want:
+            print(f"  (legacy differs on {case['query']!r}: {legacy})")
+    return failures
+
+
+def per_query_us(fn, queries, repeat):
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        fn(queries[i % len(queries)])
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--extra", default="0,1000,10000", help="synthetic descriptor terms added to the vocabulary")
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+
+    with open(CORPUS) as f:
+        cases = json.load(f)
+    print(f"Correctness ({len(cases)} queries from {os.path.basename(CORPUS)}):")
+    failures = check_corpus(cases)
+    print(f"  {len(cases) - failures}/{len(cases)} match")
+
+    queries = [c["query"] for c in cases if c["query"]]
+    print(f"\n{'vocabulary':>12} {'legacy µs/q':>12} {'compiled µs/q':>14} {'speed-up':>9}")
+    for extra in (int(x) for x in args.extra.split(",")):
+        descriptors = {**DESCRIPTOR_TYPES, "extra": [f"term{i:05d}" for i in range(extra)]}
+        parser = query_parser.QueryParser(ITEM_TYPES, descriptors)
+        vocab = sum(map(len, ITEM_TYPES.values())) + sum(map(len, descriptors.values()))
+        repeat = max(50, args.repeat // (1 + extra // 500))   # the legacy scan gets slow
+        legacy = per_query_us(lambda q: _legacy(q, ITEM_TYPES, descriptors), queries, repeat)
+        compiled = per_query_us(parser.parse, queries, args.repeat)
+        print(f"{vocab:>12} {legacy:>12.1f} {compiled:>14.1f} {legacy / compiled:>8.1f}x")
+
+    try:
+        from rake_nltk import Rake
+        Rake().extract_keywords_from_text("red dress")   # needs the NLTK stopwords and punkt data
+    except ImportError:
+        print("\nrake_nltk not installed - skipping keyword extraction")
+    except LookupError:
+        print("\nNLTK stopwords / punkt data missing (python -m nltk.downloader stopwords punkt)"
+              " - skipping keyword extraction")
+    else:
+        def fresh(q):
+            rk = Rake()
+            rk.extract_keywords_from_text(q)
+            return {p.lower() for p in rk.get_ranked_phrases()[:5]}
+        repeat = max(50, args.repeat // 10)
+        print(f"\nRAKE per query: new Rake() {per_query_us(fresh, queries, repeat):.1f} µs, "
+              f"reused {per_query_us(query_parser.extract_keywords, queries, repeat):.1f} µs")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
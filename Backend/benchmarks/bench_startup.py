@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py – cold-start cost of the catalog, filter table and index
+
+Times, in fresh interpreter processes, what every worker pays on start:
+
+    legacy    json-parse products_with_reviews.jsonl, faiss.read_index into RAM,
+              np.load ids.npy, build ProductTable
+    compiled  open the compiled artifacts (MetaStore + mmapped ProductTable)
+              and the index with the mmap IO flags
+
+    python Backend/benchmarks/bench_startup.py --data-dir Backend
+    python Backend/benchmarks/bench_startup.py --synthetic 200000
+"""
+
+import argparse, json, os, subprocess, sys, tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+LEGACY = """
+import json, numpy as np, faiss
+from product_table import ProductTable
+from vocabulary import VOCAB_WORDS
+with open({data!r}) as f:
+    docs = {{int(d["id"]): d for d in map(json.loads, f)}}
+index = faiss.read_index({index!r})
+ids = np.load({ids!r})
+table = ProductTable(ids, docs, name_terms=VOCAB_WORDS)
+"""
+
+COMPILED = """
+import numpy as np
+import artifacts
+from product_table import ProductTable
+docs = artifacts.MetaStore({out!r})
+index = artifacts.read_index_mmap({index!r})
+ids = np.load({ids!r}, mmap_mode="r")
+table = ProductTable.load({out!r}, docs)
+"""
+
+# resident set after loading (ru_maxrss would include the parent's high-water mark)
+PROBE = """
+import time
+t0 = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - t0
+rss_kb = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmRSS:"))
+print(elapsed, rss_kb)
+"""
+
+
+def _run(body, repeat):
+    code = PROBE.format(body="\n".join(body.strip().splitlines()))
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, check=True,
+                             capture_output=True, text=True).stdout.split()
+        runs.append((float(out[0]), int(out[1]) / 1024))
+    return min(r[0] for r in runs), min(r[1] for r in runs)
+
+
+def _synthetic(directory, n, d=512):
+    import faiss, numpy as np
+    rng = np.random.default_rng(0)
+    colours, types = ["Black", "Blue", "Red", "White", "Green"], ["Tshirts", "Jeans", "Dresses", "Casual Shoes"]
+    data = os.path.join(directory, "products_with_reviews.jsonl")
+    with open(data, "w") as f:
+        for i in range(n):
+            f.write(json.dumps({
+                "id": i, "productDisplayName": f"{colours[i % 5]} {types[i % 4]} {i}",
+                "masterCategory": "Apparel", "subCategory": "Topwear", "articleType": types[i % 4],
+                "baseColour": colours[i % 5], "price": 100 + i % 400, "rating": 3.5,
+                "reviews": ["Great fit and the colour is exactly as pictured."] * 5,
+            }) + "\n")
+    np.save(os.path.join(directory, "ids.npy"), np.arange(n, dtype=np.int32))
+    x = rng.standard_normal((n, d)).astype("float32")
+    faiss.normalize_L2(x)
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+    index.add_with_ids(x, np.arange(n))
+    faiss.write_index(index, os.path.join(directory, "products.index"))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data-dir", default=BACKEND, help="directory with the catalog, ids.npy and products.index")
+    ap.add_argument("--synthetic", type=int, help="generate a synthetic catalog of this size instead")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import artifacts
+    from vocabulary import VOCAB_WORDS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = args.data_dir
+        if args.synthetic:
+            src = tmp
+            _synthetic(tmp, args.synthetic)
+        paths = {
+            "data": os.path.join(src, "products_with_reviews.jsonl"),
+            "ids": os.path.join(src, "ids.npy"),
+            "index": os.path.join(src, "products.index"),
+            "out": os.path.join(tmp, "compiled"),
+        }
+        artifacts.compile_artifacts(paths["data"], paths["ids"], paths["out"], name_terms=VOCAB_WORDS)
+
+        results = {}
+        for name, body in (("legacy", LEGACY), ("compiled", COMPILED)):
+            results[name] = _run(body.format(**paths), args.repeat)
+            print(f"{name:>9}: {results[name][0]*1000:9.1f} ms   RSS {results[name][1]:8.1f} MB")
+        print(f"  speedup: {results['legacy'][0] / max(results['compiled'][0], 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+bench_workers.py – per-worker memory as uvicorn workers are added
+
+Writes one synthetic catalog (stub_backend.write_catalog), then for every
+--workers count and sharing mode starts supervisor.py with benchmarks/stub_app.py
+as the app. It waits until each worker has loaded the catalog and run
+STUB_WARM_QUERIES retrievals (see stub_app.py), then reads /proc/<pid>/smaps_rollup
+of every worker:
+
+    RSS     resident pages, shared ones counted in full in every worker
+    PSS     resident pages with shared ones divided between their users;
+            the sum over workers is what the workers really cost
+    USS     private pages (Private_Clean + Private_Dirty): what one more
+            worker adds
+
+Modes:
+
+    shared   supervisor defaults: compiled cards mmapped (CARD_STORE=mmap),
+             CLIP weights mapped from SHARED_WEIGHTS
+    private  supervisor --no-share: every worker builds its own cards in memory
+             (CARD_STORE=memory) and loads its own weights
+
+The index, ids.npy, metadata and filter columns are mmapped in both modes.
+Without torch the stub model is not installed and the lifecycle stops at
+the model step ("failed" in /readyz), but the data side is measured the same
+way. The CLIP weights are only mapped with torch and open_clip installed and
+real SHARED_WEIGHTS.
+
+    python Backend/benchmarks/bench_workers.py --n 100000 --workers 1,2,4 --json workers.json
+"""
+
+import argparse, json, os, shutil, signal, socket, subprocess, sys, tempfile, time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, BENCHMARKS)
+
+MODES = {"shared": [], "private": ["--no-share"]}
+
+
+def smaps(pid: int) -> dict:
+    """RSS / PSS / USS of `pid` in MB (Linux)."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"rss_mb": round(fields["Rss"], 1), "pss_mb": round(fields["Pss"], 1),
+            "uss_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1)}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(catalog: str, workers: int, mode: str, warm_queries: int, timeout: float) -> dict:
+    """Start the supervisor, wait for every worker to report ready, measure, stop."""
+    ready_dir = tempfile.mkdtemp(prefix="mss-ready-")
+    env = {**os.environ, "STUB_CATALOG": catalog, "STUB_READY_DIR": ready_dir,
+           "STUB_WARM_QUERIES": str(warm_queries), "WARMUP": "0", "LOG_LEVEL": "WARNING",
+           "ARTIFACT_DIR": os.path.join(catalog, "compiled"),
+           "PYTHONPATH": os.pathsep.join([BENCHMARKS, BACKEND, os.environ.get("PYTHONPATH", "")])}
+    cmd = [sys.executable, os.path.join(BACKEND, "supervisor.py"), "--app", "stub_app:app",
+           "--workers", str(workers), "--host", "127.0.0.1", "--port", str(free_port()), *MODES[mode]]
+    proc = subprocess.Popen(cmd, env=env, cwd=BACKEND, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        deadline = time.monotonic() + timeout
+        while len(os.listdir(ready_dir)) < workers:
+            if proc.poll() is not None:
+                sys.exit(f"supervisor exited ({proc.returncode}):\n{proc.stderr.read()}")
+            if time.monotonic() > deadline:
+                sys.exit(f"{mode} x{workers}: workers not ready after {timeout:.0f}s")
+            time.sleep(0.2)
+        time.sleep(0.5)   # let the warm-up threads finish writing
+        pids = sorted(int(p) for p in os.listdir(ready_dir))
+        per_worker = [smaps(pid) for pid in pids]
+        return {
+            "supervisor": smaps(proc.pid),
+            "workers": per_worker,
+            "mean": {key: round(sum(w[key] for w in per_worker) / workers, 1) for key in per_worker[0]},
+            "total_pss_mb": round(sum(w["pss_mb"] for w in per_worker), 1),
+        }
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(ready_dir, ignore_errors=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=100_000, help="catalog size")
+    ap.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    ap.add_argument("--modes", default="shared,private", help=f"comma-separated, from {', '.join(MODES)}")
+    ap.add_argument("--layout", default="fused", help="fused or separate (late fusion) indexes")
+    ap.add_argument("--warm-queries", type=int, default=200, help="retrievals per worker before measuring")
+    ap.add_argument("--timeout", type=float, default=600, help="seconds to wait for the workers")
+    ap.add_argument("--workdir", default=None, help="where the catalog is written (reused between runs)")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    args = ap.parse_args()
+
+    import stub_backend
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mss-workers-")
+    catalog = os.path.join(workdir, f"catalog_{args.layout}_{args.n}")
+    results = {"meta": {"n": args.n, "layout": args.layout, "cpus": os.cpu_count()}, "runs": {}}
+    try:
+        t0 = time.perf_counter()
+        stub_backend.write_catalog(catalog, args.n, layout=args.layout)
+        print(f"catalog n={args.n:,} ready in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        for mode in args.modes.split(","):
+            for workers in (int(w) for w in args.workers.split(",")):
+                print(f"{mode} x{workers} ...", file=sys.stderr)
+                results["runs"][f"{mode} x{workers}"] = run(catalog, workers, mode, args.warm_queries, args.timeout)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\nn={args.n:,} {args.layout}, {os.cpu_count()} CPU(s); MB per worker (mean)\n")
+    print(f"{'run':<14} {'RSS':>8} {'PSS':>8} {'USS':>8} {'total PSS':>10} {'supervisor RSS':>15}")
+    for label, r in results["runs"].items():
+        m = r["mean"]
+        print(f"{label:<14} {m['rss_mb']:>8.1f} {m['pss_mb']:>8.1f} {m['uss_mb']:>8.1f} "
+              f"{r['total_pss_mb']:>10.1f} {r['supervisor']['rss_mb']:>15.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
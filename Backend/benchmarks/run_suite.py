@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+run_suite.py – reproducible end-to-end benchmark of the search path
+
+No model download and no real catalog: every run builds (or reuses) a
+synthetic catalog per --sizes entry and serves it through the deterministic
+stub CLIP from stub_backend.py, so numbers are comparable across machines
+and commits. Stages timed per catalog size:
+
+    parse           parse_semantic_query over a fixed query corpus
+    filter          filter_products over 2 000 candidate rows
+    faiss           retrieval, unfiltered and with a category mask (fused index,
+                    or both per-modality indexes with --layout separate)
+    build_results   result dicts for 100 ids
+    search_cold     search() end to end, result cache disabled   (needs torch)
+    search_cached   search() answered by the result cache        (needs torch)
+    search_many     search_many() over 64 distinct queries, cache off (needs torch)
+    api_*           /api/search (v1, v2), /api/search/paged + next page,
+                    /api/products_by_category, /healthz via TestClient
+
+    python Backend/benchmarks/run_suite.py --sizes 10000,100000 --json new.json
+    python Backend/benchmarks/run_suite.py --json new.json --baseline old.json --max-regression 0.15
+
+With --baseline, stages whose p50 grew by more than --max-regression are
+listed and the exit status is 1.
+"""
+
+import argparse, contextlib, io, json, logging, os, platform, shutil, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("WARMUP", "0")          # the suite warms up explicitly
+os.environ.setdefault("SEARCH_EXECUTOR", "thread")
+logging.basicConfig(level=logging.WARNING)   # keep per-request logs out of the timings
+
+import numpy as np
+
+import stub_backend
+import search_backend as sb
+
+QUERIES = [
+    "red dress",
+    "blue denim jacket",
+    "black leather shoes but not brown",
+    "floral summer dress with good reviews",
+    "white cotton shirt 4 stars",
+    "striped tshirt not green",
+    "watch",
+    "casual shoes for running",
+]
+
+
+def has_torch() -> bool:
+    try:
+        import torch  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def timeit(fn, inputs, min_time: float, max_iters: int = 10_000) -> dict:
+    """Call fn(x) cycling over `inputs` for at least `min_time` seconds; per-call latency stats."""
+    times = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):      # the backend logs every call
+        while (time.perf_counter() - start < min_time or len(times) < len(inputs)) and len(times) < max_iters:
+            x = inputs[len(times) % len(inputs)]
+            t0 = time.perf_counter()
+            fn(x)
+            times.append(time.perf_counter() - t0)
+    ms = np.array(times) * 1000
+    return {
+        "n": len(times),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "ops_per_s": round(1000 / float(ms.mean()), 1),
+    }
+
+
+def bench_pure(min_time: float) -> dict:
+    """Stages that need only the index and metadata."""
+    parsed = [sb.parse_semantic_query(q) for q in QUERIES]
+    rng = np.random.default_rng(0)
+    n = len(sb.PRODUCTS)
+    row_sets = [rng.choice(n, min(2000, n), replace=False) for _ in range(8)]
+    qvecs = rng.standard_normal((16, stub_backend.DIM)).astype(np.float32)
+    qvecs /= np.linalg.norm(qvecs, axis=1, keepdims=True)
+    dresses = sb.PRODUCTS.lower_eq_any("articleType", ["dresses"], np.arange(n))
+    allowed = np.flatnonzero(dresses) if dresses.any() else None
+    ids = [np.asarray(sb.IDS[i:i + 100]) for i in range(0, min(n, 800), 100)]
+
+    out = {}
+    out["parse"] = timeit(sb.parse_semantic_query, QUERIES, min_time)
+    out["filter"] = timeit(lambda i: sb.filter_products(row_sets[i], *parsed[i][:3]),
+                           list(range(len(parsed))), min_time)
+    if sb.MODAL_INDEXES is None:
+        retrieve = lambda q, mask: sb._retrieve(q, 100, mask)
+    else:
+        weights = sb._index_weights(None, has_text=True)
+        retrieve = lambda q, mask: sb._late_retrieve(q, 100, mask, None, None, weights)
+    out["faiss_unfiltered"] = timeit(lambda q: retrieve(q, None), list(qvecs), min_time)
+    if allowed is not None:
+        out["faiss_filtered"] = timeit(lambda q: retrieve(q, allowed), list(qvecs), min_time)
+    out["build_results"] = timeit(lambda i: sb.build_results(ids[i], parsed[i][:3]),
+                                  list(range(len(ids))), min_time)
+    return out
+
+
+def bench_model(min_time: float) -> dict:
+    """search() end to end through the stub encoder."""
+    out = {}
+    cache = sb.RESULT_CACHE
+    saved = cache.maxsize
+    try:
+        cache.maxsize = 0
+        out["search_cold"] = timeit(lambda q: sb.search(text=q, k=9), QUERIES, min_time)
+        image = sb._warmup_image((640, 480), seed=7)
+        out["search_image_cold"] = timeit(lambda q: sb.search(text=q, image_bytes=image, k=9),
+                                          QUERIES, min_time)
+        batch = [{"text": f"{q} {i}"} for i in range(8) for q in QUERIES]
+        out["search_many"] = timeit(lambda b: sb.search_many(b, k=9), [batch], min_time)
+    finally:
+        cache.maxsize = saved
+    for q in QUERIES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            sb.search(text=q, k=9)
+    out["search_cached"] = timeit(lambda q: sb.search(text=q, k=9), QUERIES, min_time)
+    return out
+
+
+def bench_api(min_time: float) -> dict:
+    """
+    FastAPI endpoints in-process. The backend is already loaded, so the
+    lifecycle finds data and model in place; it runs once per process, so
+    the category index is rebuilt here for every catalog size.
+    """
+    from fastapi.testclient import TestClient
+    import server
+    from lifecycle import LIFECYCLE
+
+    out = {}
+    with contextlib.redirect_stdout(io.StringIO()), TestClient(server.app) as client:
+        LIFECYCLE.wait(600)
+        if sb.model_loaded() and not LIFECYCLE.ready:
+            raise RuntimeError(f"backend not ready: {LIFECYCLE.status()}")
+        server.build_category_index()
+        out["api_healthz"] = timeit(lambda _: client.get("/healthz"), [None], min_time)
+        out["api_products_by_category"] = timeit(
+            lambda c: client.get("/api/products_by_category", params={"category": c, "limit": 24}),
+            ["Dresses", "Shoes", "Watches"], min_time)
+        if sb.model_loaded():
+            for v in (1, 2):
+                out[f"api_search_v{v}"] = timeit(
+                    lambda q: client.post("/api/search", data={"text": q, "limit": 24, "response_version": v}),
+                    QUERIES, min_time)
+            out["api_search_paged"] = timeit(
+                lambda q: client.post("/api/search/paged", data={"text": q, "limit": 24}), QUERIES, min_time)
+            cursors = [client.post("/api/search/paged", data={"text": q, "limit": 24}).json()["next_cursor"]
+                       for q in QUERIES]
+            cursors = [c for c in cursors if c]
+            if cursors:
+                out["api_search_next_page"] = timeit(
+                    lambda c: client.get("/api/search/paged", params={"cursor": c, "limit": 24}), cursors, min_time)
+    return out
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """[(key, old p50, new p50, ratio)] for stages slower than the baseline by more than max_regression."""
+    regressions = []
+    for key, stats in results["stages"].items():
+        old = baseline.get("stages", {}).get(key)
+        if not old or not old.get("p50_ms"):
+            continue
+        ratio = stats["p50_ms"] / old["p50_ms"]
+        print(f"  {key:<40} {old['p50_ms']:>10.3f} → {stats['p50_ms']:>10.3f} ms  ×{ratio:.2f}")
+        if ratio > 1 + max_regression:
+            regressions.append((key, old["p50_ms"], stats["p50_ms"], ratio))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000", help="comma-separated catalog sizes, e.g. 10000,100000,1000000")
+    ap.add_argument("--index-type", default="flat", help="ann_index type of the synthetic catalogs")
+    ap.add_argument("--layout", default="fused", choices=stub_backend.LAYOUTS,
+                    help="fused index, or separate text / image indexes (late fusion)")
+    ap.add_argument("--storage", default=None, help="fp32 / fp16 / sq8 vectors (flat, ivf_flat, hnsw)")
+    ap.add_argument("--workdir", default=None, help="where catalogs are written (reused between runs)")
+    ap.add_argument("--min-time", type=float, default=1.0, help="seconds spent per stage")
+    ap.add_argument("--stub-text-ms", type=float, default=0.0, help="simulated text-encoder latency")
+    ap.add_argument("--stub-image-ms", type=float, default=0.0, help="simulated image-encoder latency")
+    ap.add_argument("--no-api", action="store_true", help="skip the FastAPI endpoint stages")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    ap.add_argument("--baseline", default=None, help="earlier --json output to compare against")
+    ap.add_argument("--max-regression", type=float, default=0.15, help="allowed p50 slowdown vs baseline")
+    args = ap.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mss-bench-")
+    torch_ok = has_torch()
+    if not torch_ok:
+        print("torch not installed: search() and /api/search stages are skipped")
+
+    results = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                 "index_type": args.index_type, "layout": args.layout, "storage": args.storage,
+                 "stub_text_ms": args.stub_text_ms,
+                 "stub_image_ms": args.stub_image_ms, "torch": torch_ok},
+        "stages": {},
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            t0 = time.perf_counter()
+            directory = os.path.join(workdir, f"catalog_{args.index_type}_{size}")
+            with contextlib.redirect_stdout(io.StringIO()):
+                stub_backend.write_catalog(directory, size, args.index_type,
+                                           layout=args.layout, storage=args.storage)
+                stub_backend.install(sb, directory, model=torch_ok,
+                                     text_ms=args.stub_text_ms, image_ms=args.stub_image_ms)
+            print(f"\ncatalog n={size:,} ready in {time.perf_counter() - t0:.1f}s ({directory})")
+
+            stages = bench_pure(args.min_time)
+            if torch_ok:
+                stages.update(bench_model(args.min_time))
+            if not args.no_api:
+                stages.update(bench_api(args.min_time))
+            for name, stats in stages.items():
+                print(f"  {name:<26} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms"
+                      f"  {stats['ops_per_s']:>10.1f} ops/s")
+                results["stages"][f"{size}/{name}"] = stats
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\np50 vs {args.baseline}:")
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed by more than {args.max_regression:.0%}:")
+            for key, old, new, ratio in regressions:
+                print(f"  {key}: {old:.3f} → {new:.3f} ms (×{ratio:.2f})")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
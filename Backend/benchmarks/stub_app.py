@@ -0,0 +1,57 @@
+"""
+stub_app.py – server:app over a stub_backend catalog, for multi-worker runs
+
+    STUB_CATALOG=/tmp/catalog PYTHONPATH=Backend/benchmarks \
+        python Backend/supervisor.py --app stub_app:app --workers 4
+
+Every worker points search_backend at STUB_CATALOG (and the stub model when
+torch is installed) before the lifecycle loads anything, then serves the
+unchanged server app. Once the lifecycle has finished, the worker runs
+STUB_WARM_QUERIES retrievals plus result assembly, the way traffic would,
+so the mapped index and card pages are resident. With STUB_READY_DIR set it
+then writes an empty file named after its pid there.
+"""
+
+import os, threading
+
+import numpy as np
+
+import stub_backend
+import search_backend as sb
+from lifecycle import LIFECYCLE
+from server import app  # noqa: F401  (the served app)
+
+STUB_CATALOG      = os.environ["STUB_CATALOG"]
+STUB_READY_DIR    = os.environ.get("STUB_READY_DIR", "")
+STUB_WARM_QUERIES = int(os.environ.get("STUB_WARM_QUERIES", 200))
+
+
+def _has_torch() -> bool:
+    try:
+        import torch  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _warm() -> None:
+    LIFECYCLE.wait()
+    rng = np.random.default_rng(os.getpid())
+    qvecs = rng.standard_normal((STUB_WARM_QUERIES, stub_backend.DIM)).astype(np.float32)
+    qvecs /= np.linalg.norm(qvecs, axis=1, keepdims=True)
+    weights = sb._index_weights(None, has_text=True)
+    for q in qvecs:
+        if sb.MODAL_INDEXES is None:
+            rows, _ = sb._retrieve(q, 24, None)
+        else:
+            rows, _ = sb._late_retrieve(q, 24, None, None, None, weights)
+        sb.build_results(np.asarray(sb.IDS[rows]))
+    if sb.model_loaded():
+        for text in ("red dress", "blue denim jacket", "black leather shoes", "watch"):
+            sb.search(text=text, k=24)
+    if STUB_READY_DIR:
+        open(os.path.join(STUB_READY_DIR, str(os.getpid())), "w").close()
+
+
+stub_backend.install(sb, STUB_CATALOG, model=_has_torch())
+threading.Thread(target=_warm, name="stub-warm", daemon=True).start()
@@ -0,0 +1,187 @@
+"""
+stub_backend.py – deterministic stand-ins for CLIP and the product catalog
+
+    StubClip / stub_tokenize / stub_preprocess
+        hashed bag-of-words text tower and pooled-pixel image tower with fixed
+        random weights: same input → same vector on every machine, no model
+        download, microseconds per call (optionally padded with --stub-*-ms
+        sleeps to mimic the real encoder's latency)
+    write_catalog(directory, n, layout=..., storage=...)
+        synthetic products_with_reviews.jsonl / ids.npy / id-mapped index(es)
+        (+ compiled artifacts). A product's "text" vector is the stub text
+        embedding of its name, its "image" vector that of its colour and
+        article type (what a photo shows), each plus noise, so text queries
+        retrieve related items; layout picks the fused index, the two
+        per-modality indexes or all three, as Frontend/embed_products.py does
+
+install(sb, directory) points search_backend at a catalog and the stub model.
+"""
+
+import json, os, time, zlib
+
+import numpy as np
+
+DIM = 512
+CONTEXT_LENGTH = 77
+_BUCKETS = 4096      # hashed token embedding rows
+_SOT, _EOT = 49406, 49407
+
+_rng = np.random.default_rng(1234)
+_TOKEN_TABLE = _rng.standard_normal((_BUCKETS, DIM)).astype(np.float32)
+_PIXEL_PROJ = _rng.standard_normal((3 * 8 * 8, DIM)).astype(np.float32)
+
+COLOURS = ["Red", "Blue", "Green", "Yellow", "Black", "White", "Pink", "Purple", "Brown", "Orange", "Beige"]
+MATERIALS = ["", "", "Denim", "Leather", "Cotton", "Silk", "Wool", "Linen"]
+PATTERNS = ["", "", "", "Floral", "Striped", "Plaid", "Printed"]
+# (masterCategory, subCategory, articleType)
+ARTICLES = [
+    ("Apparel", "Dress", "Dresses"), ("Apparel", "Topwear", "Jackets"), ("Apparel", "Topwear", "Shirts"),
+    ("Apparel", "Topwear", "Tshirts"), ("Apparel", "Bottomwear", "Jeans"), ("Apparel", "Bottomwear", "Trousers"),
+    ("Footwear", "Shoes", "Casual Shoes"), ("Footwear", "Shoes", "Sports Shoes"),
+    ("Accessories", "Watches", "Watches"), ("Accessories", "Bags", "Handbags"),
+]
+
+
+# ─── text / image towers (numpy core) ───────────────────────────────────
+def token_ids(text: str) -> list:
+    words = "".join(c if c.isalnum() else " " for c in text.lower()).split()
+    ids = [_SOT] + [1 + zlib.crc32(w.encode()) % 49000 for w in words][:CONTEXT_LENGTH - 2] + [_EOT]
+    return ids + [0] * (CONTEXT_LENGTH - len(ids))
+
+
+def text_vectors(tokens: np.ndarray) -> np.ndarray:
+    """(N x 77) token ids → (N x DIM) unnormalised features."""
+    tokens = np.asarray(tokens, dtype=np.int64)
+    mask = (tokens > 0) & (tokens < _SOT)
+    out = np.zeros((len(tokens), DIM), dtype=np.float32)
+    for i, row in enumerate(tokens):
+        words = row[mask[i]]
+        out[i] = _TOKEN_TABLE[words % _BUCKETS].sum(0) if len(words) else _TOKEN_TABLE[0]
+    return out
+
+
+def image_vectors(pixels: np.ndarray) -> np.ndarray:
+    """(N x 3 x H x W) floats → (N x DIM) features from 8x8 average pooling."""
+    n, c, h, w = pixels.shape
+    pooled = pixels[:, :, :h - h % 8, :w - w % 8].reshape(n, c, 8, h // 8, 8, w // 8).mean((3, 5))
+    return (pooled.reshape(n, -1) - 0.5) @ _PIXEL_PROJ
+
+
+# ─── torch-facing stub model ─────────────────────────────────────────────
+def stub_tokenize(texts):
+    import torch
+    texts = [texts] if isinstance(texts, str) else texts
+    return torch.tensor([token_ids(t) for t in texts], dtype=torch.long)
+
+
+def stub_preprocess(img):
+    import torch
+    arr = np.asarray(img.convert("RGB").resize((224, 224)), dtype=np.float32) / 255.0
+    return torch.from_numpy(arr.transpose(2, 0, 1).copy())
+
+
+class StubClip:
+    """encode_text / encode_image with the ClipEncoder interface."""
+    kind = "stub"
+
+    def __init__(self, text_ms: float = 0.0, image_ms: float = 0.0):
+        self.text_ms, self.image_ms = text_ms, image_ms
+
+    def encode_text(self, tokens):
+        import torch
+        if self.text_ms:
+            time.sleep(self.text_ms / 1000)
+        return torch.from_numpy(text_vectors(tokens.cpu().numpy()))
+
+    def encode_image(self, images):
+        import torch
+        if self.image_ms:
+            time.sleep(self.image_ms / 1000)
+        return torch.from_numpy(image_vectors(images.cpu().numpy()))
+
+
+# ─── synthetic catalog ───────────────────────────────────────────────────
+def _doc(i: int, rng) -> dict:
+    master, sub, article = ARTICLES[i % len(ARTICLES)]
+    colour = COLOURS[(i // len(ARTICLES)) % len(COLOURS)]
+    material, pattern = MATERIALS[i % len(MATERIALS)], PATTERNS[i % len(PATTERNS)]
+    name = " ".join(w for w in (colour, material, pattern, article, str(i)) if w)
+    return {
+        "id": 10_000 + i, "productDisplayName": name,
+        "masterCategory": master, "subCategory": sub, "articleType": article, "baseColour": colour,
+        "price": float(100 + (i * 37) % 900), "discountPercent": float(i % 5 * 10),
+        "rating": round(3.0 + (i % 21) / 10, 1), "numReviews": int(i % 50),
+        "image_url": f"https://example.invalid/images/{10_000 + i}.jpg",
+        "reviews": ["Fits well and looks like the photo."] * int(rng.integers(1, 4)),
+    }
+
+
+LAYOUTS = {"fused": ("fused",), "separate": ("text", "image"), "both": ("fused", "text", "image")}
+
+
+def _unit_vectors(texts, rng, noise: float) -> np.ndarray:
+    v = text_vectors(np.array([token_ids(t) for t in texts]))
+    v /= np.linalg.norm(v, axis=1, keepdims=True)
+    v += noise * rng.standard_normal(v.shape).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def write_catalog(directory: str, n: int, index_type: str = "flat", seed: int = 0,
+                  layout: str = "fused", storage: str | None = None) -> dict:
+    """Write a catalog of `n` products (reused if already there); returns its file paths."""
+    import faiss
+    import ann_index, artifacts
+    from vocabulary import VOCAB_WORDS
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {
+        "data": os.path.join(directory, "products_with_reviews.jsonl"),
+        "ids": os.path.join(directory, "ids.npy"),
+        "index": os.path.join(directory, "products.index"),
+        "compiled": os.path.join(directory, "compiled"),
+    }
+    targets = {t: paths["index"] if t == "fused" else ann_index.modal_path(paths["index"], t)
+               for t in LAYOUTS[layout]}
+    params = ann_index.resolved_params(index_type, n, storage=storage)
+    metas = [ann_index.read_index_meta(p) for p in targets.values() if os.path.exists(p)]
+    if (len(metas) == len(targets) and
+            all(m.get("ntotal") == n and m.get("type") == index_type and m.get("params") == params for m in metas)):
+        return paths
+
+    rng = np.random.default_rng(seed)
+    docs = [_doc(i, rng) for i in range(n)]
+    with open(paths["data"], "w") as f:
+        for d in docs:
+            f.write(json.dumps(d) + "\n")
+    ids = np.array([d["id"] for d in docs], dtype=np.int32)
+    np.save(paths["ids"], ids)
+
+    vecs = {"text": np.empty((n, DIM), dtype=np.float32), "image": np.empty((n, DIM), dtype=np.float32)}
+    for start in range(0, n, 10_000):
+        chunk = docs[start:start + 10_000]
+        vecs["text"][start:start + len(chunk)] = _unit_vectors([d["productDisplayName"] for d in chunk], rng, 0.05)
+        vecs["image"][start:start + len(chunk)] = _unit_vectors(
+            [f"{d['baseColour']} {d['articleType']}" for d in chunk], rng, 0.05)
+    vecs["fused"] = vecs["text"] + vecs["image"]
+    faiss.normalize_L2(vecs["fused"])
+
+    for target, path in targets.items():
+        index = faiss.IndexIDMap2(ann_index.build_index(vecs[target], index_type, **params))
+        index.add_with_ids(vecs[target], ids.astype(np.int64))
+        ann_index.write_index(index, path, {"type": index_type, "params": params, "id_map": True,
+                                            "modality": target})
+    for target in set(LAYOUTS["both"]) - set(targets):   # another layout written here before
+        path = paths["index"] if target == "fused" else ann_index.modal_path(paths["index"], target)
+        for stale in (path, ann_index.meta_path(path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+    artifacts.compile_artifacts(paths["data"], paths["ids"], paths["compiled"], name_terms=VOCAB_WORDS)
+    return paths
+
+
+def install(sb, directory: str, model: bool = True, text_ms: float = 0.0, image_ms: float = 0.0) -> None:
+    """Load `directory`'s catalog into search_backend and, with `model`, serve through StubClip."""
+    sb.load_data(directory)
+    if model:
+        stub = StubClip(text_ms, image_ms)
+        sb.install_model(stub, stub_preprocess, stub_tokenize, stub)
@@ -0,0 +1,205 @@
+"""
+cards.py – result cards normalized once per catalog load
+
+A card is the JSON-ready part of a result that never changes between
+queries: id, name, image (image_url or image_filename), rating, numReviews,
+price and discount already converted to their response types, with `rank`
+and `why` placeholders in response key order. Next to it the store keeps
+the lower-cased fields the `why` explanation and the category endpoints
+look at.
+
+Building a response is then a gather over product ids plus the per-query
+fields: {**card, "rank": r, "why": w} is one C-level dict copy per hit.
+search results, paged results and category pages all come from here;
+category pages keep their own shape (browse_card: no rank, patch None).
+
+MappedCardStore serves the cards from the compiled cards.* artifacts: opening
+it is a few mmaps, and several worker processes (supervisor.py) share one
+copy in the page cache, each card decoded when a response needs it. It is
+the default whenever the artifacts are current. CardStore builds the cards
+as Python objects in the process, for uncompiled catalogs or CARD_STORE=memory.
+"""
+
+from collections.abc import Mapping as MappingABC
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple
+
+import artifacts
+from query_parser import mentions, term
+
+DEFAULT_WHY = "Matched based on your search criteria"
+
+
+class Facets(NamedTuple):
+    article_type: str   # lower-cased articleType
+    base_colour: str    # lower-cased baseColour
+    name: str           # lower-cased productDisplayName
+    master: str | None  # masterCategory as stored
+    sub: str | None     # subCategory as stored
+    article: str | None # articleType as stored
+
+
+def _float_or(value, default):
+    return float(value) if value is not None else default
+
+
+def make_card(p: Mapping[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": int(p["id"]),
+        "rank": 0,
+        "name": p["productDisplayName"],
+        "image": p.get("image_url") or p.get("image_filename"),
+        "rating": _float_or(p.get("rating"), 0),
+        "numReviews": int(p.get("numReviews") or 0),
+        "price": _float_or(p.get("price"), None),
+        "discount": _float_or(p.get("discountPercent"), None),
+        "why": "",
+    }
+
+
+def browse_card(card: Mapping[str, Any]) -> Dict[str, Any]:
+    """Category-browse shape of a card: no `rank`, empty `why`, `patch` None (as before the shared cards)."""
+    out = {k: v for k, v in card.items() if k != "rank"}
+    out["why"] = ""
+    out["patch"] = None
+    return out
+
+
+def _facets(p: Mapping[str, Any]) -> Facets:
+    return Facets((p.get("articleType") or "").lower(), (p.get("baseColour") or "").lower(),
+                  (p.get("productDisplayName") or "").lower(),
+                  p.get("masterCategory"), p.get("subCategory"), p.get("articleType"))
+
+
+class CardStore:
+    def __init__(self, docs: Mapping[int, Mapping[str, Any]]):
+        self.cards: Dict[int, Dict[str, Any]] = {}
+        self.facets: Dict[int, Facets] = {}
+        for pid, p in docs.items():
+            try:
+                self.cards[pid] = make_card(p)
+                self.facets[pid] = _facets(p)
+            except (KeyError, TypeError, ValueError):
+                continue   # malformed record: never returned, as before
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __contains__(self, pid) -> bool:
+        return pid in self.cards
+
+    def get(self, pid: int) -> Dict[str, Any] | None:
+        return self.cards.get(pid)
+
+    def pages(self, product_ids: Iterable) -> List[Dict[str, Any]]:
+        """browse_card()s for `product_ids` (unknown ids skipped)."""
+        cards = self.cards
+        return [browse_card(card) for card in map(cards.get, product_ids) if card is not None]
+
+    def results(self, product_ids: Iterable, semantic_components=None, start_rank: int = 1) -> List[Dict[str, Any]]:
+        """Result dicts for ranked ids (unknown ids skipped) with rank and `why` filled in."""
+        cards, facets = self.cards, self.facets
+        explain = _Explainer(semantic_components) if semantic_components else None
+        out = []
+        for pid in product_ids:
+            pid = int(pid)
+            card = cards.get(pid)
+            if card is None:
+                continue
+            why = explain(facets[pid]) if explain else DEFAULT_WHY
+            out.append({**card, "rank": start_rank + len(out), "why": why})
+        return out
+
+
+# ─── compiled artifact form ──────────────────────────────────────────────
+def write_cards(docs: Iterable[Mapping[str, Any]], directory: str) -> None:
+    """Pack every well-formed product's card and facets as cards.* records (catalog order)."""
+    def records():
+        for p in docs:
+            try:
+                card = make_card(p)
+                yield card["id"], {"card": card, "facets": list(_facets(p))}
+            except (KeyError, TypeError, ValueError):
+                continue
+    artifacts.write_records(records(), directory, prefix="cards")
+
+
+class _RecordField(MappingABC):
+    """Read-only {product_id: value} view of one field of the packed card records."""
+
+    def __init__(self, records: artifacts.MetaStore, convert):
+        self._records = records
+        self._convert = convert
+
+    def __getitem__(self, pid):
+        return self._convert(self._records[pid])
+
+    def __contains__(self, pid) -> bool:
+        return pid in self._records
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def items(self):
+        return ((pid, self._convert(r)) for pid, r in self._records.items())
+
+
+def _card(record) -> Dict[str, Any]:
+    return record["card"]
+
+
+def _record_facets(record) -> Facets:
+    return Facets(*record["facets"])
+
+
+class MappedCardStore(CardStore):
+    """
+    CardStore over the compiled cards.* artifacts. `cards` and `facets` are
+    views decoding one record per lookup (each lookup returns a fresh card
+    dict); results() and pages() look up all their ids at once and decode
+    each hit once.
+    """
+
+    def __init__(self, directory: str):
+        self._records = artifacts.MetaStore(directory, prefix="cards")
+        self.cards = _RecordField(self._records, _card)
+        self.facets = _RecordField(self._records, _record_facets)
+
+    def _decode(self, product_ids: Iterable) -> List[dict]:
+        pos = self._records.positions([int(pid) for pid in product_ids])
+        return self._records.records(pos[pos >= 0])
+
+    def pages(self, product_ids: Iterable) -> List[Dict[str, Any]]:
+        return [browse_card(r["card"]) for r in self._decode(product_ids)]
+
+    def results(self, product_ids: Iterable, semantic_components=None, start_rank: int = 1) -> List[Dict[str, Any]]:
+        explain = _Explainer(semantic_components) if semantic_components else None
+        out = []
+        for rank, record in enumerate(self._decode(product_ids), start_rank):
+            card = record["card"]   # decoded for this call: filled in place, no copy
+            card["rank"] = rank
+            card["why"] = explain(Facets(*record["facets"])) if explain else DEFAULT_WHY
+            out.append(card)
+        return out
+
+
+class _Explainer:
+    """`why` text for one query's parsed components, prepared once per result list."""
+
+    def __init__(self, semantic_components):
+        target_items, target_descriptors, _ = semantic_components
+        self.items = [(item, term(item)) for item in target_items.values()]
+        self.descriptors = [(d, term(d)) for d in dict.fromkeys(d for ds in target_descriptors.values() for d in ds)]
+
+    def __call__(self, f: Facets) -> str:
+        # article types keep the baseline substring match ("shirt" explains "tshirts");
+        # names match whole words only, like the query parser and the name filters
+        reasons = [item for item, t in self.items if item in f.article_type or mentions(t, f.name)]
+        for desc, t in self.descriptors:
+            if (desc == f.base_colour or mentions(t, f.name)) and desc not in reasons:
+                reasons.append(desc)
+        if reasons:
+            return f"Matched: **{' '.join(reasons)} {f.article_type}**"
+        return f"Matched: **{f.base_colour} {f.article_type}** similar to your query"
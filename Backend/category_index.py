@@ -0,0 +1,66 @@
+"""
+category_index.py – startup-built inverted index for category browsing
+
+Maps normalized articleType, CATEGORY_MAPPING keys and masterCategory to
+posting lists of product ids (catalog order). Pages are slices over those
+lists gathered from the shared cards.CardStore, so browsing builds nothing
+per request.
+"""
+
+from typing import Any, Dict, List, Mapping
+
+from cards import CardStore
+
+
+def normalize_category(category: str) -> str:
+    return category.strip().lower().replace(" ", "").replace("-", "").replace("_", "")
+
+
+class CategoryIndex:
+    def __init__(self, cards: CardStore, category_mapping: Mapping[str, dict]):
+        self.cards = cards   # shared with search results; pages come back as cards.browse_card()s
+        self.by_article: Dict[str, List[int]] = {}
+        self.by_master: Dict[str, List[int]] = {}
+        article_types = set()
+        by_article_master: Dict[tuple, List[int]] = {}   # (normalized articleType, masterCategory) → ids
+        order: Dict[int, int] = {}
+
+        # one pass over the facets (a MappedCardStore decodes each record once)
+        for i, (pid, f) in enumerate(cards.facets.items()):
+            order[pid] = i
+            article_type = f.article or ""
+            if article_type:
+                article_types.add(article_type)
+            norm_article = normalize_category(article_type)
+            self.by_article.setdefault(norm_article, []).append(pid)
+            by_article_master.setdefault((norm_article, f.master), []).append(pid)
+            if f.master:
+                self.by_master.setdefault(normalize_category(f.master), []).append(pid)
+
+        # special mappings: same master category and a sub-category contained in articleType
+        self.by_mapping: Dict[str, List[int]] = {}
+        for key, info in category_mapping.items():
+            subs = [normalize_category(sub) for sub in info["subCategories"]]
+            postings = []
+            for (norm_article, master), pids in by_article_master.items():
+                if master == info["masterCategory"] and any(sub in norm_article for sub in subs):
+                    postings.extend(pids)
+            self.by_mapping[normalize_category(key)] = sorted(postings, key=order.__getitem__)
+
+        self.article_types: List[str] = sorted(article_types)
+
+    def lookup(self, category: str) -> List[int]:
+        """
+        Posting list for a category: special mapping first, then exact
+        normalized articleType, then masterCategory.
+        """
+        norm = normalize_category(category)
+        return (self.by_mapping.get(norm)
+                or self.by_article.get(norm)
+                or self.by_master.get(norm)
+                or [])
+
+    def page(self, category: str, offset: int = 0, limit: int | None = None) -> List[Dict[str, Any]]:
+        pids = self.lookup(category)
+        end = None if limit is None else offset + limit
+        return self.cards.pages(pids[offset:end])
@@ -0,0 +1,150 @@
+"""
+encoders.py – selectable CPU inference backends for the CLIP text / image towers
+
+ENCODER_BACKEND picks how encode_text / encode_image run:
+
+    eager        open_clip model as loaded (fp32 on CPU)
+    int8         torch dynamic quantization of every nn.Linear to int8
+    torchscript  traced + frozen towers (torch.jit.optimize_for_inference)
+    compile      torch.compile of each tower (dynamic batch)
+    onnx         towers exported to ONNX and run with onnxruntime's CPU provider
+
+Every backend returns raw (unnormalised) float32 features, like the model's own
+encode_* methods. A backend that cannot be built here (missing package, export
+failure) falls back to eager with a notice, so a bad setting never stops the
+server. On CUDA only eager is used. Accuracy and speed per backend are checked
+by benchmarks/bench_encoders.py.
+"""
+
+import copy, logging, os
+from typing import Callable
+
+import numpy as np
+import torch
+
+ENCODER_BACKENDS = ("eager", "int8", "torchscript", "compile", "onnx")
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "eager")
+# where the onnx backend caches its exported graphs
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx"))
+CONTEXT_LENGTH = 77
+
+log = logging.getLogger(__name__)
+
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens):
+        return self.model.encode_text(tokens)
+
+
+class _ImageTower(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, images):
+        return self.model.encode_image(images)
+
+
+class ClipEncoder:
+    """encode_text(tokens) / encode_image(batch) → float32 features for one backend."""
+
+    def __init__(self, kind: str, text_fn: Callable, image_fn: Callable):
+        self.kind = kind
+        self._text_fn = text_fn
+        self._image_fn = image_fn
+
+    def encode_text(self, tokens: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self._text_fn(tokens).float()
+
+    def encode_image(self, images: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self._image_fn(images).float()
+
+
+def _example_inputs(image_size: int):
+    tokens = torch.zeros(2, CONTEXT_LENGTH, dtype=torch.long)
+    tokens[:, 0], tokens[:, 1] = 49406, 49407   # <start> <end>
+    return tokens, torch.zeros(2, 3, image_size, image_size)
+
+
+def _image_size(model) -> int:
+    size = getattr(model.visual, "image_size", 224)
+    return size[0] if isinstance(size, (tuple, list)) else int(size)
+
+
+def _eager(model):
+    return ClipEncoder("eager", model.encode_text, model.encode_image)
+
+
+def _int8(model):
+    qmodel = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(),
+                                                    {torch.nn.Linear}, dtype=torch.qint8)
+    return ClipEncoder("int8", qmodel.encode_text, qmodel.encode_image)
+
+
+def _torchscript(model):
+    tokens, images = _example_inputs(_image_size(model))
+    with torch.no_grad():
+        text = torch.jit.optimize_for_inference(torch.jit.trace(_TextTower(model).eval(), tokens))
+        image = torch.jit.optimize_for_inference(torch.jit.trace(_ImageTower(model).eval(), images))
+    return ClipEncoder("torchscript", text, image)
+
+
+def _compile(model):
+    text = torch.compile(_TextTower(model).eval(), dynamic=True)
+    image = torch.compile(_ImageTower(model).eval(), dynamic=True)
+    return ClipEncoder("compile", text, image)
+
+
+def _onnx(model, model_name: str = "clip"):
+    import onnxruntime as ort
+
+    os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+    size = _image_size(model)
+    tokens, images = _example_inputs(size)
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    def session(tower, example, name):
+        path = os.path.join(ONNX_CACHE_DIR, f"{model_name}-{name}-{size}.onnx")
+        if not os.path.exists(path):
+            tmp = path + ".tmp"
+            with torch.no_grad():
+                torch.onnx.export(tower.eval(), example, tmp, input_names=["input"], output_names=["features"],
+                                  dynamic_axes={"input": {0: "batch"}, "features": {0: "batch"}},
+                                  opset_version=17)
+            os.replace(tmp, path)
+        sess = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        return lambda x: torch.from_numpy(np.asarray(sess.run(None, {"input": x.cpu().numpy()})[0]))
+
+    return ClipEncoder("onnx", session(_TextTower(model), tokens, "text"),
+                       session(_ImageTower(model), images, "image"))
+
+
+_BUILDERS = {"eager": _eager, "int8": _int8, "torchscript": _torchscript, "compile": _compile, "onnx": _onnx}
+
+
+def build_encoder(model, kind: str = ENCODER_BACKEND, device: str = "cpu", model_name: str = "clip") -> ClipEncoder:
+    """Wrap `model` in the requested backend; falls back to eager if it cannot be built."""
+    if kind not in _BUILDERS:
+        raise ValueError(f"Unknown ENCODER_BACKEND {kind!r}; expected one of {ENCODER_BACKENDS}")
+    if device != "cpu" and kind != "eager":
+        log.warning("Encoder backend %r is CPU-only - using eager on %s", kind, device)
+        kind = "eager"
+    try:
+        encoder = _onnx(model, model_name) if kind == "onnx" else _BUILDERS[kind](model)
+        # one tiny pass so trace / compile / session errors surface here, not on a request
+        tokens, images = _example_inputs(_image_size(model))
+        encoder.encode_text(tokens[:1].to(device))
+        encoder.encode_image(images[:1].to(device))
+        return encoder
+    except Exception as e:
+        if kind == "eager":
+            raise
+        log.warning("Encoder backend %r unavailable (%s: %s) - using eager", kind, type(e).__name__, e)
+        return _eager(model)
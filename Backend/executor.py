@@ -0,0 +1,128 @@
+"""
+executor.py – run the CPU-heavy search pipeline off the asyncio event loop
+
+The FastAPI handlers await `SEARCH_EXECUTOR.submit(search, ...)`; the call runs
+in a thread pool (default) or a process pool behind a bounded admission queue,
+so one slow image query never blocks `/` or the category endpoints.
+
+Thread mode shares the single model / index loaded by search_backend (torch and
+FAISS release the GIL during inference, and the encoder micro-batcher merges
+concurrent encodes). Process mode gives every worker its own interpreter: each
+worker imports search_backend once in its initializer and keeps that state for
+its lifetime, with torch threads split between workers. The initializer
+also loads the backend and warms it up (unless WARMUP=0, as in thread mode),
+and prime() starts every worker up front so none of them pays that cost on a
+live request. The API process itself then loads only the index and metadata
+(see lifecycle.py), not a model of its own.
+
+Calls run under telemetry.run_traced(), so the stage spans recorded on the
+worker come back with the result and are merged into /metrics and the
+request's timing in the API process.
+"""
+
+import asyncio, functools, multiprocessing, os, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+import telemetry
+
+SEARCH_EXECUTOR_KIND = os.environ.get("SEARCH_EXECUTOR", "thread")        # thread | process
+SEARCH_WORKERS       = int(os.environ.get("SEARCH_WORKERS", min(4, os.cpu_count() or 1)))
+SEARCH_MAX_PENDING   = int(os.environ.get("SEARCH_MAX_PENDING", 64))
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised when the admission queue is full; the API maps it to 503."""
+
+
+def _init_process_worker(torch_threads: int) -> None:
+    import torch
+    torch.set_num_threads(max(1, torch_threads))
+    import search_backend
+    from lifecycle import WARMUP_ENABLED
+    # load model, index and metadata once per worker, warm before the first search
+    search_backend.load()
+    if WARMUP_ENABLED:
+        search_backend.warm_up()
+
+
+def _worker_pid(hold: float) -> int:
+    time.sleep(hold)   # keep the worker busy so the pool starts the others
+    return os.getpid()
+
+
+class SearchExecutor:
+    def __init__(self, kind: str = SEARCH_EXECUTOR_KIND,
+                 workers: int = SEARCH_WORKERS,
+                 max_pending: int = SEARCH_MAX_PENDING):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._pending = 0
+        self._pool: Executor | None = None
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker,
+                    initargs=(torch_threads,),
+                )
+            elif self.kind == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="search")
+            else:
+                raise ValueError(f"Unknown SEARCH_EXECUTOR kind: {self.kind!r}")
+        return self._pool
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` in the pool. At most `max_pending` calls may be
+        queued or running at once; beyond that ExecutorBusy is raised immediately.
+        """
+        if self._pending >= self.max_pending:
+            raise ExecutorBusy(f"{self._pending} searches pending (limit {self.max_pending})")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, spans = await loop.run_in_executor(
+                self._get_pool(), functools.partial(telemetry.run_traced, fn, *args, **kwargs))
+            telemetry.merge(spans)
+            return result
+        finally:
+            self._pending -= 1
+
+    def prime(self) -> int:
+        """
+        Start every process worker now (each runs its load + warm-up initializer)
+        and return how many answered. Thread workers share the caller's
+        already-loaded backend, so there is nothing to do for them.
+        """
+        if self.kind != "process":
+            return 0
+        pool = self._get_pool()
+        futures = [pool.submit(_worker_pid, 0.05) for _ in range(self.workers)]
+        wait(futures)
+        return len({f.result() for f in futures})
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+        }
+
+
+SEARCH_EXECUTOR = SearchExecutor()
@@ -0,0 +1,141 @@
+"""
+image_cache.py – content-addressed cache of query-image work
+
+Maps a hash of the uploaded bytes to what search() derives from them: the
+zoom-patch embedding, its visual tags and the preview thumbnail. A repeat
+upload (same screenshot, the frontend's example-image chips) then skips
+decode, crop, resize and the image encoder entirely.
+
+Two tiers:
+    memory  LRUCache bounded by entries (IMAGE_CACHE_SIZE)
+    disk    optional (IMAGE_CACHE_DIR), one small JSON file per entry,
+            bounded by IMAGE_CACHE_DISK_MB with least-recently-used files
+            deleted first; survives restarts and is shared by process workers
+
+Keys also cover the model and ingest settings (`namespace`), so changing the
+model, encoder backend or crop / preview size never serves stale entries.
+"""
+
+import base64, hashlib, json, logging, os, threading
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+from caching import LRUCache
+
+IMAGE_CACHE_SIZE    = int(os.environ.get("IMAGE_CACHE_SIZE", 1024))
+IMAGE_CACHE_DIR     = os.environ.get("IMAGE_CACHE_DIR", "")          # empty = memory only
+IMAGE_CACHE_DISK_MB = float(os.environ.get("IMAGE_CACHE_DISK_MB", 256))
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ImageEntry:
+    vec: np.ndarray      # float32 (D,) L2-normalised zoom-patch embedding
+    tags: List[str]      # _patch_tags_from_embed(vec)
+    preview: str         # data: URI of the preview thumbnail
+
+
+class ImageEmbeddingCache:
+    def __init__(self, maxsize: int = IMAGE_CACHE_SIZE, disk_dir: str = IMAGE_CACHE_DIR,
+                 disk_max_bytes: int = int(IMAGE_CACHE_DISK_MB * 1024 * 1024), namespace: str = ""):
+        self._memory = LRUCache(maxsize)
+        self.namespace = namespace
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(e.stat().st_size for e in os.scandir(self.disk_dir)
+                                   if e.name.endswith(".json"))
+
+    def key(self, image_bytes: bytes) -> str:
+        h = hashlib.blake2b(image_bytes, digest_size=20)
+        h.update(self.namespace.encode())
+        return h.hexdigest()
+
+    # ─── disk tier ──────────────────────────────────────────────────────
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> ImageEntry | None:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                raw = json.load(f)
+            os.utime(path)   # mtime doubles as last-use time for eviction
+            vec = np.frombuffer(base64.b64decode(raw["vec"]), dtype=np.float32).copy()
+            return ImageEntry(vec, list(raw["tags"]), raw["preview"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_put(self, key: str, entry: ImageEntry) -> None:
+        blob = json.dumps({
+            "vec": base64.b64encode(np.ascontiguousarray(entry.vec, dtype=np.float32).tobytes()).decode(),
+            "tags": entry.tags,
+            "preview": entry.preview,
+        }).encode()
+        if len(blob) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            with self._disk_lock:
+                try:
+                    replaced = os.stat(path).st_size   # overwriting a key frees the old entry's bytes
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, path)
+                self._disk_bytes += len(blob) - replaced
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._evict_disk()
+        except OSError as e:
+            log.warning("Image cache write failed: %s", e)
+
+    def _evict_disk(self) -> None:
+        """Delete least-recently-used files until the tier is back under 90% of its bound."""
+        entries = sorted((e for e in os.scandir(self.disk_dir) if e.name.endswith(".json")),
+                         key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if total <= 0.9 * self.disk_max_bytes:
+                break
+            try:
+                size = e.stat().st_size
+                os.remove(e.path)
+                total -= size
+                self.disk_evictions += 1
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    # ─── public API ─────────────────────────────────────────────────────
+    def get(self, image_bytes: bytes) -> ImageEntry | None:
+        key = self.key(image_bytes)
+        entry = self._memory.get(key)
+        if entry is None and self.disk_dir:
+            entry = self._disk_get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._memory.put(key, entry)
+        return entry
+
+    def put(self, image_bytes: bytes, entry: ImageEntry) -> None:
+        key = self.key(image_bytes)
+        self._memory.put(key, entry)
+        if self.disk_dir:
+            self._disk_put(key, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self._memory.stats(),
+            "disk": {"dir": self.disk_dir, "bytes": self._disk_bytes, "max_bytes": self.disk_max_bytes,
+                     "hits": self.disk_hits, "evictions": self.disk_evictions} if self.disk_dir else None,
+        }
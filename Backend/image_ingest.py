@@ -0,0 +1,111 @@
+"""
+image_ingest.py – bounded, reduced-size decoding of uploaded query images
+
+An upload goes through one pass:
+
+    byte limit → header-only open → pixel limit → JPEG draft decode
+    (DCT scaling to the smallest 1/2, 1/4, 1/8 size that still covers the
+    model input) → center-zoom crop resized once to model resolution
+    → small JPEG preview of the same crop
+
+so a 12 MP phone photo is never decoded, resized or re-encoded at full size.
+"""
+
+import base64, io, math, os, warnings
+from dataclasses import dataclass
+
+from PIL import Image
+
+MAX_UPLOAD_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 15 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 40_000_000))
+MODEL_SIZE       = int(os.environ.get("IMAGE_MODEL_SIZE", 224))    # CLIP input side
+PREVIEW_SIZE     = int(os.environ.get("PREVIEW_MAX_SIDE", 256))    # longest side of patch preview
+PREVIEW_QUALITY  = int(os.environ.get("PREVIEW_QUALITY", 80))
+ZOOM             = 1.2
+
+# PIL only warns between its own MAX_IMAGE_PIXELS and twice that; in the server an
+# upload that size is rejected like any other over-limit image, never decoded
+warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+
+class ImageTooLarge(ValueError):
+    """Upload exceeds the byte or pixel limit; the API maps it to 413."""
+
+
+class InvalidImage(ValueError):
+    """Upload is not a decodable image."""
+
+
+@dataclass
+class QueryImage:
+    model_image: Image.Image   # center-zoom crop, shortest side == MODEL_SIZE
+    preview_uri: str           # data: URI of the same crop, longest side <= PREVIEW_SIZE
+    source_size: tuple         # (w, h) of the upload as stored
+
+
+def _open(data: bytes) -> Image.Image:
+    """Header-only open with both limits enforced; pixels are not decoded yet."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ImageTooLarge(f"image is {len(data)} bytes (limit {MAX_UPLOAD_BYTES})")
+    try:
+        img = Image.open(io.BytesIO(data))
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        raise ImageTooLarge(f"image exceeds PIL's decompression-bomb limit: {e}") from e
+    except Exception as e:
+        raise InvalidImage(f"cannot read image: {e}") from e
+    w, h = img.size
+    if w * h > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"image is {w}x{h} pixels (limit {MAX_IMAGE_PIXELS})")
+    return img
+
+
+def check_upload(data: bytes) -> tuple | None:
+    """
+    Enforce the limits from the header alone; returns the image (w, h), or
+    None for an unreadable upload (search() then ignores the image as before).
+    """
+    try:
+        return _open(data).size
+    except InvalidImage:
+        return None
+
+
+def _zoom_box(w: int, h: int, zoom: float) -> tuple:
+    cw, ch = w / zoom, h / zoom
+    left, top = (w - cw) / 2, (h - ch) / 2
+    return (left, top, left + cw, top + ch)
+
+
+def _scaled(w: int, h: int, short_side: int) -> tuple:
+    s = short_side / min(w, h)
+    return max(1, round(w * s)), max(1, round(h * s))
+
+
+def prepare_query_image(data: bytes, zoom: float = ZOOM) -> QueryImage:
+    """Decode `data` at reduced size and return the model-ready crop plus its preview."""
+    img = _open(data)
+    source_size = img.size
+    # the crop is 1/zoom of the frame and must still cover MODEL_SIZE / PREVIEW_SIZE
+    need = math.ceil(max(MODEL_SIZE, PREVIEW_SIZE) * zoom)
+    if img.format == "JPEG" and min(img.size) > need:
+        img.draft("RGB", _scaled(*img.size, need))
+    try:
+        img = img.convert("RGB")
+    except Exception as e:
+        raise InvalidImage(f"cannot decode image: {e}") from e
+
+    w, h = img.size
+    box = _zoom_box(w, h, zoom)
+    crop_w, crop_h = box[2] - box[0], box[3] - box[1]
+    # crop + resize in one pass straight to model resolution (never back up to full size)
+    model_size = _scaled(crop_w, crop_h, MODEL_SIZE) if min(crop_w, crop_h) > MODEL_SIZE \
+        else (round(crop_w), round(crop_h))
+    model_image = img.resize(model_size, Image.BICUBIC, box=box, reducing_gap=3.0)
+
+    p = min(1.0, PREVIEW_SIZE / max(crop_w, crop_h))
+    preview = img.resize((max(1, round(crop_w * p)), max(1, round(crop_h * p))),
+                         Image.BICUBIC, box=box, reducing_gap=3.0)
+    buf = io.BytesIO()
+    preview.save(buf, format="JPEG", quality=PREVIEW_QUALITY, optimize=True)
+    preview_uri = "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+    return QueryImage(model_image, preview_uri, source_size)
@@ -0,0 +1,95 @@
+"""
+lifecycle.py – background load and warm-up of the search backend
+
+The server starts answering immediately; a daemon thread opens the index and
+metadata, loads CLIP and runs search_backend.warm_up(). In process-executor
+mode every search runs in the workers, which load and warm up CLIP
+themselves, so the API process loads only the data and starts the workers
+instead of holding a model copy of its own. States:
+
+    starting → loading → warming → ready
+                       ↘ failed (error kept for /readyz)
+
+/healthz only says the process is alive; /readyz turns 200 once `ready`.
+"""
+
+import logging, os, threading, time
+from typing import Callable, Dict, List
+
+WARMUP_ENABLED = os.environ.get("WARMUP", "1") == "1"
+
+log = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    def __init__(self, warm_up: bool = WARMUP_ENABLED):
+        self.state = "starting"
+        self.error: str | None = None
+        self.timings: Dict[str, float] = {}
+        self._warm_up = warm_up
+        self._on_data: List[Callable[[], None]] = []
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def on_data_loaded(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Register `fn` to run once the index and metadata are open (before the model loads)."""
+        self._on_data.append(fn)
+        return fn
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="lifecycle", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        import search_backend
+        from executor import SEARCH_EXECUTOR
+        try:
+            self.state = "loading"
+            t0 = time.perf_counter()
+            search_backend.load_data()
+            self.timings["data_s"] = time.perf_counter() - t0
+            for fn in self._on_data:
+                fn()
+
+            if SEARCH_EXECUTOR.kind == "process":
+                # each worker loads and warms up CLIP in its initializer
+                self.state = "warming"
+                t0 = time.perf_counter()
+                SEARCH_EXECUTOR.prime()
+                self.timings["workers_s"] = time.perf_counter() - t0
+            else:
+                t0 = time.perf_counter()
+                search_backend.load_model()
+                self.timings["model_s"] = time.perf_counter() - t0
+
+                if self._warm_up:
+                    self.state = "warming"
+                    t0 = time.perf_counter()
+                    search_backend.warm_up()
+                    self.timings["warmup_s"] = time.perf_counter() - t0
+            self.state = "ready"
+            log.info("Search backend ready: %s", self.status())
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            log.exception("Search backend failed to start: %s", e)
+        finally:
+            self._ready.set()
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "timings": {k: round(v, 3) for k, v in self.timings.items()},
+        }
+
+
+LIFECYCLE = Lifecycle()
@@ -0,0 +1,95 @@
+"""
+pagination.py – cursor pagination over cached ranked candidates
+
+The first page of a paged search runs the model and index once for
+PAGE_CANDIDATES results and keeps the ranked ids / scores (plus the parsed
+query and patch preview) in a bounded, TTL-evicting cache. Every page
+answer carries an opaque cursor = token of that entry + next offset; later
+pages are slices of the cached list, with no model or FAISS work.
+
+The cache lives in the API process, so it works the same with thread or
+process search executors. An expired or evicted cursor raises CursorExpired
+(the API answers 410 and the client restarts from page one).
+"""
+
+import base64, binascii, os, secrets
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from caching import LRUCache
+
+PAGE_CANDIDATES   = int(os.environ.get("PAGE_CANDIDATES", 500))    # ranked results kept per query
+DEFAULT_PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 24))
+CURSOR_CACHE_SIZE = int(os.environ.get("CURSOR_CACHE_SIZE", 2048))  # concurrent result sets
+CURSOR_CACHE_TTL  = float(os.environ.get("CURSOR_CACHE_TTL", 900))
+
+
+class InvalidCursor(ValueError):
+    """Cursor is not one this server issued; the API maps it to 400."""
+
+
+class CursorExpired(KeyError):
+    """Cursor's candidate list was evicted or timed out; the API maps it to 410."""
+
+
+@dataclass
+class Candidates:
+    ids: np.ndarray      # int64 product ids, best first
+    scores: np.ndarray   # float32 scores aligned with ids
+    semantic: Any        # parsed query, for the `why` of each result
+    patch: str | None    # query-image preview
+
+
+def encode_cursor(token: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{token}:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        token, offset = raw.rsplit(":", 1)
+        if int(offset) < 0:
+            raise ValueError("negative offset")
+        return token, int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursor(f"malformed cursor: {cursor!r}") from e
+
+
+class CandidateCache:
+    def __init__(self, maxsize: int = CURSOR_CACHE_SIZE, ttl: float = CURSOR_CACHE_TTL):
+        self._cache = LRUCache(maxsize, ttl)
+
+    def open(self, ranked: Dict[str, Any]) -> Tuple[str, Candidates]:
+        """Store a rank_candidates() payload; returns its token and the stored candidates."""
+        candidates = Candidates(
+            ids=np.asarray(ranked.get("ids", []), dtype=np.int64),
+            scores=np.asarray(ranked.get("scores", []), dtype=np.float32),
+            semantic=ranked.get("semantic"),
+            patch=ranked.get("patch"),
+        )
+        token = secrets.token_urlsafe(12)
+        self._cache.put(token, candidates)
+        return token, candidates
+
+    def resume(self, cursor: str) -> Tuple[str, Candidates, int]:
+        """(token, candidates, offset) for a cursor issued by page()."""
+        token, offset = decode_cursor(cursor)
+        candidates = self._cache.get(token)
+        if candidates is None:
+            raise CursorExpired(cursor)
+        return token, candidates, offset
+
+    @staticmethod
+    def page(token: str, candidates: Candidates, offset: int, limit: int) -> Tuple[np.ndarray, str | None]:
+        """Ids on this page and the cursor of the next one (None on the last page)."""
+        end = offset + limit
+        next_cursor = encode_cursor(token, end) if end < len(candidates.ids) else None
+        return candidates.ids[offset:end], next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        return self._cache.stats()
+
+
+CANDIDATE_CACHE = CandidateCache()
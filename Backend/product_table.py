@@ -0,0 +1,150 @@
+"""
+product_table.py – columnar product metadata aligned with FAISS row order
+
+Row i of every column describes the product at IDS[i], so filters become
+boolean-mask operations over integer codes instead of per-row dict lookups.
+"""
+
+import json, os
+from typing import Dict, Iterable, List, Mapping, Sequence
+
+import numpy as np
+
+import query_parser
+
+CATEGORICAL_COLUMNS = ("masterCategory", "subCategory", "articleType", "baseColour")
+
+
+class ProductTable:
+    """
+    product_ids – int64 product id per row
+    valid       – row has a metadata entry in DOCS
+    codes[col]  – int32 categorical code per row (index into levels[col];
+                  missing values map to the "" level)
+    name_has    – precomputed "term is a word of productDisplayName" columns
+                  (whole tokens and plurals, as query_parser matches queries)
+    """
+
+    def __init__(self, ids: Sequence[int], docs: Mapping[int, dict], name_terms: Iterable[str] = ()):
+        self.product_ids = np.asarray(ids, dtype=np.int64)
+        self._row_order = np.argsort(self.product_ids, kind="stable")
+        self._sorted_ids = self.product_ids[self._row_order]
+        n = len(self.product_ids)
+        rows = [docs.get(int(pid)) for pid in self.product_ids]
+        self.valid = np.fromiter((d is not None for d in rows), dtype=bool, count=n)
+
+        self.levels: Dict[str, List[str]] = {}
+        self.codes: Dict[str, np.ndarray] = {}
+        for col in CATEGORICAL_COLUMNS:
+            lookup: Dict[str, int] = {}
+            codes = np.empty(n, dtype=np.int32)
+            for i, d in enumerate(rows):
+                value = (d.get(col) if d else None) or ""
+                codes[i] = lookup.setdefault(value, len(lookup))
+            self.levels[col] = list(lookup)
+            self.codes[col] = codes
+
+        self._docs = docs
+        self._name_tokens = [query_parser.word_tokens(d.get("productDisplayName") if d else None) for d in rows]
+        self.name_has: Dict[str, np.ndarray] = {}
+        for term in name_terms:
+            self.name_contains(term)
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    # ─── compiled artifact form ─────────────────────────────────────────
+    def save(self, directory: str) -> None:
+        """Write every column as a .npy (memory-mappable) plus levels/terms as JSON."""
+        terms = list(self.name_has)
+        np.save(os.path.join(directory, "table_product_ids.npy"), self.product_ids)
+        np.save(os.path.join(directory, "table_row_order.npy"), self._row_order)
+        np.save(os.path.join(directory, "table_valid.npy"), self.valid)
+        for col in CATEGORICAL_COLUMNS:
+            np.save(os.path.join(directory, f"table_codes_{col}.npy"), self.codes[col])
+        name_has = (np.stack([self.name_has[t] for t in terms]) if terms
+                    else np.zeros((0, len(self)), dtype=bool))
+        np.save(os.path.join(directory, "table_name_has.npy"), name_has)
+        with open(os.path.join(directory, "table.json"), "w") as f:
+            json.dump({"levels": self.levels, "name_terms": terms}, f)
+
+    @classmethod
+    def load(cls, directory: str, docs: Mapping[int, dict]) -> "ProductTable":
+        """
+        Open a saved table with every column memory-mapped. Display names for
+        terms outside the precomputed set are read from `docs` on first use.
+        """
+        def _npy(name):
+            return np.load(os.path.join(directory, f"table_{name}.npy"), mmap_mode="r")
+
+        self = cls.__new__(cls)
+        with open(os.path.join(directory, "table.json")) as f:
+            spec = json.load(f)
+        self.product_ids = _npy("product_ids")
+        self._row_order = _npy("row_order")
+        self._sorted_ids = np.asarray(self.product_ids[self._row_order])
+        self.valid = _npy("valid")
+        self.levels = spec["levels"]
+        self.codes = {col: _npy(f"codes_{col}") for col in CATEGORICAL_COLUMNS}
+        name_has = _npy("name_has")
+        self.name_has = {t: name_has[i] for i, t in enumerate(spec["name_terms"])}
+        self._docs = docs
+        self._name_tokens = None
+        return self
+
+    def row_positions(self, product_ids: np.ndarray) -> np.ndarray:
+        """Row of each of `product_ids`, -1 where the id is not in the table."""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(self._sorted_ids):
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted_ids, product_ids), len(self._sorted_ids) - 1)
+        hit = self._sorted_ids[pos] == product_ids
+        return np.where(hit, self._row_order[pos], -1).astype(np.int64)
+
+    def rows_for_ids(self, product_ids: np.ndarray) -> np.ndarray:
+        """Rows holding `product_ids` (ids not in the table are dropped), order preserved."""
+        rows = self.row_positions(product_ids)
+        return rows[rows >= 0]
+
+    # ─── column primitives ──────────────────────────────────────────────
+    def level_lut(self, col: str, predicate) -> np.ndarray:
+        """Boolean lookup table over the levels of `col`; index it with codes."""
+        return np.fromiter((bool(predicate(lvl)) for lvl in self.levels[col]),
+                           dtype=bool, count=len(self.levels[col]))
+
+    def isin(self, col: str, values: Iterable[str], rows: np.ndarray | None = None) -> np.ndarray:
+        values = set(values)
+        lut = self.level_lut(col, lambda lvl: lvl in values)
+        return lut[self.codes[col] if rows is None else self.codes[col][rows]]
+
+    def lower_eq_any(self, col: str, terms: Iterable[str], rows: np.ndarray | None = None) -> np.ndarray:
+        """Rows whose lower-cased `col` equals one of `terms`."""
+        terms = set(terms)
+        lut = self.level_lut(col, lambda lvl: lvl.lower() in terms)
+        return lut[self.codes[col] if rows is None else self.codes[col][rows]]
+
+    def lower_contains_any(self, col: str, terms: Iterable[str], rows: np.ndarray | None = None) -> np.ndarray:
+        """Rows whose lower-cased `col` contains one of `terms` as a substring."""
+        terms = [t.lower() for t in terms]
+        lut = self.level_lut(col, lambda lvl: any(t in lvl.lower() for t in terms))
+        return lut[self.codes[col] if rows is None else self.codes[col][rows]]
+
+    def name_contains(self, term: str) -> np.ndarray:
+        """Full-catalog column: `term` is a word of the display name (memoised)."""
+        col = self.name_has.get(term)
+        if col is None:
+            if self._name_tokens is None:
+                names = ((self._docs.get(int(pid)) or {}).get("productDisplayName") for pid in self.product_ids)
+                self._name_tokens = [query_parser.word_tokens(name) for name in names]
+            t = query_parser.term(term)
+            col = np.fromiter((query_parser.has_term(t, tokens) for tokens in self._name_tokens),
+                              dtype=bool, count=len(self._name_tokens))
+            self.name_has[term] = col
+        return col
+
+    def name_contains_any(self, terms: Iterable[str], rows: np.ndarray | None = None) -> np.ndarray:
+        mask = np.zeros(len(self) if rows is None else len(rows), dtype=bool)
+        for term in terms:
+            col = self.name_contains(term)
+            mask |= col if rows is None else col[rows]
+        return mask
@@ -0,0 +1,174 @@
+"""
+query_parser.py – compiled query understanding (items, descriptors, negation)
+
+QueryParser compiles the vocabulary once into a term dictionary; parse()
+then tokenizes the query with one precompiled regex and walks the tokens a
+single time, so its cost grows with the query length, not the vocabulary:
+
+    * terms match whole tokens only ("red" is not found in "bored", "tee"
+      not in "steel"), plus plural forms ("dresses", "shoes", "tees");
+      multi-word terms match as token n-grams, longest first
+    * a negator (not, no, without, except, excluding, nor) opens a scope that
+      covers the descriptors after it, across list connectors:
+      "not red or blue" excludes both, "not red but blue" only red;
+      the scope closes at an item ("no leather shoes") or any other word
+    * "non" ("non-leather", "non red") negates only the token right after it
+    * a descriptor negated anywhere in the query is only excluded
+
+parse() returns the (target_items, target_descriptors, excluded_descriptors)
+triple search_backend has always used. extract_keywords() keeps one RAKE
+extractor per thread instead of building one (and reloading NLTK's
+stopwords) per request.
+"""
+
+import re, threading
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from vocabulary import ITEM_TYPES, DESCRIPTOR_TYPES
+
+NEGATORS   = frozenset({"not", "no", "without", "except", "excluding", "nor"})
+# negators whose scope is the next token only
+PREFIX_NEGATORS = frozenset({"non"})
+# words that keep a negation scope open between descriptors
+CONNECTORS = frozenset({"or", "and", "in", "a", "an", "any", "the", "with"})
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+Parsed = Tuple[Dict[str, str], Dict[str, List[str]], Dict[str, List[str]]]
+
+
+class QueryParser:
+    def __init__(self, item_types: Dict[str, List[str]] = ITEM_TYPES,
+                 descriptor_types: Dict[str, List[str]] = DESCRIPTOR_TYPES):
+        # term (token tuple) → (kind, category, canonical word, vocabulary position)
+        self._terms: Dict[Tuple[str, ...], Tuple[str, str, str, int]] = {}
+        pos = 0
+        for kind, groups in (("item", item_types), ("descriptor", descriptor_types)):
+            for category, words in groups.items():
+                for word in words:
+                    key = tuple(_TOKEN.findall(word.lower()))
+                    if key and key not in self._terms:
+                        self._terms[key] = (kind, category, word, pos)
+                    pos += 1
+        self._max_len = max((len(k) for k in self._terms), default=1)
+        self._item_order = list(item_types)
+        self._descriptor_order = list(descriptor_types)
+
+    def _lookup(self, tokens: Tuple[str, ...]):
+        """Term for these tokens, trying the plural-stripped form of the last token too."""
+        term = self._terms.get(tokens)
+        if term is None:
+            last = tokens[-1]
+            for stem in (last[:-1] if last.endswith("s") else None,
+                         last[:-2] if last.endswith("es") else None):
+                if stem and (term := self._terms.get(tokens[:-1] + (stem,))):
+                    break
+        return term
+
+    def _match(self, tokens: List[str], i: int):
+        """(term, tokens consumed) at position i, longest n-gram first; (None, 1) if none."""
+        for n in range(min(self._max_len, len(tokens) - i), 0, -1):
+            term = self._lookup(tuple(tokens[i:i + n]))
+            if term is not None:
+                return term, n
+        return None, 1
+
+    def parse(self, text: str | None) -> Parsed:
+        if not text:
+            return {}, {}, {}
+        tokens = _TOKEN.findall(text.lower())
+        items: Dict[str, Tuple[int, str]] = {}       # category → (vocabulary position, word)
+        wanted: Set[Tuple[int, str, str]] = set()    # (position, category, word)
+        excluded: Set[Tuple[int, str, str]] = set()
+
+        negating, negate_next, i = False, False, 0
+        while i < len(tokens):
+            tok = tokens[i]
+            term, n = self._match(tokens, i)
+            if term is None and "-" in tok:
+                # "red-and-white", "non-leather": the parts count as separate tokens
+                tokens[i:i + 1] = tok.split("-")
+                continue
+            i += n
+            negated, negate_next = negating or negate_next, False
+            if term is None:
+                if tok in PREFIX_NEGATORS:
+                    negate_next = True
+                elif tok in NEGATORS:
+                    negating = True
+                elif tok not in CONNECTORS:
+                    negating = False
+                continue
+            kind, category, word, pos = term
+            if kind == "item":
+                # first word of the category in vocabulary order, as before
+                if category not in items or pos < items[category][0]:
+                    items[category] = (pos, word)
+                negating = False
+            else:
+                (excluded if negated else wanted).add((pos, category, word))
+
+        excluded_words = {w for _, _, w in excluded}
+        target_items = {c: items[c][1] for c in self._item_order if c in items}
+        return (target_items,
+                self._group(w for w in wanted if w[2] not in excluded_words),
+                self._group(excluded))
+
+    def _group(self, found) -> Dict[str, List[str]]:
+        """{category: [words in vocabulary order]}, categories in vocabulary order."""
+        by_category: Dict[str, List[Tuple[int, str]]] = {}
+        for pos, category, word in found:
+            by_category.setdefault(category, []).append((pos, word))
+        return {c: [w for _, w in sorted(by_category[c])] for c in self._descriptor_order if c in by_category}
+
+
+PARSER = QueryParser()
+
+
+def parse(text: str | None) -> Parsed:
+    return PARSER.parse(text)
+
+
+# ─── whole-word matching in product text ────────────────────────────────
+def word_tokens(text: str | None) -> frozenset:
+    """Tokens of `text` as parse() sees them, hyphenated words plus their parts ("t-shirt", "t", "shirt")."""
+    tokens = set()
+    for tok in _TOKEN.findall((text or "").lower()):
+        tokens.add(tok)
+        if "-" in tok:
+            tokens.update(tok.split("-"))
+    return frozenset(tokens)
+
+
+class Term(NamedTuple):
+    tokens: Tuple[str, ...]          # the term as parse() tokenizes it
+    forms: Tuple[frozenset, ...]     # per token: itself and its plural forms
+
+
+def term(text: str) -> Term:
+    tokens = tuple(_TOKEN.findall(text.lower()))
+    return Term(tokens, tuple(frozenset((t, t + "s", t + "es")) for t in tokens))
+
+
+def has_term(t: Term, tokens: frozenset) -> bool:
+    """Every token of `t` occurs in word_tokens() `tokens` ("red" is not in "tailored")."""
+    return bool(t.forms) and all(not f.isdisjoint(tokens) for f in t.forms)
+
+
+def mentions(t: Term, text: str) -> bool:
+    """has_term() on lower-cased `text`, tokenized only when every token of `t` occurs as a substring."""
+    return all(tok in text for tok in t.tokens) and has_term(t, word_tokens(text))
+
+
+# ─── keyword extraction ──────────────────────────────────────────────────
+_rake = threading.local()
+
+
+def extract_keywords(text: str, limit: int = 5) -> Set[str]:
+    """Top `limit` RAKE phrases, lower-cased; one extractor per thread (Rake keeps per-call state)."""
+    rake = getattr(_rake, "rake", None)
+    if rake is None:
+        from rake_nltk import Rake
+        rake = _rake.rake = Rake()
+    rake.extract_keywords_from_text(text)
+    return {p.lower() for p in rake.get_ranked_phrases()[:limit]}
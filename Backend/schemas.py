@@ -0,0 +1,98 @@
+"""
+schemas.py – typed, versioned /api/search responses and the batch request models
+
+    v1  (default, legacy)  [ {id, rank, name, ..., why, patch}, ... ]
+        every result repeats the query's patch preview
+    v2                     {version: 2, count, patch, results: [{id, ..., why}, ...]}
+        the preview appears once, at the top level
+
+SEARCH_RESPONSE_VERSION sets the server default; a request can pick either
+version with the `response_version` form field. Paged search
+(/api/search/paged) always answers SearchPage, the v2 shape plus a cursor.
+
+Batch search (/api/search/batch) takes a BatchSearchRequest and answers one
+BatchItem per query: {index, response (v1 or v2 as requested), error?}.
+"""
+
+import os
+from typing import Any, List, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+RESPONSE_VERSIONS = (1, 2)
+DEFAULT_RESPONSE_VERSION = int(os.environ.get("SEARCH_RESPONSE_VERSION", 1))
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", 10_000))
+
+
+class SearchResult(BaseModel):
+    id: int
+    rank: int
+    name: str
+    image: str | None = None
+    rating: float = 0
+    numReviews: int = 0
+    price: float | None = None
+    discount: float | None = None
+    why: str
+
+
+class LegacySearchResult(SearchResult):
+    patch: str | None = None
+
+
+class SearchResponse(BaseModel):
+    version: Literal[2] = 2
+    count: int
+    patch: str | None = None
+    results: List[SearchResult]
+
+
+class SearchPage(SearchResponse):
+    """One page of a paged search; `patch` is only sent with the first page."""
+    offset: int
+    total: int
+    next_cursor: str | None = None
+
+
+class BatchQuery(BaseModel):
+    text: str = ""
+    image: str | None = Field(None, description="base64-encoded image bytes")
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchQuery] = Field(..., min_length=1, max_length=BATCH_MAX_QUERIES)
+    limit: int = Field(9, ge=1)
+    nprobe: int | None = None
+    ef_search: int | None = None
+    text_weight: float | None = Field(None, ge=0, le=1, description="text- vs image-index score weight")
+    response_version: int = DEFAULT_RESPONSE_VERSION
+    stream: bool | None = Field(None, description="NDJSON lines; default: only for large batches")
+
+
+class BatchItem(BaseModel):
+    index: int
+    response: Any
+    error: str | None = None
+
+
+_LEGACY_RESULTS = TypeAdapter(List[LegacySearchResult])
+
+
+def build_response(compact: dict, version: int = DEFAULT_RESPONSE_VERSION):
+    """
+    Typed response for a search_backend.search_compact() payload, as plain
+    JSON-ready data: a list of LegacySearchResult dicts (v1) or a SearchResponse dict (v2).
+    The whole response is validated in one pydantic-core call and dumped, ready for orjson.
+    """
+    if version not in RESPONSE_VERSIONS:
+        raise ValueError(f"response_version must be one of {RESPONSE_VERSIONS}")
+    results, patch = compact.get("results", []), compact.get("patch")
+    if version == 1:
+        return _LEGACY_RESULTS.dump_python(_LEGACY_RESULTS.validate_python([{**r, "patch": patch} for r in results]))
+    return SearchResponse.model_validate({"count": len(results), "patch": patch, "results": results}).model_dump()
+
+
+def build_page(results: list, patch: str | None, offset: int, total: int, next_cursor: str | None) -> dict:
+    """SearchPage as plain data, assembled like build_response()."""
+    return SearchPage.model_validate({"count": len(results), "patch": patch, "results": results, "offset": offset,
+                                      "total": total, "next_cursor": next_cursor}).model_dump()
@@ -3,22 +3,81 @@
 search_backend.py – multimodal semantic search (patch‑aware) with rating/intents
 """
 
-import io, json, re, os, base64
+from __future__ import annotations
+
+import hashlib, io, itertools, json, logging, re, os, threading, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-import numpy as np, faiss, torch
+import numpy as np, faiss
 from PIL import Image
-from rake_nltk import Rake
-import open_clip
-from open_clip import tokenize
 from typing import List, Dict, Any
 
+from caching import LRUCache, SingleFlight
+from cards import CardStore, MappedCardStore
+from image_cache import ImageEmbeddingCache, ImageEntry
+from batching import MicroBatcher
+from product_table import ProductTable
+from vocabulary import VOCAB_WORDS
+import ann_index
+import artifacts
+import image_ingest
+import query_parser
+from telemetry import span
+
+if TYPE_CHECKING:
+    import torch
+
+log = logging.getLogger(__name__)
+
 # ─── constants ───────────────────────────────────────────────────────────
-DEVICE        = "cuda" if torch.cuda.is_available() else "cpu"
 MODEL_NAME    = "ViT-B-32"
 PRETRAIN_TAG  = "laion2b_s34b_b79k"
 PATCH_GRID    = 3
 TAG_TOP_K     = 3
+EMBED_DIM     = 512
+# crops per encode_image call when scoring image patches
+PATCH_BATCH_SIZE = int(os.environ.get("PATCH_BATCH_SIZE", 64))
+# query-text embedding cache (entries, seconds)
+TEXT_CACHE_SIZE  = int(os.environ.get("TEXT_CACHE_SIZE", 1024))
+TEXT_CACHE_TTL   = float(os.environ.get("TEXT_CACHE_TTL", 3600))
+# cross-request micro-batching of single text/image encodes
+ENCODER_BATCHING   = os.environ.get("ENCODER_BATCHING", "1") == "1"
+BATCH_MAX_SIZE     = int(os.environ.get("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS  = float(os.environ.get("BATCH_MAX_WAIT_MS", 2))
+# filter-aware retrieval: FAISS IDSelector first, then adaptive over-fetch
+RETRIEVAL_SELECTOR = os.environ.get("RETRIEVAL_SELECTOR", "1") == "1"
+OVERFETCH_FACTOR   = int(os.environ.get("OVERFETCH_FACTOR", 8))
+OVERFETCH_GROWTH   = int(os.environ.get("OVERFETCH_GROWTH", 4))
+# query-level result cache in front of the model + index (entries, seconds, MB)
+RESULT_CACHE_SIZE  = int(os.environ.get("RESULT_CACHE_SIZE", 4096))
+RESULT_CACHE_TTL   = float(os.environ.get("RESULT_CACHE_TTL", 300))
+RESULT_CACHE_MB    = float(os.environ.get("RESULT_CACHE_MB", 64))
+# separate text / image product indexes: auto (use them when both exist), late or fused
+SEARCH_INDEX_MODE  = os.environ.get("SEARCH_INDEX_MODE", "auto")
+# late fusion: score = w·text-index score + (1-w)·image-index score, w overridable per request
+LATE_FUSION_TEXT_WEIGHT       = float(os.environ.get("LATE_FUSION_TEXT_WEIGHT", 0.5))
+LATE_FUSION_IMAGE_TEXT_WEIGHT = float(os.environ.get("LATE_FUSION_IMAGE_TEXT_WEIGHT", 0.2))  # image-only queries
+LATE_FUSION_DEPTH     = int(os.environ.get("LATE_FUSION_DEPTH", 8))        # first round: k·depth hits per index,
+LATE_FUSION_MIN_DEPTH = int(os.environ.get("LATE_FUSION_MIN_DEPTH", 512))    # at least this many
+LATE_FUSION_MAX_DEPTH = int(os.environ.get("LATE_FUSION_MAX_DEPTH", 8192))   # widening stops here
+# pool threads searching the second index while the caller searches the first (0 = one after the other)
+LATE_FUSION_THREADS   = int(os.environ.get("LATE_FUSION_THREADS", min(32, (os.cpu_count() or 1) - 1)))
+# result cards: auto (mmap when the compiled artifacts are current, else memory), memory (Python
+# objects built per process) or mmap (compiled cards.*, opened in a few mmaps and shared by worker processes)
+CARD_STORE         = os.environ.get("CARD_STORE", "auto")
+# CLIP tensors exported by export_shared_weights(); when the file exists every process maps it
+SHARED_WEIGHTS     = os.environ.get("SHARED_WEIGHTS", "")
+TORCH_THREADS      = int(os.environ.get("TORCH_THREADS", 0))   # 0 = torch default
+# search_many(): texts per batched encode_text pass
+SEARCH_MANY_TEXT_BATCH = int(os.environ.get("SEARCH_MANY_TEXT_BATCH", 256))
+# warm-up run by warm_up() before the service reports ready ("|"-separated texts)
+WARMUP_QUERIES     = [q for q in os.environ.get(
+    "WARMUP_QUERIES", "red floral dress|denim jacket not blue|black leather shoes|watch"
+).split("|") if q.strip()]
+WARMUP_IMAGES      = int(os.environ.get("WARMUP_IMAGES", 2))
 
 VISUAL_TAGS = [
     "shoe", "sneaker", "boot", "heel",
@@ -39,36 +98,335 @@ INTENT_MAP = {
     "watch":   ("Accessories", {"Watches"}),
 }
 
-print("Loading models and data...")
+# ─── lazily loaded state ──────────────────────────────────────────────────
+# Importing this module loads nothing heavy: the parsing / filtering helpers
+# work as soon as PRODUCTS is set. load_data() opens the index and metadata,
+# load_model() imports torch / open_clip and loads CLIP; the server drives
+# both through lifecycle.py, tools call load() directly.
+torch = open_clip = tokenize = None
+DEVICE = None
+model = preprocess = None
+ENCODER = None   # encoders.ClipEncoder wrapping `model` for the configured ENCODER_BACKEND
+TAG_EMBEDS = None
+VOCAB_EMBEDS: Dict[str, Any] = {}
+TEXT_BATCHER = IMAGE_BATCHER = None
+INDEX = INDEX_META = IDS = DOCS = PRODUCTS = None
+# {"text": (index, meta), "image": (index, meta)} when searching separate indexes (INDEX is then None)
+MODAL_INDEXES: Dict[str, tuple] | None = None
+CARDS: CardStore | None = None   # normalized result cards, rebuilt with the catalog
+INDEX_VERSION = None   # fingerprint of the loaded index / ids / catalog, part of every result-cache key
+
+TEXT_CACHE = LRUCache(TEXT_CACHE_SIZE, TEXT_CACHE_TTL)
+RESULT_CACHE = LRUCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+                        max_bytes=int(RESULT_CACHE_MB * 1024 * 1024), sizeof=lambda r: _ranked_nbytes(r))
+_RESULT_FLIGHTS = SingleFlight()
+IMAGE_CACHE = None   # ImageEmbeddingCache, created by load_model() (keys depend on the encoder)
+
+_data_path  = os.path.join(os.path.dirname(__file__), "products_with_reviews.jsonl")
+_ids_path   = os.path.join(os.path.dirname(__file__), "ids.npy")
+_index_path = os.path.join(os.path.dirname(__file__), "products.index")
+_artifact_dir = artifacts.ARTIFACT_DIR
+
+_LOAD_LOCK = threading.Lock()
+_LATE_POOL: ThreadPoolExecutor | None = None
+
+
+def data_loaded() -> bool:
+    return PRODUCTS is not None
+
+
+def model_loaded() -> bool:
+    return model is not None
+
+
+def load_data(data_dir: str | None = None) -> None:
+    """
+    Open the FAISS index, ids.npy and the product metadata (idempotent).
+    `data_dir` (with its own compiled/ artifacts) replaces the files next to
+    this module and forces a reload, e.g. for the benchmark suite's catalogs.
+    """
+    global INDEX, INDEX_META, MODAL_INDEXES, IDS, DOCS, PRODUCTS, CARDS, INDEX_VERSION
+    global _data_path, _ids_path, _index_path, _artifact_dir
+    with _LOAD_LOCK:
+        if data_dir is not None:
+            _data_path  = os.path.join(data_dir, "products_with_reviews.jsonl")
+            _ids_path   = os.path.join(data_dir, "ids.npy")
+            _index_path = os.path.join(data_dir, "products.index")
+            _artifact_dir = os.path.join(data_dir, "compiled")
+            PRODUCTS = None
+        if PRODUCTS is not None:
+            return
+        log.info("Loading index and product data...")
+        # Load the FAISS index (memory-mapped where the index type allows) and IDs
+        if _use_modal_indexes():
+            MODAL_INDEXES = {m: _open_modal_index(ann_index.modal_path(_index_path, m))
+                             for m in ann_index.MODALITIES}
+            if len({index.ntotal for index, _ in MODAL_INDEXES.values()}) != 1:
+                raise ValueError("text and image indexes differ in size; rebuild them in one indexer run")
+            INDEX = INDEX_META = None
+            log.info("Searching separate text / image indexes with late fusion")
+        else:
+            INDEX = artifacts.read_index_mmap(_index_path)
+            INDEX_META = ann_index.read_index_meta(_index_path)
+            MODAL_INDEXES = None
+        IDS = np.load(_ids_path, mmap_mode="r")
+
+        compiled = artifacts.is_current(_artifact_dir, _data_path, _ids_path)
+        if compiled:
+            # compiled artifacts: product records and filter columns are mmapped, not parsed
+            DOCS = artifacts.MetaStore(_artifact_dir)
+            products = ProductTable.load(_artifact_dir, DOCS)
+        else:
+            log.info("No current compiled artifacts in %s - parsing the catalog", _artifact_dir)
+            # Load the product data
+            with open(_data_path, "r") as f:
+                _docs_list = [json.loads(line) for line in f]
+                DOCS = {int(d["id"]): d for d in _docs_list}
+
+            # columnar metadata aligned with FAISS rows, for vectorised filtering
+            products = ProductTable(IDS, DOCS, name_terms=VOCAB_WORDS)
+        # id → JSON-ready card, so result assembly is a gather plus rank / why
+        if CARD_STORE in ("auto", "mmap") and compiled:
+            CARDS = MappedCardStore(_artifact_dir)
+        else:
+            if CARD_STORE == "mmap":
+                log.warning("CARD_STORE=mmap needs compiled artifacts - building cards in memory")
+            CARDS = CardStore(DOCS)
+        version = _data_version()
+        if version != INDEX_VERSION:
+            RESULT_CACHE.clear()
+        INDEX_VERSION = version
+        PRODUCTS = products   # set last: data_loaded() means everything above is usable
+
+
+def _use_modal_indexes() -> bool:
+    if SEARCH_INDEX_MODE == "fused":
+        return False
+    present = all(os.path.exists(ann_index.modal_path(_index_path, m)) for m in ann_index.MODALITIES)
+    if SEARCH_INDEX_MODE == "late" and not present:
+        raise FileNotFoundError(f"SEARCH_INDEX_MODE=late but {ann_index.modal_path(_index_path, 'text')} "
+                                f"or {ann_index.modal_path(_index_path, 'image')} is missing")
+    return present
+
+
+def _open_modal_index(path: str) -> tuple:
+    """
+    (index, meta) for one modality. meta["rescore"] tells whether vectors can
+    be reconstructed by label (IVF indexes get a direct map for that), so late
+    fusion can score a candidate in the index that did not return it.
+    """
+    index, meta = artifacts.read_index_mmap(path), ann_index.read_index_meta(path)
+    try:
+        if meta.get("type") in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(index).make_direct_map()
+        if index.ntotal:
+            index.reconstruct(int(index.id_map.at(0)) if meta.get("id_map") else 0)
+        meta["rescore"] = True
+    except RuntimeError as e:
+        log.warning("%s cannot reconstruct vectors, late fusion uses partial scores: %s", path, e)
+        meta["rescore"] = False
+    return index, meta
+
+
+def prepare_artifacts() -> bool:
+    """
+    Compile the serving artifacts for the catalog next to this module if they
+    are missing or stale (supervisor.py does this once, before any worker
+    starts). True when current artifacts exist afterwards.
+    """
+    if artifacts.is_current(_artifact_dir, _data_path, _ids_path):
+        return True
+    if not (os.path.exists(_data_path) and os.path.exists(_ids_path)):
+        return False
+    log.info("Compiling serving artifacts into %s", _artifact_dir)
+    artifacts.compile_artifacts(_data_path, _ids_path, _artifact_dir, name_terms=VOCAB_WORDS)
+    return True
+
+
+def _data_version() -> str:
+    """
+    Short fingerprint of the index, row order and catalog files currently on
+    disk. The catalog and ids are hashed in full (edits in place change them);
+    the indexes, which are only rewritten whole, by sample and mtime.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    modal = [ann_index.modal_path(_index_path, m) for m in ann_index.MODALITIES]
+    for path, full in ((_index_path, False), *((m, False) for m in modal), (_ids_path, True), (_data_path, True)):
+        if os.path.exists(path):
+            h.update(json.dumps(artifacts.fingerprint(path, full), sort_keys=True).encode())
+    return h.hexdigest()
+
 
-try:
-    # ─── load CLIP, FAISS & metadata ──────────────────────────────────────────
-    model, _, preprocess = open_clip.create_model_and_transforms(
-        MODEL_NAME, pretrained=PRETRAIN_TAG, device=DEVICE
+def load_model() -> None:
+    """Import torch / open_clip, load CLIP and precompute the tag and vocabulary embeddings (idempotent)."""
+    global open_clip
+    with _LOAD_LOCK:
+        if model is not None:
+            return
+        log.info("Loading CLIP model...")
+        import torch as _torch
+        import open_clip as _open_clip
+        import encoders
+        open_clip = _open_clip
+        device = "cuda" if _torch.cuda.is_available() else "cpu"
+        if TORCH_THREADS:
+            _torch.set_num_threads(TORCH_THREADS)
+
+        # ─── load CLIP ────────────────────────────────────────────────────────
+        clip_model = None
+        if SHARED_WEIGHTS and os.path.exists(SHARED_WEIGHTS) and device == "cpu":
+            try:
+                clip_model, clip_preprocess = _clip_from_shared(SHARED_WEIGHTS)
+                log.info("CLIP weights memory-mapped from %s", SHARED_WEIGHTS)
+            except Exception as e:
+                log.warning("Cannot map CLIP weights from %s (%s: %s) - loading a private copy",
+                            SHARED_WEIGHTS, type(e).__name__, e)
+        if clip_model is None:
+            clip_model, _, clip_preprocess = open_clip.create_model_and_transforms(
+                MODEL_NAME, pretrained=PRETRAIN_TAG, device=device
+            )
+        clip_model.eval()
+        # eager / int8 / torchscript / compile / onnx, per ENCODER_BACKEND
+        encoder = encoders.build_encoder(clip_model, encoders.ENCODER_BACKEND, device, MODEL_NAME)
+        log.info("Encoder backend: %s", encoder.kind)
+        _install_model(clip_model, clip_preprocess, open_clip.tokenize, encoder, device)
+
+
+def shared_weights_path(directory: str | None = None) -> str:
+    """Default SHARED_WEIGHTS file for MODEL_NAME / PRETRAIN_TAG (next to the compiled artifacts)."""
+    return os.path.join(directory or _artifact_dir, f"clip_{MODEL_NAME}_{PRETRAIN_TAG}.pt")
+
+
+def export_shared_weights(path: str) -> None:
+    """
+    Load the pretrained CLIP once and save every parameter and buffer to
+    `path` as plain tensors (written to a temporary file, then renamed).
+    """
+    import torch as _torch
+    import open_clip as _open_clip
+    clip_model, _, _ = _open_clip.create_model_and_transforms(MODEL_NAME, pretrained=PRETRAIN_TAG, device="cpu")
+    tensors = {name: t.detach().contiguous()
+               for name, t in itertools.chain(clip_model.named_parameters(), clip_model.named_buffers())}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _torch.save(tensors, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _clip_from_shared(path: str):
+    """
+    (model, preprocess) with every tensor memory-mapped from an
+    export_shared_weights() file. The model is built on the meta device, so
+    no private copy of the weights is allocated: the mapped pages stay in the
+    page cache once, however many processes serve from them.
+    """
+    import torch as _torch
+    tensors = _torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    clip_model, _, clip_preprocess = open_clip.create_model_and_transforms(
+        MODEL_NAME, pretrained=None, device="meta"
     )
+    for name, tensor in tensors.items():
+        owner, _, leaf = name.rpartition(".")
+        module = clip_model.get_submodule(owner)
+        if leaf in module._parameters:
+            module._parameters[leaf] = _torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[leaf] = tensor
+    unmapped = [n for n, t in (*clip_model.named_parameters(), *clip_model.named_buffers()) if t.is_meta]
+    if unmapped:
+        raise ValueError(f"{path} has no tensor for {', '.join(unmapped[:5])}")
+    return clip_model, clip_preprocess
+
+
+def install_model(clip_model, clip_preprocess, tokenizer, encoder, device: str = "cpu") -> None:
+    """
+    Serve with an already-built model instead of load_model(): `encoder` has
+    encode_text(tokens) / encode_image(batch) like encoders.ClipEncoder,
+    `tokenizer` and `clip_preprocess` behave like open_clip's. Used by the
+    benchmark suite's stub encoder; replaces any model loaded before.
+    """
+    global model
+    with _LOAD_LOCK:
+        model = None
+        _install_model(clip_model, clip_preprocess, tokenizer, encoder, device)
+
+
+def _install_model(clip_model, clip_preprocess, tokenizer, encoder, device) -> None:
+    """Precompute tag / vocabulary embeddings and start the encoder queues (caller holds _LOAD_LOCK)."""
+    global torch, tokenize, DEVICE, model, preprocess, ENCODER
+    global TAG_EMBEDS, VOCAB_EMBEDS, TEXT_BATCHER, IMAGE_BATCHER, IMAGE_CACHE
+    import torch as _torch
+    torch, tokenize, DEVICE = _torch, tokenizer, device
+    preprocess, ENCODER = clip_preprocess, encoder
 
     # for patch‑tag suggestion (not used for matching itself)
     _tag_embeds = tokenize(VISUAL_TAGS).to(DEVICE)
     with torch.no_grad():
-        _tag_embeds = model.encode_text(_tag_embeds)
+        _tag_embeds = ENCODER.encode_text(_tag_embeds)
         _tag_embeds = _tag_embeds.float()  # Convert to float32 explicitly
     TAG_EMBEDS = (_tag_embeds / _tag_embeds.norm(dim=-1, keepdim=True)).cpu()
 
-    # Load the product data
-    with open(os.path.join(os.path.dirname(__file__), "products_with_reviews.jsonl"), "r") as f:
-        _docs_list = [json.loads(line) for line in f]
-        DOCS = {int(d["id"]): d for d in _docs_list}
+    # every query-vocabulary word embedded once, so single-word encodes are lookups
+    _vocab_embeds = tokenize(VOCAB_WORDS).to(DEVICE)
+    with torch.no_grad():
+        _vocab_embeds = ENCODER.encode_text(_vocab_embeds).float()
+    _vocab_embeds = (_vocab_embeds / _vocab_embeds.norm(dim=-1, keepdim=True)).cpu()
+    VOCAB_EMBEDS = {w: _vocab_embeds[i:i+1] for i, w in enumerate(VOCAB_WORDS)}
+    TEXT_CACHE.clear()
+
+    # one queue per encoder; each caller gets back its own (1 x D) row
+    if ENCODER_BATCHING and TEXT_BATCHER is None:
+        TEXT_BATCHER = MicroBatcher(lambda texts: _encode_texts(texts).split(1),
+                                    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="text")
+        IMAGE_BATCHER = MicroBatcher(lambda tensors: _encode_image_tensors(tensors).split(1),
+                                     BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name="image")
+    # repeat uploads → cached embedding / tags / preview, per model + ingest settings
+    IMAGE_CACHE = ImageEmbeddingCache(namespace="/".join(map(str, (
+        MODEL_NAME, PRETRAIN_TAG, getattr(ENCODER, "kind", type(ENCODER).__name__),
+        image_ingest.MODEL_SIZE, image_ingest.ZOOM, image_ingest.PREVIEW_SIZE, image_ingest.PREVIEW_QUALITY))))
+    RESULT_CACHE.clear()
+    model = clip_model   # set last: model_loaded() means every encoder is usable
+
+
+def load() -> None:
+    """Everything search() needs: index and metadata, then the model."""
+    try:
+        load_data()
+        load_model()
+        log.info("Models and data loaded successfully!")
+    except Exception as e:
+        log.exception("Error loading models and data: %s", e)
+        raise
 
-    # Load the FAISS index and IDs
-    INDEX = faiss.read_index(os.path.join(os.path.dirname(__file__), "products.index"))
-    IDS = np.load(os.path.join(os.path.dirname(__file__), "ids.npy"))
-    
-    print("Models and data loaded successfully!")
-except Exception as e:
-    import traceback
-    print(f"Error loading models and data: {e}")
-    print(traceback.format_exc())
-    raise
+
+def _warmup_image(size: tuple, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def warm_up(queries: List[str] | None = None, images: int | None = None) -> Dict[str, float]:
+    """
+    Run representative text, image and text+image searches so PyTorch's
+    one-time initialisation (kernel selection, allocator, thread pools) and
+    the FAISS / metadata pages are paid before the first real query.
+    Returns seconds per warm-up query.
+    """
+    queries = WARMUP_QUERIES if queries is None else queries
+    images = WARMUP_IMAGES if images is None else images
+    timings = {}
+    for q in queries:
+        t0 = time.perf_counter()
+        search(text=q, k=9)
+        timings[f"text:{q}"] = time.perf_counter() - t0
+    for i in range(images):
+        # alternate portrait / landscape photos so both resize paths are exercised
+        img = _warmup_image((480, 640) if i % 2 == 0 else (800, 600), seed=i)
+        text = queries[i % len(queries)] if queries else None
+        t0 = time.perf_counter()
+        search(text=text, image_bytes=img, k=9)
+        timings[f"image:{i}"] = time.perf_counter() - t0
+    return timings
 
 # ─── helpers ──────────────────────────────────────────────────────────────
 def extract_min_rating(q: str | None) -> float | None:
@@ -85,25 +443,61 @@ def extract_min_rating(q: str | None) -> float | None:
     return None
 
 
+def _normalize_text(text: str) -> str:
+    """Cache key for a text query: CLIP's tokenizer lower-cases and collapses whitespace anyway."""
+    return " ".join(text.lower().split())
+
+
+def _encode_texts(texts: List[str]) -> torch.Tensor:
+    """One batched encode_text pass → L2‑normalised float32 (N x D) on *CPU*."""
+    with span("tokenize"):
+        tok = tokenize(texts).to(DEVICE)
+    with span("encode_text"), torch.no_grad():
+        v = ENCODER.encode_text(tok).float()
+    return (v / v.norm(dim=-1, keepdim=True)).cpu()
+
+
+def _encode_image_tensors(tensors: List[torch.Tensor]) -> torch.Tensor:
+    """One batched encode_image pass over preprocessed (3 x H x W) tensors → (N x D) on *CPU*."""
+    batch = torch.stack(tensors).to(DEVICE)
+    with span("encode_image"), torch.no_grad():
+        v = ENCODER.encode_image(batch).float()
+    return (v / v.norm(dim=-1, keepdim=True)).cpu()
+
+
+def _encode_text(text: str) -> torch.Tensor:
+    if TEXT_BATCHER is not None:
+        return TEXT_BATCHER(text)
+    return _encode_texts([text])
+
+
+def _text_embed(text: str) -> torch.Tensor:
+    """
+    L2‑normalised float32 (1 x D) text embedding on *CPU*.
+    Vocabulary words come from VOCAB_EMBEDS, other queries from TEXT_CACHE.
+    Callers must treat the returned tensor as read-only.
+    """
+    key = _normalize_text(text)
+    if key in VOCAB_EMBEDS:
+        return VOCAB_EMBEDS[key]
+    return TEXT_CACHE.get_or_compute(key, lambda: _encode_text(key))
+
+
 def _img_embed(img: Image.Image) -> torch.Tensor:
     """L2‑normalised float32 embedding on *CPU*."""
     try:
         # Ensure image is RGB and properly sized
         img = img.convert("RGB")
         
-        # Process through CLIP
-        t = preprocess(img).unsqueeze(0).to(DEVICE)
-        with torch.no_grad():
-            v = model.encode_image(t)
-            v = v.float()  # Ensure float32 type
-            
-        # L2 normalize
-        v = v / v.norm(dim=-1, keepdim=True)
-        return v.cpu()
+        # Preprocess on the caller's thread, encode (batched across requests) through CLIP
+        t = preprocess(img)
+        if IMAGE_BATCHER is not None:
+            return IMAGE_BATCHER(t)
+        return _encode_image_tensors([t])
     except Exception as e:
-        print(f"Error in image embedding: {e}")
+        log.warning("Error in image embedding: %s", e)
         # Return zero vector as fallback
-        return torch.zeros(1, 512, dtype=torch.float32)
+        return torch.zeros(1, EMBED_DIM, dtype=torch.float32)
     
 def _zoom_embed(img: Image.Image, zoom: float = 1.2) -> torch.Tensor:
     """
@@ -121,81 +515,103 @@ def _zoom_embed(img: Image.Image, zoom: float = 1.2) -> torch.Tensor:
 
 
 
+def encoder_stats() -> Dict[str, Any]:
+    """Encoder backend, text / image cache counters and batch-size / queue-wait histograms per encoder queue."""
+    return {
+        "encoder_backend": ENCODER.kind if ENCODER else None,
+        "text_cache": TEXT_CACHE.stats(),
+        "image_cache": IMAGE_CACHE.stats() if IMAGE_CACHE else None,
+        "text_batcher": TEXT_BATCHER.stats() if TEXT_BATCHER else None,
+        "image_batcher": IMAGE_BATCHER.stats() if IMAGE_BATCHER else None,
+    }
+
+
 def parse_semantic_query(text):
     """
     Parses a search query into semantic components including:
     - target_items: What items we're looking for (jackets, dresses, etc.)
     - target_descriptors: What properties we want (denim, floral, etc.)
     - excluded_descriptors: What properties we DON'T want (not red, etc.)
+    Matching is token-based with negation scopes, see query_parser.py.
     """
-    if not text:
-        return {}, {}, {}
-    
     try:
-        # Convert to lowercase for consistency
-        text_lower = text.lower()
-        
-        # Define semantic categories
-        item_types = {
-            "dress": ["dress", "gown", "frock"],
-            "jacket": ["jacket", "coat", "blazer"],
-            "shirt": ["shirt", "top", "tee", "t-shirt", "tshirt", "blouse"],
-            "pants": ["pant", "trouser", "jeans", "leggings", "shorts"],
-            "shoes": ["shoe", "sneaker", "boot", "heel", "footwear"],
-            "accessories": ["watch", "bag", "purse", "handbag", "backpack", "wallet"]
-        }
-        
-        # Define descriptor categories
-        descriptor_types = {
-            "colors": ["red", "blue", "green", "yellow", "black", "white", "pink", "purple", "brown", "orange", "beige"],
-            "patterns": ["floral", "striped", "plaid", "checkered", "dotted", "printed"],
-            "materials": ["denim", "leather", "cotton", "silk", "wool", "polyester", "linen"],
-            "styles": ["casual", "formal", "elegant", "vintage", "modern", "sporty", "classic"]
-        }
-        
-        # Extract target items
-        target_items = {}
-        for category, words in item_types.items():
-            for word in words:
-                if word in text_lower:
-                    target_items[category] = word
-                    break
-        
-        # Extract descriptors
-        target_descriptors = {}
-        for category, words in descriptor_types.items():
-            for word in words:
-                # Check for "not [word]" or "no [word]" patterns
-                not_pattern = f"not {word}"
-                no_pattern = f"no {word}"
-                except_pattern = f"except {word}"
-                but_not_pattern = f"but not {word}"
-                
-                if any(neg in text_lower for neg in [not_pattern, no_pattern, except_pattern, but_not_pattern]):
-                    continue  # Skip this word as it's excluded
-                
-                if word in text_lower:
-                    target_descriptors[category] = target_descriptors.get(category, []) + [word]
-        
-        # Extract excluded descriptors (things we DON'T want)
-        excluded_descriptors = {}
-        for category, words in descriptor_types.items():
-            for word in words:
-                # Detect negative patterns
-                not_pattern = f"not {word}"
-                no_pattern = f"no {word}"
-                except_pattern = f"except {word}"
-                but_not_pattern = f"but not {word}"
-                
-                if any(neg in text_lower for neg in [not_pattern, no_pattern, except_pattern, but_not_pattern]):
-                    excluded_descriptors[category] = excluded_descriptors.get(category, []) + [word]
-        
-        return target_items, target_descriptors, excluded_descriptors
+        return query_parser.parse(text)
     except Exception as e:
-        print(f"Error parsing query: {e}")
+        log.warning("Error parsing query: %s", e)
         return {}, {}, {}
 
 
+def _img_embed_batch(imgs: List[Image.Image]) -> torch.Tensor:
+    """
+    L2‑normalised float32 embeddings (N x D) on *CPU* for a list of images.
+    All crops are preprocessed into one tensor and encoded in chunks of
+    PATCH_BATCH_SIZE, so N crops cost ceil(N / PATCH_BATCH_SIZE) forward passes.
+    """
+    if not imgs:
+        return torch.zeros(0, EMBED_DIM, dtype=torch.float32)
+    try:
+        batch = torch.stack([preprocess(im.convert("RGB")) for im in imgs])
+        chunks = []
+        with torch.no_grad():
+            for i in range(0, len(batch), PATCH_BATCH_SIZE):
+                v = ENCODER.encode_image(batch[i:i + PATCH_BATCH_SIZE].to(DEVICE))
+                chunks.append(v.float())
+        v = torch.cat(chunks)
+        v = v / v.norm(dim=-1, keepdim=True)
+        return v.cpu()
+    except Exception as e:
+        log.warning("Error in batched image embedding: %s", e)
+        return torch.zeros(len(imgs), EMBED_DIM, dtype=torch.float32)
+
+
+def _standard_patch_boxes(w: int, h: int, grid: int = 5) -> List[tuple]:
+    """Overlapping grid boxes used by _standard_patch_selection (grid x grid)."""
+    pw, ph = w // grid, h // grid
+    boxes = []
+    for gy in range(grid):
+        for gx in range(grid):
+            # Extract patch with some overlap
+            x1 = max(0, gx * pw - pw//4)
+            y1 = max(0, gy * ph - ph//4)
+            x2 = min(w, x1 + pw + pw//2)
+            y2 = min(h, y1 + ph + ph//2)
+            boxes.append((x1, y1, x2, y2))
+    return boxes
+
+
+def _fine_patch_boxes(w: int, h: int, grid: int = 6) -> List[tuple]:
+    """Half-step overlapping boxes used by _best_patch ((2*grid-1)^2 candidates)."""
+    pw, ph = w // grid, h // grid
+    boxes = []
+    for gy in range(grid*2-1):
+        for gx in range(grid*2-1):
+            # Use half-steps for more granular search
+            x1 = max(0, int(gx * pw/2))
+            y1 = max(0, int(gy * ph/2))
+            x2 = min(w, x1 + pw)
+            y2 = min(h, y1 + ph)
+
+            # Skip too small regions
+            if x2-x1 < 30 or y2-y1 < 30:
+                continue
+            boxes.append((x1, y1, x2, y2))
+    return boxes
+
+
+def _score_patches(img: Image.Image, boxes: List[tuple], query_vecs: torch.Tensor):
+    """
+    Crop every box, embed all crops in batched passes and score them against
+    every query vector with one matrix multiply.
+
+    Returns (crops, sims) where sims is an (n_boxes x n_queries) cosine matrix.
+    """
+    crops = [img.crop(box) for box in boxes]
+    embs = _img_embed_batch(crops)
+    q = query_vecs.cpu().float()
+    q = q / q.norm(dim=-1, keepdim=True).clamp_min(1e-12)
+    return crops, embs @ q.T
+
+
 def _best_patch(img: Image.Image, text_vec: torch.Tensor, semantic_query=None) -> Image.Image:
     """
     Enhanced patch selection that uses semantic understanding to find
@@ -210,7 +626,7 @@ def _best_patch(img: Image.Image, text_vec: torch.Tensor, semantic_query=None) -
         
         # Prioritize finding clothing items mentioned in the query
         if target_items:
-            print(f"Looking for specific items in image: {target_items}")
+            log.debug("Looking for specific items in image: %s", target_items)
             # For clothing detection, we'd ideally use a specialized model
             # Since we don't have that, we'll use a denser grid approach
             FINE_GRID = 6
@@ -222,22 +638,15 @@ def _best_patch(img: Image.Image, text_vec: torch.Tensor, semantic_query=None) -
             # Skip tiny patches
             if pw < 40 or ph < 40:
                 return img
-                
-            # Try overlapping patches for better coverage
-            best_sim, best_crop = -1.0, img
             
             # Create individual item embeddings for better matching
             item_text_vecs = {}
             for category, item in target_items.items():
                 try:
-                    # Create a focused embedding for this item type
-                    tok = tokenize([item]).to(DEVICE)
-                    with torch.no_grad():
-                        item_vec = model.encode_text(tok)
-                        item_vec = item_vec.float()
-                    item_text_vecs[category] = item_vec / item_vec.norm(dim=-1, keepdim=True)
+                    # Focused embedding for this item type (precomputed vocabulary lookup)
+                    item_text_vecs[category] = _text_embed(item)
                 except Exception as e:
-                    print(f"Error creating embedding for {item}: {e}")
+                    log.warning("Error creating embedding for %s: %s", item, e)
                     continue
             
             # If we have material descriptors, prioritize them in the search
@@ -245,63 +654,40 @@ def _best_patch(img: Image.Image, text_vec: torch.Tensor, semantic_query=None) -
             if "materials" in target_descriptors and target_descriptors["materials"]:
                 material = target_descriptors["materials"][0]
                 try:
-                    # Create embedding for the material
-                    mat_tok = tokenize([material]).to(DEVICE)
-                    with torch.no_grad():
-                        mat_vec = model.encode_text(mat_tok)
-                        mat_vec = mat_vec.float()
-                    material_focus = mat_vec / mat_vec.norm(dim=-1, keepdim=True)
+                    # Embedding for the material (precomputed vocabulary lookup)
+                    material_focus = _text_embed(material)
                 except Exception as e:
-                    print(f"Error creating material embedding for {material}: {e}")
+                    log.warning("Error creating material embedding for %s: %s", material, e)
             
             # Use combined vec weighted towards materials and items
-            search_vec = text_vec
+            search_vec = text_vec.cpu().float()
             if material_focus is not None:
                 # Weight material higher for material-focused searches
                 search_vec = 0.7 * material_focus.cpu() + 0.3 * text_vec.cpu()
             
             # Try patches with more overlap for clothing items
-            for gy in range(FINE_GRID*2-1):
-                for gx in range(FINE_GRID*2-1):
-                    try:
-                        # Use half-steps for more granular search
-                        x1 = max(0, int(gx * pw/2))
-                        y1 = max(0, int(gy * ph/2))
-                        x2 = min(w, x1 + pw)
-                        y2 = min(h, y1 + ph)
-                        
-                        # Skip too small regions
-                        if x2-x1 < 30 or y2-y1 < 30:
-                            continue
-                        
-                        crop = img.crop((x1, y1, x2, y2))
-                        
-                        # Get embedding and compare
-                        emb = _img_embed(crop)
-                        
-                        # Calculate similarity with the search vector
-                        sim = torch.cosine_similarity(emb, search_vec)[0].item()
-                        
-                        # Extra boost for patches that match item-specific embeddings
-                        for item_vec in item_text_vecs.values():
-                            item_sim = torch.cosine_similarity(emb, item_vec.cpu())[0].item()
-                            if item_sim > 0.2:  # Reasonable similarity threshold
-                                sim += 0.1  # Boost score for matches
-                        
-                        if sim > best_sim:
-                            best_sim, best_crop = sim, crop
-                    except Exception as e:
-                        print(f"Error processing patch at {gx},{gy}: {e}")
-                        continue
+            boxes = _fine_patch_boxes(w, h, FINE_GRID)
+            if not boxes:
+                return img
+
+            # Column 0 scores against the search vector, the rest against items
+            query_vecs = torch.cat([search_vec.reshape(1, -1)] +
+                                   [v.cpu().reshape(1, -1) for v in item_text_vecs.values()])
+            crops, sims = _score_patches(img, boxes, query_vecs)
+
+            # Extra boost for patches that match item-specific embeddings
+            scores = sims[:, 0] + 0.1 * (sims[:, 1:] > 0.2).sum(dim=1)  # Reasonable similarity threshold
+            best = int(scores.argmax())
+            best_sim, best_crop = float(scores[best]), crops[best]
             
-            print(f"Best patch score: {best_sim:.4f}")
+            log.debug("Best patch score: %.4f", best_sim)
             return best_crop
         
         # Fall back to standard patch selection
         return _standard_patch_selection(img, text_vec)
     
     except Exception as e:
-        print(f"Error in semantic patch selection: {e}")
+        log.warning("Error in semantic patch selection: %s", e)
         return _standard_patch_selection(img, text_vec)
 
 
@@ -311,7 +697,7 @@ def _standard_patch_selection(img: Image.Image, text_vec: torch.Tensor) -> Image
     """
     try:
         # Ensure inputs are properly formatted
-        text_vec = text_vec.cpu().float()
+        text_vec = text_vec.cpu().float().reshape(1, -1)
         
         # Use a finer grid for more precise patch selection
         FINE_GRID = 5  # 5x5 grid instead of 3x3
@@ -323,42 +709,21 @@ def _standard_patch_selection(img: Image.Image, text_vec: torch.Tensor) -> Image
         # Handle small images
         if pw < 50 or ph < 50:
             return img
-            
-        best_sim, best_crop = -1.0, img
         
-        # Store all similarities for debugging
-        all_sims = {}
+        log.debug("Using standard patch selection with %dx%d grid", FINE_GRID, FINE_GRID)
         
-        print(f"Using standard patch selection with {FINE_GRID}x{FINE_GRID} grid")
-        
-        # Try each grid patch with overlap for better coverage
-        for gy in range(FINE_GRID):
-            for gx in range(FINE_GRID):
-                # Extract patch with some overlap
-                x1 = max(0, gx * pw - pw//4)
-                y1 = max(0, gy * ph - ph//4)
-                x2 = min(w, x1 + pw + pw//2)
-                y2 = min(h, y1 + ph + ph//2)
-                
-                crop = img.crop((x1, y1, x2, y2))
-                
-                # Get embedding and compare
-                emb = _img_embed(crop)
-                sim = torch.cosine_similarity(emb, text_vec)[0].item()
-                
-                # Store this similarity
-                patch_id = f"{gx},{gy}"
-                all_sims[patch_id] = sim
-                
-                if sim > best_sim:
-                    best_sim, best_crop = sim, crop
+        # Score every overlapping grid patch in one batched pass
+        crops, sims = _score_patches(img, _standard_patch_boxes(w, h, FINE_GRID), text_vec)
+        sims = sims[:, 0]
+        best = int(sims.argmax())
+        best_sim, best_crop = float(sims[best]), crops[best]
         
         # Log the best patch info
-        print(f"Best patch similarity: {best_sim:.4f}")
+        log.debug("Best patch similarity: %.4f", best_sim)
         
         # Use a fallback strategy for low similarity scores
         if best_sim < 0.15:
-            print("Low similarity score - using center crop fallback")
+            log.debug("Low similarity score - using center crop fallback")
             # Center crop as fallback
             cw, ch = w//2, h//2
             crop_size = min(cw, ch)
@@ -368,7 +733,7 @@ def _standard_patch_selection(img: Image.Image, text_vec: torch.Tensor) -> Image
 
         return best_crop
     except Exception as e:
-        print(f"Error finding best patch: {e}")
+        log.warning("Error finding best patch: %s", e)
         return img  # Return the full image as fallback
 
 
@@ -379,193 +744,470 @@ def _patch_tags_from_embed(embed: torch.Tensor):
         idx  = sims.topk(TAG_TOP_K).indices
         return {VISUAL_TAGS[i] for i in idx}
     except Exception as e:
-        print(f"Error extracting patch tags: {e}")
+        log.warning("Error extracting patch tags: %s", e)
         return set()  # Return empty set as fallback
 
 
+def _category_targets(target_items):
+    """Map parsed target items to (master categories, sub-categories) to match."""
+    cat_targets = set()
+    subcats = set()
+    
+    for category, item in target_items.items():
+        # Map item to master category
+        if category == "dress":
+            cat_targets.add("Apparel")
+            subcats.add("Dresses")
+        elif category in ["jacket", "shirt"]:
+            cat_targets.add("Apparel")
+            if category == "jacket":
+                subcats.update(["Jackets", "Blazers", "Coats"])
+            else:
+                subcats.update(["Shirts", "Tops", "T-shirts"])
+        elif category == "pants":
+            cat_targets.add("Apparel")
+            subcats.update(["Trousers", "Jeans", "Pants"])
+        elif category == "shoes":
+            cat_targets.add("Footwear")
+            subcats.update(["Shoes", "Sneakers", "Boots"])
+        elif category == "accessories":
+            cat_targets.add("Accessories")
+    return cat_targets, subcats
+
+
+def _key_descriptors(target_descriptors):
+    """Most important descriptors to require: materials, patterns and colors."""
+    key_descriptors = []
+    for group in ("materials", "patterns", "colors"):
+        key_descriptors.extend(target_descriptors.get(group, []))
+    return key_descriptors
+
+
+def _excluded_features(excluded_descriptors):
+    """Excluded colors and materials."""
+    excluded_features = []
+    for group in ("colors", "materials"):
+        excluded_features.extend(excluded_descriptors.get(group, []))
+    return excluded_features
+
+
+def _category_mask(cat_targets, subcats, rows=None):
+    """Master category matches and sub-category / articleType matches one of `subcats`."""
+    return (PRODUCTS.valid[rows if rows is not None else slice(None)] &
+            PRODUCTS.isin("masterCategory", cat_targets, rows) &
+            (PRODUCTS.isin("subCategory", subcats, rows) |
+             PRODUCTS.lower_contains_any("articleType", subcats, rows)))
+
+
+def _descriptor_mask(terms, rows=None):
+    """Any term appears in the product name or equals the base colour."""
+    return (PRODUCTS.name_contains_any(terms, rows) |
+            PRODUCTS.lower_eq_any("baseColour", terms, rows))
+
+
 def filter_products(raw_idxs, target_items, target_descriptors, excluded_descriptors):
     """
     Semantically filter products based on target and excluded features.
+    Each stage is a boolean mask over the columnar PRODUCTS table; a stage
+    that would remove every candidate is skipped.
     """
     try:
         # Start with all products
-        filtered_idxs = raw_idxs.copy() if raw_idxs is not None else []
+        filtered_idxs = np.asarray(raw_idxs if raw_idxs is not None else [], dtype=np.int64)
         
-        if not filtered_idxs:
+        if not len(filtered_idxs):
             return []
         
         # Apply category filters if we have target items
         if target_items:
-            # Get master categories and subcategories to match
-            cat_targets = set()
-            subcats = set()
-            
-            for category, item in target_items.items():
-                # Map item to master category
-                if category == "dress":
-                    cat_targets.add("Apparel")
-                    subcats.add("Dresses")
-                elif category in ["jacket", "shirt"]:
-                    cat_targets.add("Apparel")
-                    if category == "jacket":
-                        subcats.update(["Jackets", "Blazers", "Coats"])
-                    else:
-                        subcats.update(["Shirts", "Tops", "T-shirts"])
-                elif category == "pants":
-                    cat_targets.add("Apparel")
-                    subcats.update(["Trousers", "Jeans", "Pants"])
-                elif category == "shoes":
-                    cat_targets.add("Footwear")
-                    subcats.update(["Shoes", "Sneakers", "Boots"])
-                elif category == "accessories":
-                    cat_targets.add("Accessories")
-                    
+            cat_targets, subcats = _category_targets(target_items)
             if cat_targets and subcats:
-                print(f"Filtering by categories: {cat_targets} - {subcats}")
-                category_filtered = []
-                for idx in filtered_idxs:
-                    try:
-                        product_id = int(IDS[idx])
-                        if product_id not in DOCS:
-                            continue
-                        doc = DOCS[product_id]
-                        
-                        # Check if product matches any of our target categories
-                        master_cat = doc.get("masterCategory")
-                        sub_cat = doc.get("subCategory")
-                        article_type = doc.get("articleType", "").lower()
-                        
-                        # Various ways to match categories
-                        if (master_cat in cat_targets and 
-                            (sub_cat in subcats or 
-                             any(s.lower() in article_type for s in subcats))):
-                            category_filtered.append(idx)
-                    except Exception as e:
-                        # Skip this product if there's an error
-                        continue
-                        
-                if category_filtered:
-                    print(f"Category filtered: {len(category_filtered)} of {len(filtered_idxs)} items")
-                    filtered_idxs = category_filtered
+                log.debug("Filtering by categories: %s - %s", cat_targets, subcats)
+                mask = _category_mask(cat_targets, subcats, filtered_idxs)
+                if mask.any():
+                    log.debug("Category filtered: %d of %d items", mask.sum(), len(filtered_idxs))
+                    filtered_idxs = filtered_idxs[mask]
         
         # Apply descriptor filters for what we want
         if target_descriptors:
-            descriptor_filtered = []
-            
-            # Focus on most important descriptors: materials and colors
-            key_descriptors = []
-            if "materials" in target_descriptors:
-                key_descriptors.extend(target_descriptors["materials"])
-            if "patterns" in target_descriptors:
-                key_descriptors.extend(target_descriptors["patterns"])
-            if "colors" in target_descriptors:
-                key_descriptors.extend(target_descriptors["colors"])
-            
+            key_descriptors = _key_descriptors(target_descriptors)
             if key_descriptors:
-                print(f"Filtering for descriptors: {key_descriptors}")
-                for idx in filtered_idxs:
-                    try:
-                        product_id = int(IDS[idx])
-                        if product_id not in DOCS:
-                            continue
-                        doc = DOCS[product_id]
-                        
-                        # Check product name and properties
-                        product_name = doc.get("productDisplayName", "").lower()
-                        base_color = doc.get("baseColour", "").lower()
-                        
-                        # Match any of our target descriptors in name or color
-                        if any(d in product_name for d in key_descriptors) or any(d == base_color for d in key_descriptors):
-                            descriptor_filtered.append(idx)
-                    except Exception as e:
-                        # Skip this product if there's an error
-                        continue
-                        
-                if descriptor_filtered:
-                    print(f"Descriptor filtered: {len(descriptor_filtered)} of {len(filtered_idxs)} items")
-                    filtered_idxs = descriptor_filtered
+                log.debug("Filtering for descriptors: %s", key_descriptors)
+                mask = PRODUCTS.valid[filtered_idxs] & _descriptor_mask(key_descriptors, filtered_idxs)
+                if mask.any():
+                    log.debug("Descriptor filtered: %d of %d items", mask.sum(), len(filtered_idxs))
+                    filtered_idxs = filtered_idxs[mask]
         
         # Apply exclusion filters for what we don't want
         if excluded_descriptors:
-            remaining_idxs = []
-            
-            # Focus on excluded colors and materials
-            excluded_features = []
-            if "colors" in excluded_descriptors:
-                excluded_features.extend(excluded_descriptors["colors"])
-            if "materials" in excluded_descriptors:
-                excluded_features.extend(excluded_descriptors["materials"])
-            
+            excluded_features = _excluded_features(excluded_descriptors)
             if excluded_features:
-                print(f"Excluding features: {excluded_features}")
-                for idx in filtered_idxs:
-                    try:
-                        product_id = int(IDS[idx])
-                        if product_id not in DOCS:
-                            continue
-                        doc = DOCS[product_id]
-                        
-                        # Check product name and properties
-                        product_name = doc.get("productDisplayName", "").lower()
-                        base_color = doc.get("baseColour", "").lower()
-                        
-                        # Only include if the product DOESN'T match any excluded features
-                        if not any(d in product_name for d in excluded_features) and not any(d == base_color for d in excluded_features):
-                            remaining_idxs.append(idx)
-                    except Exception as e:
-                        # Skip this product if there's an error
-                        continue
-                        
-                if remaining_idxs:
-                    print(f"Exclusion filtered: {len(remaining_idxs)} of {len(filtered_idxs)} items")
-                    filtered_idxs = remaining_idxs
+                log.debug("Excluding features: %s", excluded_features)
+                mask = PRODUCTS.valid[filtered_idxs] & ~_descriptor_mask(excluded_features, filtered_idxs)
+                if mask.any():
+                    log.debug("Exclusion filtered: %d of %d items", mask.sum(), len(filtered_idxs))
+                    filtered_idxs = filtered_idxs[mask]
         
-        return filtered_idxs
+        return filtered_idxs.tolist()
     except Exception as e:
-        print(f"Error in filter_products: {e}")
-        return raw_idxs if raw_idxs is not None else []
+        log.warning("Error in filter_products: %s", e)
+        return list(raw_idxs) if raw_idxs is not None else []
 
 
-def search(text: str | None = None,
-           image_bytes: bytes | None = None,
-           k: int = 9):
+_RETRIEVAL_STATS = Counter()
+_RETRIEVAL_LOCK = threading.Lock()
+
+
+def _count(**increments):
+    with _RETRIEVAL_LOCK:
+        _RETRIEVAL_STATS.update(increments)
+
+
+def retrieval_stats() -> Dict[str, int]:
+    """How often each retrieval path fired (unfiltered, selector, over-fetch, short, late fusion)."""
+    with _RETRIEVAL_LOCK:
+        return dict(_RETRIEVAL_STATS)
+
+
+def _allowed_mask(semantic_components) -> np.ndarray | None:
+    """
+    Full-catalog boolean mask of rows satisfying the parsed constraints, or
+    None when no constraint applies. Stages combine like filter_products:
+    a stage that would leave no product at all is skipped.
+    """
+    target_items, target_descriptors, excluded_descriptors = semantic_components or ({}, {}, {})
+    stages = []
+    if target_items:
+        cat_targets, subcats = _category_targets(target_items)
+        if cat_targets and subcats:
+            stages.append(("category", lambda: _category_mask(cat_targets, subcats)))
+    if key_descriptors := _key_descriptors(target_descriptors or {}):
+        stages.append(("descriptor", lambda: _descriptor_mask(key_descriptors)))
+    if excluded_features := _excluded_features(excluded_descriptors or {}):
+        stages.append(("exclusion", lambda: ~_descriptor_mask(excluded_features)))
+
+    if not stages:
+        return None
+    mask = PRODUCTS.valid
+    for name, stage in stages:
+        narrowed = mask & stage()
+        if narrowed.any():
+            mask = narrowed
+        else:
+            log.debug("Skipping %s filter: no product in the catalog matches", name)
+    return mask
+
+
+def _id_selector(allowed: np.ndarray, meta: Dict[str, Any]):
+    """FAISS selector over allowed rows; returns (selector, buffer that must outlive it)."""
+    if meta.get("id_map"):
+        # id-mapped indexes label vectors with product ids
+        ids = PRODUCTS.product_ids[allowed]
+        return faiss.IDSelectorBatch(ids), ids
+    bitmap = np.packbits(allowed, bitorder="little")
+    return faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap)), bitmap
+
+
+def _labels_to_rows(labels: np.ndarray, scores: np.ndarray, meta: Dict[str, Any]):
+    """FAISS labels → (PRODUCTS rows, their scores), dropping padding (-1) and unknown labels."""
+    if meta.get("id_map"):
+        # labels are product ids; positions are no longer tied to ids.npy order
+        rows = PRODUCTS.row_positions(labels)
+    else:
+        rows = np.where(labels < len(PRODUCTS), labels, -1)
+    keep = rows >= 0
+    return rows[keep], scores[keep]
+
+
+def _retrieve(qvec: np.ndarray, k: int, allowed: np.ndarray | None,
+              nprobe: int | None = None, ef_search: int | None = None, index=None, meta=None):
+    """
+    Top-k PRODUCTS rows for `qvec` restricted to `allowed` (None = every valid row),
+    best first, as (rows, scores) arrays. Searches INDEX unless another
+    `index` and its `meta` (one of MODAL_INDEXES) are given.
+
+    With RETRIEVAL_SELECTOR the mask is pushed into FAISS as an IDSelector and
+    exactly k results are requested; otherwise OVERFETCH_FACTOR·k neighbours are
+    fetched and post-filtered. Either way, when fewer than k allowed rows come
+    back the search widens by OVERFETCH_GROWTH per round (more neighbours, more
+    IVF lists probed, larger HNSW beam) until k are found or the index is exhausted.
+    """
+    if index is None:
+        index, meta = INDEX, INDEX_META
+    q = qvec[None, :]
+    if allowed is None:
+        if PRODUCTS.valid.all():
+            _count(unfiltered=1)
+            D, I = index.search(q, k, params=ann_index.search_params(meta, nprobe, ef_search))
+            return _labels_to_rows(I[0], D[0], meta)
+        allowed = PRODUCTS.valid
+
+    want = min(k, int(allowed.sum()))
+    if want == 0:
+        _count(short=1)
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    kind = meta.get("type", "flat")
+    ntotal = index.ntotal
+    nlist = meta.get("params", {}).get("nlist") or 1
+    nprobe = nprobe or ann_index.ANN_NPROBE
+    ef_search = max(ef_search or ann_index.ANN_EF_SEARCH, want)
+    fetch = min(ntotal, max(k * OVERFETCH_FACTOR, k))
+    use_selector = RETRIEVAL_SELECTOR
+
+    rounds, rows, scores = 0, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    while True:
+        rounds += 1
+        if use_selector:
+            try:
+                sel, _keepalive = _id_selector(allowed, meta)
+                params = ann_index.search_params(meta, nprobe, ef_search, sel=sel)
+                D, I = index.search(q, want, params=params)
+                rows, scores = _labels_to_rows(I[0], D[0], meta)
+            except Exception as e:
+                _count(selector_error=1)
+                log.warning("IDSelector search failed, falling back to over-fetch: %s", e)
+                use_selector, rounds = False, 0
+                continue
+        else:
+            params = ann_index.search_params(meta, nprobe, max(ef_search, fetch))
+            D, I = index.search(q, fetch, params=params)
+            rows, scores = _labels_to_rows(I[0], D[0], meta)
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+        if len(rows) >= want:
+            break
+
+        # widen whatever still limits recall; stop once nothing can grow
+        exhausted = ((use_selector or fetch >= ntotal) and
+                     (kind == "flat" or
+                      (kind == "hnsw" and ef_search >= ntotal) or
+                      (kind in ("ivf_flat", "ivf_pq") and nprobe >= nlist)))
+        if exhausted:
+            break
+        fetch = min(ntotal, fetch * OVERFETCH_GROWTH)
+        nprobe = min(nlist, nprobe * OVERFETCH_GROWTH)
+        ef_search = min(ntotal, ef_search * OVERFETCH_GROWTH)
+
+    path = "selector" if use_selector else "overfetch"
+    _count(**{path: 1, f"{path}_rounds": rounds})
+    if rounds > 1:
+        _count(**{f"{path}_widened": 1})
+    if len(rows) < want:
+        _count(short=1)
+    return rows[:want], scores[:want]
+
+
+# ─── late fusion over separate text / image indexes ──────────────────────
+_LATE_POOL_LOCK = threading.Lock()
+
+
+def _index_weights(text_weight: float | None, has_text: bool) -> Dict[str, float]:
+    """{"text": w, "image": 1 - w}: the request's weight, else the default for this kind of query."""
+    if text_weight is None:
+        text_weight = LATE_FUSION_TEXT_WEIGHT if has_text else LATE_FUSION_IMAGE_TEXT_WEIGHT
+    w = min(max(float(text_weight), 0.0), 1.0)
+    return {"text": w, "image": 1.0 - w}
+
+
+def _per_modality(fn, modalities) -> Dict[str, Any]:
+    """fn(modality) for each of `modalities`; all but the first run on the late-fusion pool meanwhile."""
+    global _LATE_POOL
+    if LATE_FUSION_THREADS <= 0 or len(modalities) < 2:
+        return {m: fn(m) for m in modalities}
+    if _LATE_POOL is None:
+        with _LATE_POOL_LOCK:
+            if _LATE_POOL is None:
+                _LATE_POOL = ThreadPoolExecutor(LATE_FUSION_THREADS, thread_name_prefix="late-fusion")
+    first, *rest = modalities
+    futures = {m: _LATE_POOL.submit(fn, m) for m in rest}
+    out = {first: fn(first)}   # FAISS releases the GIL, so both searches really overlap
+    out.update((m, f.result()) for m, f in futures.items())
+    return out
+
+
+def _modal_scores(modality: str, qvec: np.ndarray, rows: np.ndarray, hit) -> np.ndarray:
+    """
+    Inner product of `qvec` with each of `rows` (sorted) in one modality index:
+    the index's own hits keep their search scores, the other candidates are
+    scored from reconstructed vectors (or get its lowest hit score when the
+    index cannot reconstruct).
+    """
+    index, meta = MODAL_INDEXES[modality]
+    hit_rows, hit_scores = hit
+    found = np.zeros(len(rows), dtype=bool)
+    found[np.searchsorted(rows, hit_rows)] = True
+    out = np.empty(len(rows), dtype=np.float32)
+    out[found] = hit_scores[np.argsort(hit_rows, kind="stable")]
+    missing = rows[~found]
+    if not len(missing):
+        return out
+    if meta["rescore"]:
+        # every label is present: the indexes are aligned and rows came from their hits
+        labels = PRODUCTS.product_ids[missing] if meta.get("id_map") else missing
+        out[~found] = index.reconstruct_batch(np.ascontiguousarray(labels, dtype=np.int64)) @ qvec
+    else:
+        out[~found] = hit_scores.min() if len(hit_scores) else 0.0
+    return out
+
+
+def _fuse_hits(qvec: np.ndarray, hits: Dict[str, tuple], k: int, weights: Dict[str, float], depth: int):
+    """
+    (rows, scores, complete): top-k of the union of the per-index hits by
+    Σ weight · score, every candidate scored in every weighted index. A row
+    no index returned scores at most Σ weight · (that index's lowest hit), so
+    the ranking is `complete` once the k-th score reaches that bound, or when
+    an index returned fewer than `depth` rows (every allowed row was seen).
+    """
+    hits = {m: hit for m, hit in hits.items() if weights[m] > 0}
+    rows = np.unique(np.concatenate([r for r, _ in hits.values()]))
+    if not len(rows):
+        return rows.astype(np.int64), np.empty(0, dtype=np.float32), True
+    fused = np.zeros(len(rows), dtype=np.float32)
+    for m, hit in hits.items():
+        fused += np.float32(weights[m]) * _modal_scores(m, qvec, rows, hit)
+    order = np.argsort(-fused, kind="stable")[:k]
+    rows, fused = rows[order], fused[order]
+    if any(len(r) < depth for r, _ in hits.values()):
+        return rows, fused, True
+    bound = sum(weights[m] * float(s.min()) for m, (_, s) in hits.items())
+    return rows, fused, len(rows) >= k and fused[k - 1] >= bound
+
+
+def _first_depth(k: int) -> int:
+    # another round re-scans both indexes, while a deeper first round costs
+    # little more than a shallow one: start generously
+    return max(k * LATE_FUSION_DEPTH, LATE_FUSION_MIN_DEPTH)
+
+
+def _late_retrieve(qvec: np.ndarray, k: int, allowed: np.ndarray | None,
+                   nprobe: int | None, ef_search: int | None, weights: Dict[str, float],
+                   depth: int | None = None):
+    """
+    _retrieve() over MODAL_INDEXES: every index with a non-zero weight gives
+    its `depth` (see _first_depth) best allowed rows, searched in parallel,
+    and the candidates are ranked by their weighted text and image scores.
+    While a better row could still be hiding below the hits, depth grows by
+    OVERFETCH_GROWTH, up to LATE_FUSION_MAX_DEPTH.
+    """
+    active = [m for m in ann_index.MODALITIES if weights[m] > 0]
+    ntotal = MODAL_INDEXES[active[0]][0].ntotal
+    depth = min(ntotal, depth or _first_depth(k))
+    rounds = 0
+    while True:
+        rounds += 1
+        hits = _per_modality(
+            lambda m: _retrieve(qvec, depth, allowed, nprobe, ef_search, *MODAL_INDEXES[m]), active)
+        rows, scores, complete = _fuse_hits(qvec, hits, k, weights, depth)
+        if complete or depth >= min(ntotal, LATE_FUSION_MAX_DEPTH):
+            break
+        depth = min(ntotal, LATE_FUSION_MAX_DEPTH, depth * OVERFETCH_GROWTH)
+    _count(late_fusion=1, late_fusion_rounds=rounds)
+    if not complete:
+        _count(late_fusion_capped=1)
+    return rows, scores
+
+
+def _late_retrieve_many(qmat: np.ndarray, k: int, allowed: List[np.ndarray | None],
+                        nprobe: int | None, ef_search: int | None, weights: List[Dict[str, float]]):
+    """
+    _late_retrieve() for a stacked query matrix: one _retrieve_many() per
+    index; queries whose ranking is not complete after it widen on their own.
+    """
+    active = [m for m in ann_index.MODALITIES if any(w[m] > 0 for w in weights)]
+    ntotal = MODAL_INDEXES[active[0]][0].ntotal
+    depth = min(ntotal, _first_depth(k))
+    hits = _per_modality(
+        lambda m: _retrieve_many(qmat, depth, allowed, nprobe, ef_search, *MODAL_INDEXES[m]), active)
+    out = []
+    for j, w in enumerate(weights):
+        rows, scores, complete = _fuse_hits(qmat[j], {m: hits[m][j] for m in active}, k, w, depth)
+        if complete or depth >= min(ntotal, LATE_FUSION_MAX_DEPTH):
+            _count(late_fusion=1, late_fusion_rounds=1)
+        else:
+            rows, scores = _late_retrieve(qmat[j], k, allowed[j], nprobe, ef_search, w,
+                                          depth=min(LATE_FUSION_MAX_DEPTH, depth * OVERFETCH_GROWTH))
+        out.append((rows, scores))
+    return out
+
+
+def _fuse_vectors(vecs: List[np.ndarray], semantic_components) -> np.ndarray:
+    """Weighted text / image query vector, L2-normalised float32."""
+    # Weight vectors (text has more weight for semantic queries)
+    if len(vecs) > 1 and semantic_components and any(semantic_components):
+        # For highly specific semantic queries, text should have more weight
+        weights = np.array([0.65, 0.35])  # Text 65%, Image 35%
+        qvec = np.average(vecs, axis=0, weights=weights)
+    elif len(vecs) > 1:
+        # Standard text+image query
+        weights = np.array([0.55, 0.45])  # Text 55%, Image 45%
+        qvec = np.average(vecs, axis=0, weights=weights)
+    else:
+        qvec = vecs[0]
+
+    qvec = qvec.astype('float32')  # Ensure float32 for FAISS
+    qvec /= np.linalg.norm(qvec)
+    return qvec
+
+
+def _ranked(rows: np.ndarray, scores: np.ndarray, patch: str | None, semantic_components) -> Dict[str, Any]:
+    """rank_candidates() payload for retrieved PRODUCTS rows."""
+    product_ids = IDS[rows].astype(np.int64) if len(rows) else np.empty(0, dtype=np.int64)
+    return {"patch": patch, "ids": product_ids.tolist(),
+            "scores": np.asarray(scores, dtype=np.float32).tolist(),
+            "semantic": semantic_components}
+
+
+def _rank_candidates(text: str | None = None,
+                     image_bytes: bytes | None = None,
+                     k: int = 9,
+                     nprobe: int | None = None,
+                     ef_search: int | None = None,
+                     text_weight: float | None = None) -> Dict[str, Any]:
     """
     True semantic multimodal search that handles complex queries including:
     - Material/item understanding (denim jacket, floral dress)
     - Negation ("not red", "similar design but not red") 
     - Visual region focus based on semantic understanding
+
+    `nprobe` (IVF indexes) and `ef_search` (HNSW) override the ANN search
+    defaults for this call; they are ignored for a flat index. With separate
+    text / image indexes, `text_weight` (0-1) weights the text-index score
+    against the image-index score (LATE_FUSION_* defaults when None); it has
+    no effect on a fused index.
+
+    Returns the ranked candidates, all model and index work done:
+        {"patch":    data URI of the query-image preview or None,
+         "ids":      top-k product ids, best first,
+         "scores":   their inner-product scores,
+         "semantic": parsed (items, descriptors, excluded) or None}
+    build_results() turns any slice of `ids` into result dicts.
     """
     try:
         # Parse the query semantically
         semantic_components = None
         if text:
-            target_items, target_descriptors, excluded_descriptors = parse_semantic_query(text)
+            with span("parse"):
+                target_items, target_descriptors, excluded_descriptors = parse_semantic_query(text)
             semantic_components = (target_items, target_descriptors, excluded_descriptors)
             
-            # Use standard print formatting to avoid Unicode issues
-            print(f"Semantic query analysis:")
-            print(f"- Target items: {target_items}")
-            print(f"- Target descriptors: {target_descriptors}")
-            print(f"- Excluded descriptors: {excluded_descriptors}")
+            log.debug("Semantic query analysis: items=%s descriptors=%s excluded=%s",
+                      target_items, target_descriptors, excluded_descriptors)
         
         # 1) ── text → embedding + keywords
         vecs, text_vec, text_kw = [], None, set()
         if text:
             try:
-                print(f"Processing text query: {text}")
+                log.debug("Processing text query: %s", text)
                 
-                # Get text embedding
-                tok = tokenize([text]).to(DEVICE)
-                with torch.no_grad():
-                    text_vec = model.encode_text(tok)
-                    text_vec = text_vec.float()  # Convert to float32
-                text_vec = text_vec / text_vec.norm(dim=-1, keepdim=True)
-                vecs.append(text_vec.cpu().numpy()[0])
+                # Get text embedding (cached on the normalized query)
+                with span("text_embedding"):
+                    text_vec = _text_embed(text)
+                vecs.append(text_vec.numpy()[0])
                 
-                # Extract keywords using RAKE
-                rk = Rake()
-                rk.extract_keywords_from_text(text)
-                text_kw = {p.lower() for p in rk.get_ranked_phrases()[:5]}
+                # Extract keywords using RAKE (one extractor per thread)
+                with span("rake"):
+                    text_kw = query_parser.extract_keywords(text)
                 
                 # Add semantic components to keywords
                 if semantic_components:
@@ -579,146 +1221,347 @@ def search(text: str | None = None,
                         for desc in desc_list:
                             text_kw.add(desc)
                 
-                print(f"Final text keywords: {text_kw}")
+                log.debug("Final text keywords: %s", text_kw)
             except Exception as e:
-                print(f"Error processing text input: {e}")
+                log.warning("Error processing text input: %s", e)
 
                         # 2) ── image → patch → vec & tags
         patch_b64, user_patch_vec, user_tags = None, None, set()
         if image_bytes:
             try:
-                print("Processing image input")
-                full_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-                # ─── simple center-zoom with integer coords ───────────────────────────
-                w, h     = full_img.size
-                zoom      = 1.2
-                cw, ch    = int(w / zoom), int(h / zoom)
-                left, top = (w - cw) // 2, (h - ch) // 2
-                box       = (left, top, left + cw, top + ch)
-                print(f"Zoom-crop box: {box}")   # should be something like (32,16,288,272)
-                patch_img = full_img.crop(box).resize((w, h), Image.LANCZOS)
-
-                # embed that zoomed image
-                user_patch_vec = _img_embed(patch_img)
-                vecs.append(user_patch_vec.cpu().numpy()[0])
-
-                # save preview for the API response
-                buf      = io.BytesIO()
-                patch_img.save(buf, format="JPEG")
-                patch_b64 = "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
-
-                # extract tags
-                user_tags = _patch_tags_from_embed(user_patch_vec)
-                print(f"Image tags: {user_tags}")
+                log.debug("Processing image input")
+                cached = IMAGE_CACHE.get(image_bytes) if IMAGE_CACHE is not None else None
+                if cached is not None:
+                    # same bytes seen before: no decode, resize or encode
+                    log.debug("Query image served from the image cache")
+                    vecs.append(cached.vec)
+                    patch_b64, user_tags = cached.preview, set(cached.tags)
+                else:
+                    # reduced-size decode, one resize to model resolution, bounded preview
+                    with span("image_decode"):
+                        query_img = image_ingest.prepare_query_image(image_bytes)
+                    log.debug("Query image %s -> %s", query_img.source_size, query_img.model_image.size)
+
+                    # embed the center-zoomed crop
+                    with span("image_embedding"):
+                        user_patch_vec = _img_embed(query_img.model_image)
+                    vec = user_patch_vec.cpu().numpy()[0].astype(np.float32)
+                    vecs.append(vec)
+
+                    # preview for the API response
+                    patch_b64 = query_img.preview_uri
 
+                    # extract tags
+                    user_tags = _patch_tags_from_embed(user_patch_vec)
+
+                    # _img_embed returns zeros on failure; never cache that
+                    if IMAGE_CACHE is not None and np.any(vec):
+                        IMAGE_CACHE.put(image_bytes, ImageEntry(vec, sorted(user_tags), patch_b64))
+                log.debug("Image tags: %s", user_tags)
+
+            except image_ingest.ImageTooLarge:
+                raise
             except Exception as e:
-                print(f"Error processing image input: {e}")
+                log.warning("Error processing image input: %s", e)
 
 
 
         # Nothing to search with
         if not vecs:
-            print("No inputs for search")
-            return []
+            log.debug("No inputs for search")
+            return {"patch": None, "ids": [], "scores": [], "semantic": semantic_components}
 
         # 3) ── Combine vectors and search
-        print(f"Searching with {len(vecs)} vectors")
+        log.debug("Searching with %d vectors", len(vecs))
         
-        # Weight vectors (text has more weight for semantic queries)
-        if len(vecs) > 1 and semantic_components and any(semantic_components):
-            # For highly specific semantic queries, text should have more weight
-            weights = np.array([0.65, 0.35])  # Text 65%, Image 35%
-            qvec = np.average(vecs, axis=0, weights=weights)
-        elif len(vecs) > 1:
-            # Standard text+image query
-            weights = np.array([0.55, 0.45])  # Text 55%, Image 45%
-            qvec = np.average(vecs, axis=0, weights=weights)
-        else:
-            qvec = vecs[0]
-        
-        qvec = qvec.astype('float32')  # Ensure float32 for FAISS
-        qvec /= np.linalg.norm(qvec)
-        
-        # Get raw search results - get more results for filtering
-        _, I = INDEX.search(qvec[None, :], min(k*8, 500))  # Cap at 500 to avoid memory issues
-        raw_idxs = [int(idx) for idx in I[0] if 0 <= idx < len(IDS)]  # Ensure valid indices
-        print(f"Raw search results: {len(raw_idxs)} items")
+        with span("fusion"):
+            qvec = _fuse_vectors(vecs, semantic_components)
+
+        # 4) ── Retrieve with the semantic filters pushed into the vector search
+        with span("filter"):
+            allowed = _allowed_mask(semantic_components) if semantic_components else None
+        with span("faiss_search"):
+            if MODAL_INDEXES is None:
+                rows, scores = _retrieve(qvec, k, allowed, nprobe, ef_search)
+            else:
+                weights = _index_weights(text_weight, has_text=text_vec is not None)
+                rows, scores = _late_retrieve(qvec, k, allowed, nprobe, ef_search, weights)
+        log.debug("Filtered search results: %d items", len(rows))
+
+        # 5) ── Rows → product ids (metadata lookups happen in build_results)
+        return _ranked(rows, scores, patch_b64, semantic_components)
         
-        # 4) ── Apply semantic filters based on query understanding
-        filtered_idxs = raw_idxs
-        if semantic_components:
-            target_items, target_descriptors, excluded_descriptors = semantic_components
-            filtered_idxs = filter_products(raw_idxs, target_items, target_descriptors, excluded_descriptors)
-            
-        # 5) ── Extract product IDs and prepare results
-        result_products = []
-        for idx in filtered_idxs[:k]:
+    except image_ingest.ImageTooLarge:
+        raise   # the API answers 413
+    except Exception as e:
+        log.exception("Search function error: %s", e)
+        return {"patch": None, "ids": [], "scores": [], "semantic": None, "error": str(e)}
+
+
+def _ranked_nbytes(ranked: Dict[str, Any]) -> int:
+    """Rough in-memory size of a cached ranking (list slots + boxed ints/floats + preview)."""
+    return 512 + 72 * len(ranked["ids"]) + len(ranked["patch"] or "")
+
+
+def _result_key(text, image_bytes, k, nprobe, ef_search, text_weight=None) -> tuple:
+    image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest() if image_bytes else None
+    return (INDEX_VERSION, _normalize_text(text or ""), image_hash, k, nprobe, ef_search, text_weight)
+
+
+def rank_candidates(text: str | None = None,
+                    image_bytes: bytes | None = None,
+                    k: int = 9,
+                    nprobe: int | None = None,
+                    ef_search: int | None = None,
+                    text_weight: float | None = None) -> Dict[str, Any]:
+    """
+    _rank_candidates() behind RESULT_CACHE. Identical searches (normalized
+    text, image bytes hash, k, ANN params and weight) are answered from the cache, and
+    concurrent identical misses are coalesced so only one of them computes.
+    Keys include INDEX_VERSION, so a reloaded index never serves stale rankings.
+    The returned dict is shared between callers and must not be modified.
+    """
+    if RESULT_CACHE.maxsize <= 0:
+        return _rank_candidates(text, image_bytes, k, nprobe, ef_search, text_weight)
+    key = _result_key(text, image_bytes, k, nprobe, ef_search, text_weight)
+    ranked = RESULT_CACHE.get(key)
+    if ranked is not None:
+        return ranked
+
+    def compute():
+        ranked = _rank_candidates(text, image_bytes, k, nprobe, ef_search, text_weight)
+        if "error" not in ranked:      # failures are retried, not cached
+            RESULT_CACHE.put(key, ranked)
+        return ranked
+    return _RESULT_FLIGHTS.do(key, compute)
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    """Result-cache counters, coalesced in-flight searches and the index version in use."""
+    return {**RESULT_CACHE.stats(), **_RESULT_FLIGHTS.stats(), "index_version": INDEX_VERSION}
+
+
+def build_results(product_ids, semantic_components=None, start_rank: int = 1) -> List[Dict[str, Any]]:
+    """Result dicts (with a `why` explanation) for ranked product ids; unknown ids are skipped."""
+    with span("build_results"):
+        return CARDS.results(product_ids, semantic_components, start_rank)
+
+
+def search_compact(text: str | None = None,
+                   image_bytes: bytes | None = None,
+                   k: int = 9,
+                   nprobe: int | None = None,
+                   ef_search: int | None = None,
+                   text_weight: float | None = None) -> Dict[str, Any]:
+    """
+    One page of results: {"patch": query-image preview or None, "results": [result dicts]}.
+    See rank_candidates() for the arguments.
+    """
+    ranked = rank_candidates(text, image_bytes, k, nprobe, ef_search, text_weight)
+    results = build_results(ranked["ids"], ranked["semantic"])
+    log.debug("Final results: %d items", len(results))
+    return {"patch": ranked["patch"], "results": results}
+
+
+def search(text: str | None = None,
+           image_bytes: bytes | None = None,
+           k: int = 9,
+           nprobe: int | None = None,
+           ef_search: int | None = None,
+           text_weight: float | None = None) -> List[Dict[str, Any]]:
+    """Legacy (v1) shape of search_compact(): a list of results, each carrying the query's patch preview."""
+    response = search_compact(text, image_bytes, k, nprobe, ef_search, text_weight)
+    return [{**r, "patch": response["patch"]} for r in response["results"]]
+
+
+# ─── batch search ─────────────────────────────────────────────────────────
+def _text_vectors_many(texts: List[str]) -> List[np.ndarray]:
+    """(D,) embeddings for `texts`; cache misses are encoded together in batched passes."""
+    keys = [_normalize_text(t) for t in texts]
+    found, misses = {}, []
+    for key in dict.fromkeys(keys):
+        vec = VOCAB_EMBEDS.get(key)
+        if vec is None:
+            vec = TEXT_CACHE.get(key)
+        if vec is None:
+            misses.append(key)
+        else:
+            found[key] = vec
+    for i in range(0, len(misses), SEARCH_MANY_TEXT_BATCH):
+        chunk = misses[i:i + SEARCH_MANY_TEXT_BATCH]
+        for key, vec in zip(chunk, _encode_texts(chunk).split(1)):
+            TEXT_CACHE.put(key, vec)
+            found[key] = vec
+    return [found[key].numpy()[0] for key in keys]
+
+
+def _image_entries_many(images: List[bytes]) -> List[ImageEntry | Exception | None]:
+    """
+    ImageEntry per upload, from IMAGE_CACHE or encoded PATCH_BATCH_SIZE crops
+    per forward pass. Over-limit uploads give their ImageTooLarge; unreadable
+    ones give None and are ignored, as in the single-query path. If a batched
+    pass fails, its images are encoded one by one, and one that still fails
+    gives a ValueError for that query only.
+    """
+    out: List[ImageEntry | Exception | None] = [None] * len(images)
+    todo = []   # (position, QueryImage, preprocessed tensor)
+    for i, data in enumerate(images):
+        cached = IMAGE_CACHE.get(data) if IMAGE_CACHE is not None else None
+        if cached is not None:
+            out[i] = cached
+            continue
+        try:
+            with span("image_decode"):
+                query_img = image_ingest.prepare_query_image(data)
+            todo.append((i, query_img, preprocess(query_img.model_image)))
+        except image_ingest.ImageTooLarge as e:
+            out[i] = e
+        except Exception as e:
+            log.warning("Error processing image input: %s", e)
+    for start in range(0, len(todo), PATCH_BATCH_SIZE):
+        chunk = todo[start:start + PATCH_BATCH_SIZE]
+        try:
+            with span("image_embedding"):
+                vecs = list(_encode_image_tensors([t for _, _, t in chunk]).split(1))
+        except Exception as e:
+            log.warning("Batched image encode failed (%s) - encoding %d images one by one", e, len(chunk))
+            vecs = [_encode_image_or_error(t) for _, _, t in chunk]
+        for (i, query_img, _), vec in zip(chunk, vecs):
             try:
-                product_id = int(IDS[idx])
-                if product_id not in DOCS:
-                    continue
-                    
-                # Get the product data
-                product = DOCS[product_id]
-                
-                # Generate a meaningful explanation
-                why = "Matched based on your search criteria"
-                
-                if semantic_components:
-                    target_items, target_descriptors, excluded = semantic_components
-                    
-                    # Explain the match based on semantics
-                    article_type = product.get('articleType', '').lower()
-                    base_color = product.get('baseColour', '').lower()
-                    
-                    # Build explanation based on matched criteria
-                    reasons = []
-                    
-                    # Check if we matched a target item
-                    for category, item in target_items.items():
-                        if item.lower() in article_type or item.lower() in product.get('productDisplayName', '').lower():
-                            reasons.append(item)
-                    
-                    # Check if we matched descriptors
-                    for category, descriptors in target_descriptors.items():
-                        for desc in descriptors:
-                            if desc == base_color or desc in product.get('productDisplayName', '').lower():
-                                if desc not in reasons:  # Avoid duplicates
-                                    reasons.append(desc)
-                    
-                    if reasons:
-                        why = f"Matched: **{' '.join(reasons)} {article_type}**"
-                    else:
-                        why = f"Matched: **{base_color} {article_type}** similar to your query"
-                
-                # Prepare the result
-                result_products.append({
-                    "id": product_id,
-                    "rank": len(result_products) + 1,
-                    "name": product["productDisplayName"],
-                    "image": product.get("image_url") or product.get("image_filename"),
-                    "rating": float(product.get("rating", 0)) if product.get("rating") is not None else 0,
-                    "numReviews": int(product.get("numReviews", 0)),
-                    "price": float(product.get("price")) if product.get("price") is not None else None,
-                    "discount": float(product.get("discountPercent")) if product.get("discountPercent") is not None else None,
-                    "why": why,
-                    "patch": patch_b64
-                })
+                if isinstance(vec, Exception):
+                    raise vec
+                entry = ImageEntry(vec.numpy()[0].astype(np.float32), sorted(_patch_tags_from_embed(vec)),
+                                   query_img.preview_uri)
             except Exception as e:
-                print(f"Error processing result {idx}: {e}")
+                log.warning("Error encoding image input: %s", e)
+                out[i] = ValueError(f"Image could not be encoded: {e}")
                 continue
-        
-        print(f"Final results: {len(result_products)} items")
-        return result_products
-        
+            if IMAGE_CACHE is not None:
+                IMAGE_CACHE.put(images[i], entry)
+            out[i] = entry
+    return out
+
+
+def _encode_image_or_error(tensor):
+    """One image through the encoder, or the exception it raised."""
+    try:
+        with span("image_embedding"):
+            return _encode_image_tensors([tensor])
     except Exception as e:
-        import traceback
-        print(f"Search function error: {e}")
-        # Avoid Unicode encoding issues in traceback
-        try:
-            print(traceback.format_exc())
-        except UnicodeEncodeError:
-            print("Error: Unicode encoding issue in traceback")
-        return []
+        return e
+
 
+def _retrieve_many(qmat: np.ndarray, k: int, allowed: List[np.ndarray | None],
+                   nprobe: int | None = None, ef_search: int | None = None, index=None, meta=None):
+    """
+    _retrieve() for a stacked (Q x D) query matrix: one index.search for every
+    query, over-fetching when some of them are filtered, then the per-query
+    masks are applied. Queries left short by their filter fall back to
+    _retrieve() (selector / widening) on their own.
+    """
+    if index is None:
+        index, meta = INDEX, INDEX_META
+    filtered = any(a is not None for a in allowed) or not PRODUCTS.valid.all()
+    fetch = min(index.ntotal, k * OVERFETCH_FACTOR if filtered else k)
+    ef = max(ef_search or ann_index.ANN_EF_SEARCH, fetch)
+    D, I = index.search(qmat, fetch, params=ann_index.search_params(meta, nprobe, ef))
+    _count(batched=len(qmat))
+
+    out, wants = [], {}
+    for j, mask in enumerate(allowed):
+        rows, scores = _labels_to_rows(I[j], D[j], meta)
+        if filtered:
+            mask = PRODUCTS.valid if mask is None else mask
+            keep = mask[rows]
+            rows, scores = rows[keep], scores[keep]
+            if id(mask) not in wants:
+                wants[id(mask)] = min(k, int(mask.sum()))
+            if len(rows) < wants[id(mask)]:
+                rows, scores = _retrieve(qmat[j], k, allowed[j], nprobe, ef_search, index, meta)
+        out.append((rows[:k], scores[:k]))
+    return out
+
+
+def rank_candidates_many(queries: List[Dict[str, Any]], k: int = 9,
+                         nprobe: int | None = None, ef_search: int | None = None,
+                         text_weight: float | None = None) -> List[Dict[str, Any]]:
+    """
+    rank_candidates() for many queries ({"text": ..., "image_bytes": ...} each)
+    at once. Parsing and filters stay per query, but text and image cache
+    misses are encoded in batched forward passes and FAISS is searched once
+    with the stacked query matrix. RESULT_CACHE hits skip all of it and new
+    rankings are cached for later single searches. An upload over the limits,
+    or one the encoder fails on, gives that query {"error": ...} instead of
+    failing the batch.
+    """
+    out: List[Dict[str, Any] | None] = [None] * len(queries)
+    keys = [_result_key(q.get("text"), q.get("image_bytes"), k, nprobe, ef_search, text_weight) for q in queries]
+    todo = []
+    for i, key in enumerate(keys):
+        hit = RESULT_CACHE.get(key) if RESULT_CACHE.maxsize > 0 else None
+        if hit is not None:
+            out[i] = hit
+        else:
+            todo.append(i)
+    if not todo:
+        return out
+
+    texts = {i: queries[i]["text"] for i in todo if queries[i].get("text")}
+    images = {i: queries[i]["image_bytes"] for i in todo if queries[i].get("image_bytes")}
+    with span("parse"):
+        semantic = {i: parse_semantic_query(text) for i, text in texts.items()}
+    with span("text_embedding"):
+        text_vecs = dict(zip(texts, _text_vectors_many(list(texts.values())))) if texts else {}
+    image_entries = dict(zip(images, _image_entries_many(list(images.values())))) if images else {}
+
+    searchable, qvecs, patches = [], [], {}
+    with span("fusion"):
+        for i in todo:
+            entry = image_entries.get(i)
+            if isinstance(entry, Exception):
+                out[i] = {"patch": None, "ids": [], "scores": [], "semantic": None, "error": str(entry)}
+                continue
+            vecs = [v for v in (text_vecs.get(i), entry.vec if entry is not None else None) if v is not None]
+            patches[i] = entry.preview if entry is not None else None
+            if not vecs:
+                out[i] = {"patch": None, "ids": [], "scores": [], "semantic": semantic.get(i)}
+                continue
+            searchable.append(i)
+            qvecs.append(_fuse_vectors(vecs, semantic.get(i)))
+
+    if searchable:
+        with span("filter"):
+            masks = {}   # identical parses share one mask
+            allowed = []
+            for i in searchable:
+                sc = semantic.get(i)
+                key = json.dumps(sc, sort_keys=True)
+                if key not in masks:
+                    masks[key] = _allowed_mask(sc) if sc else None
+                allowed.append(masks[key])
+        with span("faiss_search"):
+            if MODAL_INDEXES is None:
+                retrieved = _retrieve_many(np.stack(qvecs), k, allowed, nprobe, ef_search)
+            else:
+                weights = [_index_weights(text_weight, has_text=i in text_vecs) for i in searchable]
+                retrieved = _late_retrieve_many(np.stack(qvecs), k, allowed, nprobe, ef_search, weights)
+        for i, (rows, scores) in zip(searchable, retrieved):
+            out[i] = _ranked(rows, scores, patches[i], semantic.get(i))
+            RESULT_CACHE.put(keys[i], out[i])
+    return out
+
+
+def search_many(queries: List[Dict[str, Any]], k: int = 9,
+                nprobe: int | None = None, ef_search: int | None = None,
+                text_weight: float | None = None) -> List[Dict[str, Any]]:
+    """
+    search_compact() for each of `queries` via rank_candidates_many(), in
+    order; a failed query carries an "error" message next to empty results.
+    """
+    responses = []
+    for ranked in rank_candidates_many(queries, k, nprobe, ef_search, text_weight):
+        response = {"patch": ranked["patch"], "results": build_results(ranked["ids"], ranked["semantic"])}
+        if "error" in ranked:
+            response["error"] = ranked["error"]
+        responses.append(response)
+    return responses
@@ -1,7 +1,19 @@
-import os
-from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, Depends
+import asyncio, base64, binascii, json, logging, os
+from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from search_backend import search, DOCS
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+import search_backend
+from search_backend import (search, search_compact, search_many, rank_candidates, build_results,
+                            encoder_stats, retrieval_stats, result_cache_stats)
+from executor import SEARCH_EXECUTOR, ExecutorBusy
+from lifecycle import LIFECYCLE
+from category_index import CategoryIndex, normalize_category
+import image_ingest
+import schemas
+import telemetry
+from telemetry import span
+from pagination import CANDIDATE_CACHE, PAGE_CANDIDATES, DEFAULT_PAGE_SIZE, CursorExpired, InvalidCursor
 import time
 import uvicorn
 import sys
@@ -9,17 +21,36 @@ import sys
 # allow macOS accelerator hack
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-print(f"Python version: {sys.version}")
-print(f"Current working directory: {os.getcwd()}")
+telemetry.configure_logging()   # LOG_LEVEL=DEBUG shows every request's parsing / filtering steps
+log = logging.getLogger("server")
+
+log.info("Python version: %s", sys.version)
+log.info("Current working directory: %s", os.getcwd())
 
 # Add the Backend directory to the path if needed
 backend_dir = os.path.dirname(os.path.abspath(__file__))
 if backend_dir not in sys.path:
     sys.path.append(backend_dir)
-    print(f"Added {backend_dir} to sys.path")
+    log.info("Added %s to sys.path", backend_dir)
+
+try:
+    import orjson  # optional, much faster JSON encoding
+    DefaultResponse = ORJSONResponse
+    _json_line = lambda obj: orjson.dumps(obj) + b"\n"
+except ImportError:
+    DefaultResponse = JSONResponse
+    _json_line = lambda obj: (json.dumps(obj) + "\n").encode()
+
+# /api/search/batch: queries per executor call, and the batch size from which answers stream as NDJSON
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", 256))
+BATCH_STREAM_MIN = int(os.environ.get("BATCH_STREAM_MIN", 64))
+
+# gzip | br | none  (br needs the optional brotli-asgi package, else gzip is used)
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "gzip")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", 1024))
 
 # 1️⃣ Create the app
-app = FastAPI()
+app = FastAPI(default_response_class=DefaultResponse)
 
 # 2️⃣ Enable CORS
 app.add_middleware(
@@ -28,8 +59,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# 2️⃣b Compress large responses (search results, category pages)
+if RESPONSE_COMPRESSION == "br":
+    try:
+        from brotli_asgi import BrotliMiddleware
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+    except ImportError:
+        log.warning("brotli-asgi not installed - using gzip")
+        RESPONSE_COMPRESSION = "gzip"
+if RESPONSE_COMPRESSION == "gzip":
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+
+# 2️⃣c Time every request: /metrics histograms, Server-Timing header, slow-query log
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    trace, token = telemetry.begin_request()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")   # template, not the raw path
+        total = telemetry.observe_request(trace, request.method, route, status)
+        telemetry.end_request(token)
+    if telemetry.TIMING_HEADERS or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = trace.server_timing(total)
+    return response
+
 # Category mapping for special cases
 CATEGORY_MAPPING = {
     "sneakers": {
@@ -62,9 +121,35 @@ CATEGORY_MAPPING = {
     },
 }
 
-# Helper function to normalize category names
-def normalize_category(category: str) -> str:
-    return category.strip().lower().replace(" ", "").replace("-", "").replace("_", "")
+# Category postings and browse cards, built once the metadata is open
+CATEGORY_INDEX: CategoryIndex | None = None
+
+@LIFECYCLE.on_data_loaded
+def build_category_index():
+    global CATEGORY_INDEX
+    CATEGORY_INDEX = CategoryIndex(search_backend.CARDS, CATEGORY_MAPPING)
+
+@app.on_event("startup")
+def start_backend():
+    # load index, metadata and model in the background; /readyz reports progress
+    LIFECYCLE.start()
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    SEARCH_EXECUTOR.shutdown()
+
+def require_ready():
+    """503 until the model and index are loaded and warmed up."""
+    if not LIFECYCLE.ready:
+        raise HTTPException(status_code=503, detail=f"Search backend is {LIFECYCLE.state}",
+                            headers={"Retry-After": "5"})
+
+def require_categories() -> CategoryIndex:
+    """503 until the category index has been built from the metadata."""
+    if CATEGORY_INDEX is None:
+        raise HTTPException(status_code=503, detail=f"Search backend is {LIFECYCLE.state}",
+                            headers={"Retry-After": "5"})
+    return CATEGORY_INDEX
 
 # 3️⃣ Register your routes
 
@@ -72,104 +157,209 @@ def normalize_category(category: str) -> str:
 async def root():
     return {"message": "Fashion Search API"}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whatever the load state."""
+    return {"status": "ok", "state": LIFECYCLE.state}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: model and index loaded and warmed up (503 until then, or if loading failed)."""
+    status = LIFECYCLE.status()
+    if not LIFECYCLE.ready:
+        return JSONResponse(status, status_code=503)
+    return status
+
 @app.get("/api/categories")
-def list_categories():
+def list_categories(categories: CategoryIndex = Depends(require_categories)):
     """List all available article types in the dataset."""
-    categories = set()
-    for p in DOCS.values():
-        if article_type := p.get("articleType"):
-            categories.add(article_type)
-    return sorted(list(categories))
+    return categories.article_types
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics: per-stage search timings and request latency histograms."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/stats")
+def stats():
+    """Encoder cache, micro-batching, retrieval path, result cache and search executor statistics."""
+    return {**encoder_stats(), "retrieval": retrieval_stats(), "result_cache": result_cache_stats(),
+            "executor": SEARCH_EXECUTOR.stats(),
+            "cursor_cache": CANDIDATE_CACHE.stats(), "lifecycle": LIFECYCLE.status()}
 
 @app.post("/api/search")
 async def api_search(
     text: str = Form(""),
     file: UploadFile | None = File(None),
     limit: int = Form(100),
+    nprobe: int | None = Form(None),
+    ef_search: int | None = Form(None),
+    text_weight: float | None = Form(None, ge=0, le=1),
+    response_version: int = Form(schemas.DEFAULT_RESPONSE_VERSION),
+    _ready: None = Depends(require_ready),
 ):
     """
     Handles multimodal search using text + optional image.
+    `nprobe` / `ef_search` tune IVF / HNSW indexes for this request;
+    `text_weight` (0-1) weights text- against image-index scores when the
+    catalog is indexed per modality.
+    `response_version` 1 (legacy list, patch on every result) or 2 (patch once,
+    see schemas.py).
     """
+    if response_version not in schemas.RESPONSE_VERSIONS:
+        raise HTTPException(status_code=422, detail=f"response_version must be one of {schemas.RESPONSE_VERSIONS}")
     start_time = time.time()
-    print(f"Received search request - Text: '{text}', Image: {file is not None}")
+    log.debug("Received search request - Text: %r, Image: %s", text, file is not None)
     
     try:
-        # Read image bytes if an image was uploaded
-        img_bytes = await file.read() if file else None
+        # Read image bytes if an image was uploaded (one byte past the limit is enough to reject)
+        img_bytes = await file.read(image_ingest.MAX_UPLOAD_BYTES + 1) if file else None
+        telemetry.annotate(text=text, image_bytes=len(img_bytes or b""), limit=limit)
+        if img_bytes:
+            image_ingest.check_upload(img_bytes)   # byte / pixel limits from the header only
         
-        # Call the search function
-        results = search(text=text, image_bytes=img_bytes, k=limit)
+        # Run the search off the event loop
+        compact = await SEARCH_EXECUTOR.submit(search_compact, text=text, image_bytes=img_bytes, k=limit,
+                                               nprobe=nprobe, ef_search=ef_search, text_weight=text_weight)
         
         process_time = time.time() - start_time
-        print(f"Search completed in {process_time:.2f}s with {len(results)} results")
+        log.debug("Search completed in %.2fs with %d results", process_time, len(compact["results"]))
         
-        return results
+        with span("serialize"):
+            return schemas.build_response(compact, response_version)
+    except ExecutorBusy as e:
+        log.warning("Search rejected: %s", e)
+        raise HTTPException(status_code=503, detail="Search is busy, please retry")
+    except image_ingest.ImageTooLarge as e:
+        log.info("Image rejected: %s", e)
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        log.exception("Search error: %s", e)
+        return schemas.build_response({"patch": None, "results": []}, response_version)
+
+def _search_page(token, candidates, offset, limit, patch=None):
+    ids, next_cursor = CANDIDATE_CACHE.page(token, candidates, offset, limit)
+    results = build_results(ids, candidates.semantic, start_rank=offset + 1)
+    with span("serialize"):
+        return schemas.build_page(results, patch, offset, len(candidates.ids), next_cursor)
+
+@app.post("/api/search/paged")
+async def api_search_paged(
+    text: str = Form(""),
+    file: UploadFile | None = File(None),
+    limit: int = Form(DEFAULT_PAGE_SIZE, ge=1),
+    nprobe: int | None = Form(None),
+    ef_search: int | None = Form(None),
+    text_weight: float | None = Form(None, ge=0, le=1),
+    _ready: None = Depends(require_ready),
+):
+    """
+    First page of a paged search. The model and index run once for up to
+    PAGE_CANDIDATES results; follow `next_cursor` with GET /api/search/paged.
+    """
+    try:
+        img_bytes = await file.read(image_ingest.MAX_UPLOAD_BYTES + 1) if file else None
+        telemetry.annotate(text=text, image_bytes=len(img_bytes or b""), limit=limit)
+        if img_bytes:
+            image_ingest.check_upload(img_bytes)
+        ranked = await SEARCH_EXECUTOR.submit(rank_candidates, text=text, image_bytes=img_bytes,
+                                              k=max(limit, PAGE_CANDIDATES), nprobe=nprobe, ef_search=ef_search,
+                                              text_weight=text_weight)
+        token, candidates = CANDIDATE_CACHE.open(ranked)
+        return _search_page(token, candidates, 0, limit, patch=candidates.patch)
+    except ExecutorBusy as e:
+        log.warning("Search rejected: %s", e)
+        raise HTTPException(status_code=503, detail="Search is busy, please retry")
+    except image_ingest.ImageTooLarge as e:
+        log.info("Image rejected: %s", e)
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
+        log.exception("Paged search error: %s", e)
+        return schemas.build_page([], None, 0, 0, None)
+
+@app.get("/api/search/paged")
+def api_search_next_page(
+    cursor: str = Query(..., description="next_cursor from the previous page"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    _ready: None = Depends(require_ready),
+):
+    """Later pages, sliced from the cached candidates (no model or index work)."""
+    try:
+        token, candidates, offset = CANDIDATE_CACHE.resume(cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CursorExpired:
+        raise HTTPException(status_code=410, detail="Cursor expired, please search again")
+    return _search_page(token, candidates, offset, limit)
+
+async def _search_chunk(queries, body: schemas.BatchSearchRequest):
+    """search_many() for one chunk; waits for executor capacity instead of failing the batch."""
+    while True:
         try:
-            error_msg = f"Search error: {str(e)}"
-            print(error_msg)
-            import traceback
+            return await SEARCH_EXECUTOR.submit(search_many, queries, k=body.limit, nprobe=body.nprobe,
+                                                ef_search=body.ef_search, text_weight=body.text_weight)
+        except ExecutorBusy:
+            await asyncio.sleep(0.05)
+
+def _batch_items(offset, compacts, version):
+    for i, compact in enumerate(compacts):
+        yield schemas.BatchItem(index=offset + i, response=schemas.build_response(compact, version),
+                                error=compact.get("error")).model_dump(exclude_none=True)
+
+@app.post("/api/search/batch")
+async def api_search_batch(body: schemas.BatchSearchRequest, _ready: None = Depends(require_ready)):
+    """
+    Many searches in one request, for offline jobs. Queries are encoded in
+    batched forward passes and FAISS runs once per chunk of BATCH_CHUNK_SIZE
+    queries (see search_backend.search_many). Answers {count, items: [BatchItem]}
+    or, for batches of BATCH_STREAM_MIN+ queries (or stream=true), one
+    BatchItem per NDJSON line as each chunk finishes.
+    """
+    if body.response_version not in schemas.RESPONSE_VERSIONS:
+        raise HTTPException(status_code=422, detail=f"response_version must be one of {schemas.RESPONSE_VERSIONS}")
+    queries = []
+    for i, q in enumerate(body.queries):
+        try:
+            image_bytes = base64.b64decode(q.image, validate=True) if q.image else None
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=422, detail=f"queries[{i}].image is not valid base64")
+        queries.append({"text": q.text, "image_bytes": image_bytes})
+    telemetry.annotate(batch=len(queries), limit=body.limit)
+    chunks = [(start, queries[start:start + BATCH_CHUNK_SIZE]) for start in range(0, len(queries), BATCH_CHUNK_SIZE)]
+
+    stream = body.stream if body.stream is not None else len(queries) >= BATCH_STREAM_MIN
+    if not stream:
+        items = []
+        for start, chunk in chunks:
+            items.extend(_batch_items(start, await _search_chunk(chunk, body), body.response_version))
+        return {"count": len(items), "items": items}
+
+    async def lines():
+        for start, chunk in chunks:
             try:
-                print(traceback.format_exc())
-            except UnicodeEncodeError:
-                print("Unicode error in traceback")
-        except:
-            print("Error handling error")
-        return []
+                compacts = await _search_chunk(chunk, body)
+            except Exception as e:
+                log.exception("Batch chunk at %d failed: %s", start, e)
+                compacts = [{"patch": None, "results": [], "error": "search failed"}] * len(chunk)
+            for item in _batch_items(start, compacts, body.response_version):
+                yield _json_line(item)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.get("/api/products_by_category")
 def products_by_category(
-    category: str = Query(..., description="Article type, e.g. T-shirts, Dresses, Pants")
+    category: str = Query(..., description="Article type, e.g. T-shirts, Dresses, Pants"),
+    offset: int = Query(0, ge=0, description="Number of products to skip"),
+    limit: int | None = Query(None, ge=1, description="Page size (all products if omitted)"),
+    categories: CategoryIndex = Depends(require_categories),
 ):
     """
-    Browse by exact articleType, falling back to semantic search if none found.
+    Browse by special category mapping, exact articleType or masterCategory,
+    served from the precomputed category index.
     """
-    # Normalize category for comparison
-    norm_category = normalize_category(category)
-    
-    # Check if this is a special category that needs mapping
-    matches = []
-    
-    # First try special category mapping
-    if norm_category in CATEGORY_MAPPING:
-        category_info = CATEGORY_MAPPING[norm_category]
-        for p in DOCS.values():
-            if (p.get("masterCategory") == category_info["masterCategory"] and
-                any(normalize_category(sub) in normalize_category(p.get("articleType", ""))
-                    for sub in category_info["subCategories"])):
-                matches.append({
-                    "id": p["id"],
-                    "name": p["productDisplayName"],
-                    "image": p.get("image_url") or p.get("image_filename"),
-                    "rating": p.get("rating", 0),
-                    "numReviews": p.get("numReviews", 0),
-                    "price": p.get("price"),
-                    "discount": p.get("discountPercent"),
-                    "why": "",
-                    "patch": None,
-                })
-    
-    # If no matches found through special mapping, try direct matching
-    if not matches:
-        for p in DOCS.values():
-            article_type = p.get("articleType", "")
-            if normalize_category(article_type) == norm_category:
-                matches.append({
-                    "id": p["id"],
-                    "name": p["productDisplayName"],
-                    "image": p.get("image_url") or p.get("image_filename"),
-                    "rating": p.get("rating", 0),
-                    "numReviews": p.get("numReviews", 0),
-                    "price": p.get("price"),
-                    "discount": p.get("discountPercent"),
-                    "why": "",
-                    "patch": None,
-                })
-
-    return matches
+    return categories.page(category, offset, limit)
 
 @app.get("/api/categories/{category}")
-async def get_category_products(category: str):
+async def get_category_products(category: str, _ready: None = Depends(require_ready)):
     """
     Return products by category using special category mapping
     """
@@ -177,7 +367,7 @@ async def get_category_products(category: str):
         # Normalize the category
         category = category.lower().strip()
         
-        print(f"Category request: {category}")
+        log.debug("Category request: %s", category)
         
         # Check for direct category match
         if category in CATEGORY_MAPPING:
@@ -187,46 +377,42 @@ async def get_category_products(category: str):
             
             # Build a simple query for that category
             query = f"{category}"
-            results = search(text=query, k=50)
+            results = await SEARCH_EXECUTOR.submit(search, text=query, k=50)
             
             # Extra filtering for exact category match
+            facets = search_backend.CARDS.facets
             filtered_results = []
             for product in results:
-                product_id = product.get("id")
-                doc = DOCS.get(product_id)
-                if not doc:
-                    continue
-                    
-                doc_master = doc.get("masterCategory")
-                doc_sub = doc.get("subCategory")
-                doc_article = doc.get("articleType")
-                
+                f = facets.get(product.get("id"))
                 # Check if this product matches our category criteria
-                if (doc_master == master_category and 
-                    (doc_sub in subcategories or doc_article in subcategories)):
+                if f and f.master == master_category and (f.sub in subcategories or f.article in subcategories):
                     filtered_results.append(product)
             
-            print(f"Found {len(filtered_results)} products for category {category}")
+            log.debug("Found %d products for category %s", len(filtered_results), category)
             return filtered_results[:50]  # Limit to 50 products
             
         # If no special mapping, just do a search
-        results = search(text=category, k=50)
+        results = await SEARCH_EXECUTOR.submit(search, text=category, k=50)
         return results
+    except ExecutorBusy as e:
+        log.warning("Category search rejected: %s", e)
+        raise HTTPException(status_code=503, detail="Search is busy, please retry")
     except Exception as e:
-        import traceback
-        print(f"Category search error: {str(e)}")
-        print(traceback.format_exc())
+        log.exception("Category search error: %s", e)
         return []
 
 if __name__ == "__main__":
     try:
-        print("Starting server...")
+        log.info("Starting server...")
         port = int(os.environ.get("PORT", 8000))
-        uvicorn.run("server:app", host="0.0.0.0", port=port, reload=False)
+        import supervisor
+        if supervisor.WORKERS > 1:
+            # WORKERS=N: N processes mapping one copy of the weights, cards and index
+            supervisor.serve(supervisor.WORKERS, "0.0.0.0", port)
+        else:
+            uvicorn.run("server:app", host="0.0.0.0", port=port, reload=False)
     except Exception as e:
-        print(f"Server error: {e}")
-        import traceback
-        print(traceback.format_exc())
+        log.exception("Server error: %s", e)
 
 
 
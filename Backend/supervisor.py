@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+supervisor.py – several uvicorn workers sharing one copy of the read-only state
+
+    python supervisor.py --workers 4 [--host 0.0.0.0] [--port 8000]
+    WORKERS=4 python server.py
+
+With plain `uvicorn --workers N` every worker loads its own CLIP weights (and
+parses the catalog and builds its own result cards when there are no current
+compiled artifacts), so memory grows with N times all of it. Before the first
+worker starts, the supervisor prepares files the workers can memory-map
+instead. It does this in a short-lived child process, so the supervisor
+itself never holds the catalog or torch:
+
+    compiled/        serving artifacts, recompiled when stale: product
+                     records, filter columns and result cards (cards.*)
+    SHARED_WEIGHTS   CLIP parameters and buffers exported once, by default
+                     compiled/clip_<model>_<tag>.pt; each worker builds the
+                     model on the meta device and maps these tensors
+
+The FAISS index(es) and ids.npy are already opened memory-mapped. Workers
+start with CARD_STORE=mmap, SHARED_WEIGHTS, TORCH_THREADS = cores / workers
+and the thread executor (a process executor inside each worker would copy
+everything again). File-backed pages are held once in the page cache
+whatever the worker count. Each worker still keeps its own interpreter,
+torch runtime, category index and caches (TEXT_CACHE_SIZE, RESULT_CACHE_MB
+and the image cache are per worker). The int8 and onnx encoder backends
+derive their own weights, so each worker holds those privately.
+
+uvicorn's process manager (uvicorn >= 0.30, see requirements.txt) then runs
+the workers on one shared socket. It restarts a worker that dies, and it
+handles these signals:
+
+    SIGHUP            restart every worker (e.g. after re-indexing)
+    SIGTTIN/SIGTTOU   add or remove one worker
+    SIGINT/SIGTERM    stop the workers gracefully
+
+benchmarks/bench_workers.py reports per-worker memory as workers are added.
+"""
+
+import argparse, logging, multiprocessing, os
+
+import uvicorn
+
+import telemetry
+
+WORKERS = int(os.environ.get("WORKERS", 1))
+
+log = logging.getLogger("supervisor")
+
+
+def _prepare(weights_path: str | None) -> dict:
+    """Runs in a child process: compile stale artifacts, export the CLIP weights if missing."""
+    telemetry.configure_logging()
+    import search_backend
+    if not search_backend.prepare_artifacts():
+        log.warning("No catalog next to search_backend to compile - workers use what load_data() finds")
+    if weights_path is None:
+        return {"weights": None}
+    weights_path = weights_path or search_backend.shared_weights_path()
+    if not os.path.exists(weights_path):
+        try:
+            log.info("Exporting CLIP weights to %s", weights_path)
+            search_backend.export_shared_weights(weights_path)
+        except Exception as e:
+            log.warning("Cannot export CLIP weights (%s: %s) - every worker loads its own copy",
+                        type(e).__name__, e)
+            return {"weights": None}
+    return {"weights": weights_path}
+
+
+def prepare(share: bool = True) -> dict:
+    """
+    Compile artifacts and (with `share`) export the shared weights in a spawned
+    child; returns {"weights": path or None}.
+    """
+    weights = os.environ.get("SHARED_WEIGHTS", "") if share else None
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_prepare, (weights,))
+
+
+def worker_env(workers: int, prepared: dict, share: bool = True) -> dict:
+    """Environment the workers start with (explicit settings win, except a process executor)."""
+    env = {"TORCH_THREADS": os.environ.get("TORCH_THREADS") or str(max(1, (os.cpu_count() or 1) // workers)),
+           "SEARCH_EXECUTOR": "thread"}
+    if os.environ.get("SEARCH_EXECUTOR", "thread") != "thread":
+        log.warning("SEARCH_EXECUTOR=%s ignored under the supervisor - workers use threads",
+                    os.environ["SEARCH_EXECUTOR"])
+    env["CARD_STORE"] = os.environ.get("CARD_STORE", "mmap" if share else "memory")
+    if share and prepared["weights"]:
+        env["SHARED_WEIGHTS"] = prepared["weights"]
+    return env
+
+
+def serve(workers: int = WORKERS, host: str = "0.0.0.0", port: int = 8000,
+          app: str = "server:app", share: bool = True) -> None:
+    """Prepare the shared state, then run `workers` uvicorn workers of `app` until stopped."""
+    workers = max(1, workers)
+    prepared = prepare(share)
+    env = worker_env(workers, prepared, share)
+    log.info("Starting %d worker(s) of %s on %s:%d with %s", workers, app, host, port,
+             " ".join(f"{k}={v}" for k, v in env.items()))
+    os.environ.update(env)   # inherited by the spawned workers
+    uvicorn.run(app, host=host, port=port, workers=workers, reload=False)
+
+
+if __name__ == "__main__":
+    telemetry.configure_logging()
+    ap = argparse.ArgumentParser(description="Serve with several workers sharing the read-only state")
+    ap.add_argument("--workers", type=int, default=max(2, WORKERS))
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    ap.add_argument("--app", default="server:app", help="ASGI app as module:attribute")
+    ap.add_argument("--no-share", dest="share", action="store_false",
+                    help="every worker loads private weights and builds its cards in memory, for comparison")
+    args = ap.parse_args()
+    serve(args.workers, args.host, args.port, args.app, args.share)
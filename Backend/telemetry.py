@@ -0,0 +1,226 @@
+"""
+telemetry.py – stage timings, Prometheus metrics and logging setup
+
+    with span("faiss_search"):
+        ...
+
+records how long a stage of the search pipeline took. Every span lands in
+the `search_stage_seconds{stage=...}` histogram served on /metrics and, while
+a request is being handled, in that request's Trace, which the server turns
+into a Server-Timing header (TIMING_HEADERS=1, or per request with the
+`X-Timing: 1` header) and into the slow-query log.
+
+Searches run on executor workers; run_traced() collects a call's spans on the
+worker (thread or process) and the API process records them with merge(),
+so /metrics is complete in both executor modes. Spans outside any traced
+call (warm-up, encoder batches, tools) go straight to the histograms.
+
+The exposition format is written here, so there is no client dependency.
+"""
+
+import contextvars, logging, os, random, threading, time
+from typing import Any, Dict, Iterable, List, Tuple
+
+LOG_LEVEL         = os.environ.get("LOG_LEVEL", "INFO").upper()
+TIMING_HEADERS    = os.environ.get("TIMING_HEADERS", "0") == "1"
+SLOW_QUERY_MS     = float(os.environ.get("SLOW_QUERY_MS", 1000))
+SLOW_QUERY_SAMPLE = float(os.environ.get("SLOW_QUERY_SAMPLE", 1.0))   # fraction of slow requests logged
+
+# seconds; covers sub-millisecond parsing up to multi-second image queries
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger("telemetry")
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """Leveled, timestamped logs on stderr (no-op if the root logger is already configured)."""
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+
+# ─── metrics ─────────────────────────────────────────────────────────────
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join('{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}   # labels → [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def snapshot(self, *labels: str) -> Dict[str, Any]:
+        """One series as JSON-ready data: cumulative count per upper bound, sum and count."""
+        with self._lock:
+            s = list(self._series.get(labels, [0] * len(self.buckets) + [0.0, 0]))
+        buckets = {str(b): count for b, count in zip(self.buckets, s)}
+        buckets["+Inf"] = s[-1]
+        return {"buckets": buckets, "sum": s[-2], "count": s[-1]}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, s in sorted(series.items()):
+            names = self.labelnames + ("le",)
+            for b, count in zip(self.buckets, s):
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (repr(b),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {s[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {s[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {s[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(values.items())]
+        return lines
+
+
+STAGE_SECONDS = Histogram("search_stage_seconds", "Time spent per search pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.",
+                            ("method", "route", "status"))
+SLOW_REQUESTS = Counter("http_slow_requests_total", "Requests slower than SLOW_QUERY_MS.", ("route",))
+# encoder micro-batching (batching.MicroBatcher), labelled with the batcher's name
+BATCH_SIZE = Histogram("encoder_batch_size", "Items per micro-batched encoder call.", ("batcher",),
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+BATCH_WAIT_SECONDS = Histogram("encoder_batch_queue_wait_seconds", "Time an item waited for its micro-batch.",
+                               ("batcher",), buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+REGISTRY = [STAGE_SECONDS, REQUEST_SECONDS, SLOW_REQUESTS, BATCH_SIZE, BATCH_WAIT_SECONDS]
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition (format 0.0.4) of every registered metric."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ─── spans and traces ────────────────────────────────────────────────────
+class Trace:
+    """Spans of one request (or one traced executor call), in completion order."""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+        self.attrs: Dict[str, Any] = {}
+        self.start = time.perf_counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans.append((name, seconds))
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds per stage, summed over repeated spans."""
+        out: Dict[str, float] = {}
+        for name, seconds in self.spans:
+            out[name] = out.get(name, 0.0) + seconds
+        return out
+
+    def server_timing(self, total: float | None = None) -> str:
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.totals().items()]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_worker = threading.local()   # Trace collecting a run_traced() call on this thread
+_request: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    trace = getattr(_worker, "trace", None)
+    if trace is not None:
+        trace.add(name, seconds)    # shipped back to the API process by run_traced()
+        return
+    STAGE_SECONDS.observe(seconds, name)
+    request = _request.get()
+    if request is not None:
+        request.add(name, seconds)
+
+
+class span:
+    """Context manager timing one stage; cheap enough for every request."""
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+def run_traced(fn, *args, **kwargs) -> Tuple[Any, List[Tuple[str, float]]]:
+    """Call fn on an executor worker and return (result, spans recorded during the call)."""
+    outer = getattr(_worker, "trace", None)
+    _worker.trace = trace = Trace()
+    try:
+        return fn(*args, **kwargs), trace.spans
+    finally:
+        _worker.trace = outer
+
+
+def merge(spans: Iterable[Tuple[str, float]]) -> None:
+    """Record spans returned by run_traced() in the metrics and the current request."""
+    request = _request.get()
+    for name, seconds in spans:
+        STAGE_SECONDS.observe(seconds, name)
+        if request is not None:
+            request.add(name, seconds)
+
+
+def begin_request() -> Tuple[Trace, contextvars.Token]:
+    trace = Trace()
+    return trace, _request.set(trace)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _request.reset(token)
+
+
+def annotate(**attrs) -> None:
+    """Attach details (query text, image size...) to the current request for the slow-query log."""
+    request = _request.get()
+    if request is not None:
+        request.attrs.update(attrs)
+
+
+def observe_request(trace: Trace, method: str, route: str, status: int) -> float:
+    """Record a finished request; logs it (sampled) when slower than SLOW_QUERY_MS. Returns seconds."""
+    total = time.perf_counter() - trace.start
+    REQUEST_SECONDS.observe(total, method, route, str(status))
+    if total * 1000 >= SLOW_QUERY_MS:
+        SLOW_REQUESTS.inc(route)
+        if random.random() < SLOW_QUERY_SAMPLE:
+            stages = " ".join(f"{k}={v * 1000:.1f}ms" for k, v in trace.totals().items())
+            attrs = " ".join(f"{k}={v!r}" for k, v in trace.attrs.items())
+            log.warning("slow request %s %s %d %.0fms %s | %s", method, route, status, total * 1000, attrs, stages)
+    return total
@@ -0,0 +1,32 @@
+"""
+Shared fixtures: the Backend modules and the benchmark stubs on sys.path, and
+one small stub_backend catalog per session (no model download, no real data).
+
+    python -m pytest -q Backend/tests
+"""
+
+import os, sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(BACKEND, "benchmarks")
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, BENCHMARKS)
+
+os.environ.setdefault("WARMUP", "0")
+os.environ.setdefault("SEARCH_EXECUTOR", "thread")
+
+import pytest
+
+STUB_CATALOG_SIZE = 2_000
+
+
+@pytest.fixture(scope="session")
+def stub_catalog(tmp_path_factory):
+    """search_backend loaded with a synthetic catalog; returns its directory."""
+    pytest.importorskip("faiss")
+    import stub_backend
+    import search_backend as sb
+    directory = str(tmp_path_factory.mktemp("catalog"))
+    stub_backend.write_catalog(directory, STUB_CATALOG_SIZE)
+    sb.load_data(directory)
+    return directory
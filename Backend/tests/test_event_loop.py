@@ -0,0 +1,105 @@
+"""
+Searches run on SEARCH_EXECUTOR, never on the event loop: cheap endpoints
+answer while searches are in flight, and a full admission queue is a 503.
+
+The searches are held on a gate inside the executor, so "in flight" is
+deterministic; each one then retrieves from the stub catalog like a real search.
+"""
+
+import asyncio, io, threading, time
+
+import numpy as np
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+
+@pytest.fixture
+def api(stub_catalog, monkeypatch):
+    """(server module, gate): /api/search blocks in the executor until gate.set()."""
+    import search_backend as sb
+    import server
+    import stub_backend
+    from lifecycle import LIFECYCLE
+
+    gate = threading.Event()
+    rng = np.random.default_rng(0)
+
+    def gated_search(text="", image_bytes=None, k=9, **_):
+        gate.wait(30)
+        q = rng.standard_normal(stub_backend.DIM).astype(np.float32)
+        rows, _ = sb._retrieve(q / np.linalg.norm(q), k, None)
+        return {"patch": None, "results": sb.build_results(np.asarray(sb.IDS[rows]))}
+
+    monkeypatch.setattr(server, "search_compact", gated_search)
+    monkeypatch.setattr(LIFECYCLE, "state", "ready")
+    try:
+        yield server, gate
+    finally:
+        gate.set()
+
+
+def _jpeg() -> bytes:
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.effect_noise((256, 256), 64).convert("RGB").save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+async def _until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "searches did not reach the executor"
+        await asyncio.sleep(0.01)
+
+
+def _client(server):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+def test_cheap_endpoints_answer_while_searches_are_in_flight(api):
+    server, gate = api
+    n = server.SEARCH_EXECUTOR.workers
+    image = _jpeg()
+
+    async def run():
+        async with _client(server) as client:
+            searches = [asyncio.create_task(client.post(
+                "/api/search", data={"text": "red dress", "limit": 9},
+                files={"file": ("q.jpg", image, "image/jpeg")})) for _ in range(n)]
+            await _until(lambda: server.SEARCH_EXECUTOR.pending == n)
+
+            for path in ("/healthz", "/"):
+                t0 = time.perf_counter()
+                r = await asyncio.wait_for(client.get(path), timeout=2)
+                assert r.status_code == 200
+                assert time.perf_counter() - t0 < 0.5
+            assert not any(t.done() for t in searches)
+
+            gate.set()
+            for r in await asyncio.gather(*searches):
+                assert r.status_code == 200
+                assert len(r.json()) == 9
+
+    asyncio.run(run())
+
+
+def test_full_executor_queue_returns_503(api, monkeypatch):
+    server, gate = api
+    monkeypatch.setattr(server.SEARCH_EXECUTOR, "max_pending", 2)
+
+    async def run():
+        async with _client(server) as client:
+            held = [asyncio.create_task(client.post("/api/search", data={"text": "blue jeans"}))
+                    for _ in range(2)]
+            await _until(lambda: server.SEARCH_EXECUTOR.pending == 2)
+
+            r = await client.post("/api/search", data={"text": "blue jeans"})
+            assert r.status_code == 503
+            assert (await client.get("/healthz")).status_code == 200
+
+            gate.set()
+            assert [r.status_code for r in await asyncio.gather(*held)] == [200, 200]
+        assert server.SEARCH_EXECUTOR.pending == 0
+
+    asyncio.run(run())
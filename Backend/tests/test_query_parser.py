@@ -0,0 +1,17 @@
+"""Every benchmarks/query_corpus.json case parses to its expected items, descriptors and exclusions."""
+
+import json, os
+
+import pytest
+
+import query_parser
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "query_corpus.json")
+
+with open(CORPUS_PATH) as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["query"] or "<empty>" for c in CORPUS])
+def test_corpus(case):
+    assert query_parser.parse(case["query"]) == (case["items"], case["descriptors"], case["excluded"])
@@ -0,0 +1,19 @@
+"""
+vocabulary.py – query vocabulary shared by the parser, the filters and the artifact compiler
+"""
+
+ITEM_TYPES = {
+    "dress": ["dress", "gown", "frock"],
+    "jacket": ["jacket", "coat", "blazer"],
+    "shirt": ["shirt", "top", "tee", "t-shirt", "tshirt", "blouse"],
+    "pants": ["pant", "trouser", "jeans", "leggings", "shorts"],
+    "shoes": ["shoe", "sneaker", "boot", "heel", "footwear"],
+    "accessories": ["watch", "bag", "purse", "handbag", "backpack", "wallet"]
+}
+DESCRIPTOR_TYPES = {
+    "colors": ["red", "blue", "green", "yellow", "black", "white", "pink", "purple", "brown", "orange", "beige"],
+    "patterns": ["floral", "striped", "plaid", "checkered", "dotted", "printed"],
+    "materials": ["denim", "leather", "cotton", "silk", "wool", "polyester", "linen"],
+    "styles": ["casual", "formal", "elegant", "vintage", "modern", "sporty", "classic"]
+}
+VOCAB_WORDS = sorted({w for words in (*ITEM_TYPES.values(), *DESCRIPTOR_TYPES.values()) for w in words})
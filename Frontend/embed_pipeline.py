@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# embed_pipeline.py – producer/consumer image pipeline feeding embed_products.py
+#
+#   fetch (long-lived thread pool) → decode + preprocess (worker processes)
+#   → bounded prefetch queue of ready batch tensors → encoder (caller's thread)
+#
+# Each stage runs on its own thread, so fetching batch b+2 and preprocessing
+# batch b+1 overlap with encoding batch b.
+import io
+import os
+import pathlib
+import queue
+import threading
+import time
+import urllib.request
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import torch
+from PIL import Image
+
+_DONE = object()
+
+
+class StageTimer:
+    """Items processed and busy seconds for one pipeline stage."""
+
+    def __init__(self, name, parallelism=1):
+        self.name        = name
+        self.parallelism = parallelism   # busy time is summed over this many workers
+        self.items       = 0
+        self.busy        = 0.0
+        self._lock       = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy  += seconds
+
+    def rate(self):
+        wall = self.busy / self.parallelism
+        return self.items / wall if wall > 0 else 0.0
+
+
+# ─── worker-side functions (must be importable by spawned processes) ─────────
+def fetch_bytes(path_or_url):
+    """Raw image bytes from a local path or URL (None on failure) and the seconds spent."""
+    t0 = time.perf_counter()
+    try:
+        p = pathlib.Path(path_or_url)
+        if p.exists():
+            data = p.read_bytes()
+        else:
+            with urllib.request.urlopen(path_or_url, timeout=4) as r:
+                data = r.read()
+    except Exception:
+        data = None
+    return data, time.perf_counter() - t0
+
+
+_PREPROCESS = None
+
+
+def _init_worker(preprocess):
+    global _PREPROCESS
+    _PREPROCESS = preprocess
+    torch.set_num_threads(1)   # one core per worker; parallelism comes from the pool
+
+
+def decode_and_preprocess(data):
+    """Bytes → model-ready float32 array, plus decode and preprocess seconds."""
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(io.BytesIO(data)).convert("RGB")
+    except Exception:
+        img = Image.new("RGB", (224, 224), "gray")
+    t1 = time.perf_counter()
+    arr = _PREPROCESS(img).numpy()
+    return arr, t1 - t0, time.perf_counter() - t1
+
+
+# ─── pipeline ────────────────────────────────────────────────────────────────
+class ImagePipeline:
+    def __init__(self, preprocess, fetch_workers=16, preprocess_workers=None, prefetch=4):
+        self.preprocess_workers = preprocess_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.prefetch   = max(1, prefetch)
+        self.fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers,
+                                                                thread_name_prefix="fetch")
+        self.proc_pool  = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.preprocess_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(preprocess,),
+        )
+        self.stages = {
+            "fetch":      StageTimer("fetch"),
+            "decode":     StageTimer("decode", self.preprocess_workers),
+            "preprocess": StageTimer("preprocess", self.preprocess_workers),
+            "encode":     StageTimer("encode"),
+        }
+
+    def _fetch_stage(self, path_batches, out):
+        try:
+            for paths in path_batches:
+                t0   = time.perf_counter()
+                raws = [data for data, _ in self.fetch_pool.map(fetch_bytes, paths)]
+                self.stages["fetch"].add(len(paths), time.perf_counter() - t0)
+                out.put(raws)
+        except Exception as e:
+            out.put(e)
+        out.put(_DONE)
+
+    def _preprocess_stage(self, inp, out):
+        while True:
+            raws = inp.get()
+            if raws is _DONE or isinstance(raws, Exception):
+                out.put(raws)
+                if raws is _DONE:
+                    return
+                continue
+            try:
+                chunk   = max(1, len(raws) // (self.preprocess_workers * 2))
+                results = list(self.proc_pool.map(decode_and_preprocess, raws, chunksize=chunk))
+                self.stages["decode"].add(len(raws), sum(r[1] for r in results))
+                self.stages["preprocess"].add(len(raws), sum(r[2] for r in results))
+                out.put(torch.from_numpy(np.stack([r[0] for r in results])))
+            except Exception as e:
+                out.put(e)
+
+    def batches(self, path_batches):
+        """Yield preprocessed image tensors (B x 3 x H x W), one per batch of paths, in order."""
+        fetched = queue.Queue(maxsize=self.prefetch)
+        ready   = queue.Queue(maxsize=self.prefetch)
+        threading.Thread(target=self._fetch_stage, args=(path_batches, fetched), daemon=True).start()
+        threading.Thread(target=self._preprocess_stage, args=(fetched, ready), daemon=True).start()
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def report(self):
+        return "  •  ".join(f"{name} {t.rate():.0f} img/s" for name, t in self.stages.items())
+
+    def close(self):
+        self.fetch_pool.shutdown(wait=False, cancel_futures=True)
+        self.proc_pool.shutdown(wait=False, cancel_futures=True)
@@ -1,123 +1,287 @@
-#!/usr/bin/env python3
-# embed_products.py – threaded image loader, live speed display, FAISS-CPU/GPU safe
-import os
-# allow multiple OpenMP runtimes on Windows
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-
-import json
-import pathlib
-import io
-import urllib.request
-import numpy as np
-import faiss
-import torch
-import time
-import concurrent.futures
-import math
-
-from PIL import Image
-from tqdm import tqdm
-import open_clip
-from open_clip import tokenize
-
-# ─── 1) Model setup ────────────────────────────────────────────────────────────
-MODEL_NAME = "ViT-B-32"
-device     = "cuda" if torch.cuda.is_available() else "cpu"
-
-model, _, preprocess = open_clip.create_model_and_transforms(
-    MODEL_NAME,
-    pretrained="laion2b_s34b_b79k" if MODEL_NAME == "ViT-B-32" else None,
-    device=device
-)
-print(f"▶ embedding on {device}  •  model = {MODEL_NAME}")
-
-# ─── 2) Load metadata & include reviews+rating in text ────────────────────────
-DATA     = pathlib.Path("products_with_reviews.jsonl")
-raw_docs = [json.loads(line) for line in DATA.open(encoding="utf-8")]
-
-docs = []
-for d in raw_docs:
-    base     = d.get("all_text", "")
-    reviews  = d.get("reviews", [])
-    rating   = d.get("rating", None)
-    # build a blob of reviews plus the numeric rating
-    rev_blob = " ".join(reviews + ([f"{rating:.1f} stars"] if rating is not None else []))
-    # combine original text + its reviews + rating string
-    d["all_text_with_reviews"] = f"{base} {rev_blob}".strip()
-    docs.append(d)
-
-total       = len(docs)
-batch_size  = 128
-num_batches = math.ceil(total / batch_size)
-
-# ─── 3) Fast image loader ──────────────────────────────────────────────────────
-def fetch_image(path_or_url):
-    try:
-        p = pathlib.Path(path_or_url)
-        if p.exists():
-            return Image.open(p).convert("RGB")
-        with urllib.request.urlopen(path_or_url, timeout=4) as r:
-            return Image.open(io.BytesIO(r.read())).convert("RGB")
-    except Exception:
-        return Image.new("RGB", (224, 224), "gray")
-
-# ─── 4) Embed loop with progress bar ───────────────────────────────────────────
-ids, chunks = [], []
-start = time.time()
-
-for b in tqdm(range(num_batches), desc="Batches", unit="batch"):
-    i0    = b * batch_size
-    batch = docs[i0 : i0 + batch_size]
-
-    # — text+reviews+rating → tokens (CPU→GPU) —
-    texts       = [d["all_text_with_reviews"] for d in batch]
-    text_tokens = tokenize(texts) \
-        .pin_memory() \
-        .to(device, non_blocking=True)
-
-    # — images (threaded fetch + preprocess) —
-    paths     = [d.get("image_filename") or d.get("image_url") for d in batch]
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
-        imgs = list(pool.map(fetch_image, paths))
-    img_tensor = torch.stack([preprocess(im) for im in imgs]) \
-        .pin_memory() \
-        .to(device, non_blocking=True)
-
-    # — encode (mixed precision) —
-    with torch.no_grad(), torch.amp.autocast(device_type="cuda"):
-        t_feats = model.encode_text(text_tokens)
-        i_feats = model.encode_image(img_tensor)
-
-    # — normalize + fuse embeddings —
-    t_feats = t_feats / t_feats.norm(dim=-1, keepdim=True)
-    i_feats = i_feats / i_feats.norm(dim=-1, keepdim=True)
-    fused   = (t_feats + i_feats).cpu().numpy().astype("float32")
-
-    chunks.append(fused)
-    ids.extend([d["id"] for d in batch])
-
-    done    = min((b+1)*batch_size, total)
-    elapsed = time.time() - start
-    speed   = done / elapsed if elapsed > 0 else 0
-    tqdm.write(f"  processed {done}/{total}  •  {speed:.1f} vec/s")
-
-# ─── 5) Build & save FAISS index ───────────────────────────────────────────────
-vecs = np.concatenate(chunks, axis=0)
-faiss.normalize_L2(vecs)
-
-index = faiss.IndexFlatIP(vecs.shape[1])
-if hasattr(faiss, "get_num_gpus") and faiss.get_num_gpus() > 0:
-    index = faiss.index_cpu_to_all_gpus(index)
-
-index.add(vecs)
-index_to_save = (
-    faiss.index_gpu_to_cpu(index)
-    if hasattr(faiss, "index_gpu_to_cpu")
-    else index
-)
-
-faiss.write_index(index_to_save, "products.index")
-np.save("ids.npy", np.array(ids, dtype=np.int32))
-
-print(f"\n✅ Finished in {time.time()-start:.1f}s • {vecs.shape[0]} vectors")
-
+#!/usr/bin/env python3
+# embed_products.py – pipelined image loader, per-stage speed display, FAISS-CPU/GPU safe
+import os
+# allow multiple OpenMP runtimes on Windows
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+import argparse
+import hashlib
+import json
+import pathlib
+import sys
+import numpy as np
+import faiss
+import torch
+import time
+import math
+
+from tqdm import tqdm
+import open_clip
+from open_clip import tokenize
+
+from embed_pipeline import ImagePipeline
+
+# shared index builders live next to the search backend
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "Backend"))
+import ann_index
+import artifacts
+from vocabulary import VOCAB_WORDS
+
+MODEL_NAME    = "ViT-B-32"
+INDEX_PATH    = "products.index"
+# which indexes a run writes: one over fused text+image vectors, or one per modality
+LAYOUTS       = {"fused": ("fused",), "separate": ann_index.MODALITIES, "both": ("fused",) + ann_index.MODALITIES}
+MANIFEST_PATH = pathlib.Path("embed_manifest.json")
+DATA_PATH     = "products_with_reviews.jsonl"
+batch_size    = 128
+
+
+# ─── 0) Options ───────────────────────────────────────────────────────────────
+def parse_args():
+    ap = argparse.ArgumentParser(description="Embed products and build the FAISS index")
+    ap.add_argument("--index-type", choices=ann_index.INDEX_TYPES, default="flat")
+    ap.add_argument("--nlist", type=int, help="IVF lists (default ~4*sqrt(n))")
+    ap.add_argument("--hnsw-m", type=int, help="HNSW neighbours per node")
+    ap.add_argument("--ef-construction", type=int, help="HNSW build beam width")
+    ap.add_argument("--pq-m", type=int, help="IVF-PQ sub-quantizers (must divide the dim)")
+    ap.add_argument("--pq-bits", type=int, help="IVF-PQ bits per code")
+    ap.add_argument("--layout", choices=LAYOUTS, default="separate",
+                    help="separate: aligned text and image indexes fused at query time; "
+                         "fused: one index over text+image vectors (previous behaviour); both: all three")
+    ap.add_argument("--storage", choices=ann_index.STORAGE_TYPES,
+                    help="vector storage for flat / ivf_flat / hnsw (fp16 or sq8 keep two indexes "
+                         "within the memory of one fp32 index)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="re-embed only new/changed products using embed_manifest.json")
+    ap.add_argument("--fetch-workers", type=int, default=16, help="image fetch threads")
+    ap.add_argument("--preprocess-workers", type=int, help="decode+preprocess processes (default cores/2)")
+    ap.add_argument("--prefetch", type=int, default=4, help="ready batches buffered ahead of the encoder")
+    return ap.parse_args()
+
+
+# ─── 2) Load metadata & include reviews+rating in text ────────────────────────
+def load_docs():
+    DATA     = pathlib.Path(DATA_PATH)
+    raw_docs = [json.loads(line) for line in DATA.open(encoding="utf-8")]
+
+    docs = []
+    for d in raw_docs:
+        base     = d.get("all_text", "")
+        reviews  = d.get("reviews", [])
+        rating   = d.get("rating", None)
+        # build a blob of reviews plus the numeric rating
+        rev_blob = " ".join(reviews + ([f"{rating:.1f} stars"] if rating is not None else []))
+        # combine original text + its reviews + rating string
+        d["all_text_with_reviews"] = f"{base} {rev_blob}".strip()
+        docs.append(d)
+    return docs
+
+
+def image_ref(d):
+    return d.get("image_filename") or d.get("image_url")
+
+
+def index_path(target):
+    return INDEX_PATH if target == "fused" else ann_index.modal_path(INDEX_PATH, target)
+
+
+def content_hash(d):
+    """Hash of everything that feeds the embedding: text+reviews+rating and the image reference."""
+    h = hashlib.sha1(d["all_text_with_reviews"].encode("utf-8"))
+    h.update(b"\0")
+    h.update(str(image_ref(d)).encode("utf-8"))
+    return h.hexdigest()
+
+
+# ─── 4) Embed loop: prefetched image batches keep the encoder busy ────────────
+def embed_docs(todo, model, device, pipeline):
+    """L2-normalised (text, image) vectors for `todo`, in order."""
+    total       = len(todo)
+    num_batches = math.ceil(total / batch_size)
+    batches     = [todo[b*batch_size : (b+1)*batch_size] for b in range(num_batches)]
+    t_chunks    = []
+    i_chunks    = []
+    start       = time.time()
+    encode      = pipeline.stages["encode"]
+
+    image_batches = pipeline.batches([[image_ref(d) for d in batch] for batch in batches])
+    for b, (batch, img_tensor) in enumerate(tqdm(zip(batches, image_batches), total=num_batches,
+                                                 desc="Batches", unit="batch")):
+        t0 = time.perf_counter()
+
+        # — text+reviews+rating → tokens, ready images (CPU→GPU) —
+        text_tokens = tokenize([d["all_text_with_reviews"] for d in batch])
+        if device == "cuda":
+            text_tokens = text_tokens.pin_memory()
+            img_tensor  = img_tensor.pin_memory()
+        text_tokens = text_tokens.to(device, non_blocking=True)
+        img_tensor  = img_tensor.to(device, non_blocking=True)
+
+        # — encode (mixed precision) —
+        with torch.no_grad(), torch.amp.autocast(device_type="cuda"):
+            t_feats = model.encode_text(text_tokens)
+            i_feats = model.encode_image(img_tensor)
+
+        # — normalize; fused vectors are derived per index in target_vectors() —
+        t_feats = t_feats / t_feats.norm(dim=-1, keepdim=True)
+        i_feats = i_feats / i_feats.norm(dim=-1, keepdim=True)
+
+        t_chunks.append(t_feats.cpu().numpy().astype("float32"))
+        i_chunks.append(i_feats.cpu().numpy().astype("float32"))
+        encode.add(len(batch), time.perf_counter() - t0)
+
+        done    = min((b+1)*batch_size, total)
+        elapsed = time.time() - start
+        speed   = done / elapsed if elapsed > 0 else 0
+        tqdm.write(f"  processed {done}/{total}  •  {speed:.1f} vec/s  •  {pipeline.report()}")
+
+    if not t_chunks:
+        empty = np.zeros((0, 512), dtype="float32")
+        return empty, empty
+    t_vecs = np.concatenate(t_chunks, axis=0)
+    i_vecs = np.concatenate(i_chunks, axis=0)
+    faiss.normalize_L2(t_vecs)
+    faiss.normalize_L2(i_vecs)
+    return t_vecs, i_vecs
+
+
+def target_vectors(target, t_vecs, i_vecs):
+    """Vectors stored in the `target` index ("fused", "text" or "image")."""
+    if target == "text":
+        return t_vecs
+    if target == "image":
+        return i_vecs
+    fused = t_vecs + i_vecs
+    faiss.normalize_L2(fused)
+    return fused
+
+
+# ─── 5) Build or update the id-mapped FAISS index ─────────────────────────────
+def load_previous(args):
+    """(manifest, {target: index}) from the last run if an incremental update is possible, else None."""
+    if not args.incremental:
+        return None
+    targets = LAYOUTS[args.layout]
+    if not MANIFEST_PATH.exists() or not all(os.path.exists(index_path(t)) for t in targets):
+        print("▶ no previous manifest/index – full build")
+        return None
+    manifest = json.loads(MANIFEST_PATH.read_text())
+    metas    = [ann_index.read_index_meta(index_path(t)) for t in targets]
+    if (manifest.get("model") != MODEL_NAME or manifest.get("layout", "fused") != args.layout
+            or not all(m.get("id_map") and m.get("type") == args.index_type for m in metas)):
+        print("▶ model / layout / index type changed or index not id-mapped – full build")
+        return None
+    return manifest, {t: faiss.read_index(index_path(t)) for t in targets}
+
+
+def new_index(vecs, ids, index_type, build_params):
+    base = ann_index.build_index(vecs, index_type, **build_params)
+    if (index_type != "hnsw" and build_params.get("storage", "fp32") == "fp32"
+            and hasattr(faiss, "get_num_gpus") and faiss.get_num_gpus() > 0):
+        base = faiss.index_cpu_to_all_gpus(base)
+    index = faiss.IndexIDMap2(base)
+    index.add_with_ids(vecs, ids)
+    return index
+
+
+def drop_ids(index, stale, index_type, build_params):
+    """Remove `stale` ids; index types without remove_ids (HNSW) are rebuilt from kept vectors."""
+    try:
+        index.remove_ids(faiss.IDSelectorBatch(stale))
+        return index
+    except RuntimeError:
+        stale_set = set(stale.tolist())
+        kept = np.array([i for i in faiss.vector_to_array(index.id_map) if i not in stale_set],
+                        dtype="int64")
+        vecs = np.vstack([index.reconstruct(int(i)) for i in kept]) if len(kept) \
+            else np.zeros((0, index.d), dtype="float32")
+        return new_index(vecs, kept, index_type, build_params)
+
+
+def main():
+    args = parse_args()
+
+    # ─── 1) Model setup ───────────────────────────────────────────────────────
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, _, preprocess = open_clip.create_model_and_transforms(
+        MODEL_NAME,
+        pretrained="laion2b_s34b_b79k" if MODEL_NAME == "ViT-B-32" else None,
+        device=device
+    )
+    print(f"▶ embedding on {device}  •  model = {MODEL_NAME}")
+
+    docs   = load_docs()
+    hashes = {int(d["id"]): content_hash(d) for d in docs}
+
+    # ─── 3) Long-lived fetch / preprocess pipeline ────────────────────────────
+    pipeline = ImagePipeline(preprocess, fetch_workers=args.fetch_workers,
+                             preprocess_workers=args.preprocess_workers, prefetch=args.prefetch)
+
+    start    = time.time()
+    targets  = LAYOUTS[args.layout]
+    previous = load_previous(args)
+    try:
+        if previous is None:
+            build_params = ann_index.resolved_params(
+                args.index_type, len(docs),
+                nlist=args.nlist, m=args.hnsw_m, ef_construction=args.ef_construction,
+                pq_m=args.pq_m, pq_bits=args.pq_bits, storage=args.storage,
+            )
+            t_vecs, i_vecs = embed_docs(docs, model, device, pipeline)
+            ids     = np.array([int(d["id"]) for d in docs], dtype="int64")
+            indexes = {t: new_index(target_vectors(t, t_vecs, i_vecs), ids, args.index_type, build_params)
+                       for t in targets}
+            print(f"▶ full build: {len(docs)} products embedded → {', '.join(targets)} index(es)")
+        else:
+            manifest, indexes = previous
+            build_params = ann_index.read_index_meta(index_path(targets[0])).get("params", {})
+            old     = {int(pid): h for pid, h in manifest["products"].items()}
+            todo    = [d for d in docs if old.get(int(d["id"])) != hashes[int(d["id"])]]
+            stale   = np.array([pid for pid, h in old.items() if hashes.get(pid) != h], dtype="int64")
+            removed = sum(1 for pid in old if pid not in hashes)
+            if len(stale):
+                indexes = {t: drop_ids(index, stale, args.index_type, build_params)
+                           for t, index in indexes.items()}
+            if todo:
+                t_vecs, i_vecs = embed_docs(todo, model, device, pipeline)
+                ids = np.array([int(d["id"]) for d in todo], dtype="int64")
+                for t, index in indexes.items():
+                    index.add_with_ids(target_vectors(t, t_vecs, i_vecs), ids)
+            print(f"▶ incremental: {len(todo)} new/changed, {removed} removed, "
+                  f"{len(docs) - len(todo)} unchanged")
+    finally:
+        print(f"▶ stage throughput: {pipeline.report()}")
+        pipeline.close()
+
+    for target, index in indexes.items():
+        index_to_save = (
+            faiss.index_gpu_to_cpu(index)
+            if hasattr(faiss, "index_gpu_to_cpu")
+            else index
+        )
+        ann_index.write_index(index_to_save, index_path(target),
+                              {"type": args.index_type, "params": build_params, "id_map": True,
+                               "modality": target})
+    # indexes of another layout would be picked up by the backend: remove them
+    for target in LAYOUTS["both"]:
+        if target not in targets and os.path.exists(index_path(target)):
+            os.remove(index_path(target))
+            if os.path.exists(ann_index.meta_path(index_path(target))):
+                os.remove(ann_index.meta_path(index_path(target)))
+            print(f"▶ removed {index_path(target)} (not part of the {args.layout} layout)")
+    # metadata row order for the backend; index labels are product ids, not positions
+    np.save("ids.npy", np.array([d["id"] for d in docs], dtype=np.int32))
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"model": MODEL_NAME, "index_type": args.index_type, "layout": args.layout,
+                               "products": {str(pid): h for pid, h in hashes.items()}}))
+    tmp.replace(MANIFEST_PATH)
+
+    # ─── 6) Compiled, memory-mappable serving artifacts ───────────────────────
+    artifacts.compile_artifacts(DATA_PATH, "ids.npy", "compiled", name_terms=VOCAB_WORDS)
+    print("▶ compiled serving artifacts → compiled/")
+
+    print(f"\n✅ Finished in {time.time()-start:.1f}s • {len(docs)} products • {args.layout} layout")
+
+
+if __name__ == "__main__":
+    main()